@@ -8,6 +8,13 @@ from sqlalchemy.ext.asyncio import async_engine_from_config
 from alembic import context
 
 import app.db
+import app.models.account
+import app.models.ledger
+import app.models.notification
+import app.models.payments
+import app.models.rollup
+import app.models.token_revocation
+import app.models.user
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
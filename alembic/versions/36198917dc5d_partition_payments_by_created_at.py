@@ -0,0 +1,100 @@
+"""Partition payments by created_at
+
+Revision ID: 36198917dc5d
+Revises: 0baef06afee7
+Create Date: 2026-10-19 17:44:13.000000
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '36198917dc5d'
+down_revision: Union[str, None] = '0baef06afee7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Сколько месячных партиций создать вперед; дальше их поддерживает app.commands.payment_partitions
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE payments RENAME TO payments_legacy")
+    op.execute("ALTER INDEX ix_payments_id RENAME TO ix_payments_legacy_id")
+    op.execute("ALTER INDEX ix_payments_transaction_id RENAME TO ix_payments_legacy_transaction_id")
+    op.execute("ALTER TABLE payments_legacy RENAME CONSTRAINT payments_pkey TO payments_legacy_pkey")
+    op.execute("ALTER SEQUENCE payments_id_seq OWNED BY NONE")
+
+    op.execute(
+        """
+        CREATE TABLE payments (
+            id INTEGER NOT NULL DEFAULT nextval('payments_id_seq'),
+            transaction_id VARCHAR NOT NULL,
+            amount FLOAT NOT NULL,
+            account_id INTEGER NOT NULL REFERENCES accounts (id),
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("ALTER SEQUENCE payments_id_seq OWNED BY payments.id")
+
+    current = date.today().replace(day=1)
+    for offset in range(MONTHS_AHEAD + 1):
+        start = _add_months(current, offset)
+        end = _add_months(start, 1)
+        op.execute(
+            f"""
+            CREATE TABLE payments_p{start:%Y%m} PARTITION OF payments
+            FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')
+            """
+        )
+    op.execute("CREATE TABLE payments_default PARTITION OF payments DEFAULT")
+
+    op.create_index('ix_payments_id', 'payments', ['id'], unique=False)
+    op.create_index('ix_payments_transaction_id', 'payments', ['transaction_id'], unique=False)
+    op.create_index('ix_payments_account_id_created_at', 'payments', ['account_id', 'created_at'], unique=False)
+
+    op.execute(
+        """
+        INSERT INTO payments (id, transaction_id, amount, account_id, created_at)
+        SELECT id, transaction_id, amount, account_id, now() FROM payments_legacy
+        """
+    )
+    op.execute("DROP TABLE payments_legacy")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE payments RENAME TO payments_partitioned")
+    op.execute("ALTER INDEX ix_payments_id RENAME TO ix_payments_partitioned_id")
+    op.execute("ALTER INDEX ix_payments_transaction_id RENAME TO ix_payments_partitioned_transaction_id")
+    op.execute("ALTER SEQUENCE payments_id_seq OWNED BY NONE")
+
+    op.execute(
+        """
+        CREATE TABLE payments (
+            id INTEGER NOT NULL DEFAULT nextval('payments_id_seq'),
+            transaction_id VARCHAR NOT NULL,
+            amount FLOAT NOT NULL,
+            account_id INTEGER NOT NULL REFERENCES accounts (id),
+            PRIMARY KEY (id)
+        )
+        """
+    )
+    op.execute("ALTER SEQUENCE payments_id_seq OWNED BY payments.id")
+    op.execute(
+        """
+        INSERT INTO payments (id, transaction_id, amount, account_id)
+        SELECT id, transaction_id, amount, account_id FROM payments_partitioned
+        """
+    )
+    op.create_index('ix_payments_id', 'payments', ['id'], unique=False)
+    op.create_index('ix_payments_transaction_id', 'payments', ['transaction_id'], unique=False)
+    op.execute("DROP TABLE payments_partitioned CASCADE")
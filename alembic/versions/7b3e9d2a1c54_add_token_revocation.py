@@ -0,0 +1,44 @@
+"""Add token revocation
+
+Revision ID: 7b3e9d2a1c54
+Revises: ff99bd8ed463
+Create Date: 2026-10-19 22:14:52.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3e9d2a1c54'
+down_revision: Union[str, None] = 'ff99bd8ed463'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_token_epochs',
+                    sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+                    sa.Column('not_before', sa.BigInteger(), nullable=False),
+                    sa.Column('changed_at', sa.DateTime(timezone=True), nullable=False),
+                    sa.PrimaryKeyConstraint('user_id')
+                    )
+    op.create_index('ix_user_token_epochs_changed_at', 'user_token_epochs', ['changed_at'], unique=False)
+    op.create_table('revoked_tokens',
+                    sa.Column('jti', sa.String(length=32), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=False),
+                    sa.PrimaryKeyConstraint('jti')
+                    )
+    op.create_index('ix_revoked_tokens_revoked_at', 'revoked_tokens', ['revoked_at'], unique=False)
+    op.create_index('ix_revoked_tokens_expires_at', 'revoked_tokens', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_revoked_tokens_expires_at', table_name='revoked_tokens')
+    op.drop_index('ix_revoked_tokens_revoked_at', table_name='revoked_tokens')
+    op.drop_table('revoked_tokens')
+    op.drop_index('ix_user_token_epochs_changed_at', table_name='user_token_epochs')
+    op.drop_table('user_token_epochs')
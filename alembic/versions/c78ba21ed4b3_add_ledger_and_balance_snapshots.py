@@ -0,0 +1,69 @@
+"""Add ledger and balance snapshots
+
+Revision ID: c78ba21ed4b3
+Revises: 36198917dc5d
+Create Date: 2026-10-19 18:05:41.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c78ba21ed4b3'
+down_revision: Union[str, None] = '36198917dc5d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ledger_entries',
+                    sa.Column('id', sa.BigInteger(), nullable=False),
+                    sa.Column('account_id', sa.Integer(), nullable=False),
+                    sa.Column('amount', sa.Float(), nullable=False),
+                    sa.Column('transaction_id', sa.String(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                              nullable=False),
+                    sa.Column('xact_id', sa.BigInteger(),
+                              server_default=sa.text('(pg_current_xact_id()::text::bigint)'), nullable=False),
+                    sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_ledger_entries_account_id_id', 'ledger_entries', ['account_id', 'id'], unique=False)
+    op.create_index('ix_ledger_entries_account_id_xact_id', 'ledger_entries', ['account_id', 'xact_id'],
+                    unique=False)
+    op.create_table('balance_snapshots',
+                    sa.Column('id', sa.BigInteger(), nullable=False),
+                    sa.Column('account_id', sa.Integer(), nullable=False),
+                    sa.Column('last_entry_id', sa.BigInteger(), nullable=False),
+                    sa.Column('xmin', sa.BigInteger(), nullable=False),
+                    sa.Column('balance', sa.Float(), nullable=False),
+                    sa.Column('as_of', sa.DateTime(timezone=True), nullable=False),
+                    sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_balance_snapshots_account_id_last_entry_id', 'balance_snapshots',
+                    ['account_id', 'last_entry_id'], unique=False)
+    op.create_index('ix_balance_snapshots_account_id_as_of', 'balance_snapshots', ['account_id', 'as_of'],
+                    unique=False)
+
+    # Начальные снимки: текущий баланс каждого счета становится точкой отсчета журнала. История баланса до
+    # миграции неизвестна, поэтому снимок действует на любой момент в прошлом (as_of = -infinity): иначе запрос
+    # баланса на момент до миграции не нашел бы снимка и не учел бы уже накопленный баланс. Записей журнала в
+    # начальном снимке нет (xmin = 0)
+    op.execute(
+        """
+        INSERT INTO balance_snapshots (account_id, last_entry_id, xmin, balance, as_of)
+        SELECT id, 0, 0, coalesce(balance, 0), '-infinity' FROM accounts
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_balance_snapshots_account_id_as_of', table_name='balance_snapshots')
+    op.drop_index('ix_balance_snapshots_account_id_last_entry_id', table_name='balance_snapshots')
+    op.drop_table('balance_snapshots')
+    op.drop_index('ix_ledger_entries_account_id_xact_id', table_name='ledger_entries')
+    op.drop_index('ix_ledger_entries_account_id_id', table_name='ledger_entries')
+    op.drop_table('ledger_entries')
@@ -0,0 +1,36 @@
+"""Add payment rollups
+
+Revision ID: c82c20e477fa
+Revises: c78ba21ed4b3
+Create Date: 2026-10-19 18:24:10.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c82c20e477fa'
+down_revision: Union[str, None] = 'c78ba21ed4b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('payment_rollups',
+                    sa.Column('account_id', sa.Integer(), nullable=False),
+                    sa.Column('bucket_size', sa.String(length=8), nullable=False),
+                    sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('total_amount', sa.Float(), nullable=False),
+                    sa.Column('payment_count', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ),
+                    sa.PrimaryKeyConstraint('account_id', 'bucket_size', 'bucket_start')
+                    )
+    op.create_index('ix_payment_rollups_bucket_size_bucket_start', 'payment_rollups',
+                    ['bucket_size', 'bucket_start'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_payment_rollups_bucket_size_bucket_start', table_name='payment_rollups')
+    op.drop_table('payment_rollups')
@@ -0,0 +1,41 @@
+"""Add notification outbox
+
+Revision ID: e41d6c0b8f27
+Revises: 7b3e9d2a1c54
+Create Date: 2026-10-19 23:41:07.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41d6c0b8f27'
+down_revision: Union[str, None] = '7b3e9d2a1c54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('notification_url', sa.String(), nullable=True))
+    op.create_table('notification_outbox',
+                    sa.Column('id', sa.BigInteger(), nullable=False),
+                    sa.Column('destination', sa.String(), nullable=False),
+                    sa.Column('payload', sa.JSON(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('attempts', sa.Integer(), nullable=False),
+                    sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('last_error', sa.String(), nullable=True),
+                    sa.Column('failed_at', sa.DateTime(timezone=True), nullable=True),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_notification_outbox_next_attempt_at', 'notification_outbox', ['next_attempt_at'],
+                    unique=False, postgresql_where=sa.text('failed_at IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notification_outbox_next_attempt_at', table_name='notification_outbox',
+                  postgresql_where=sa.text('failed_at IS NULL'))
+    op.drop_table('notification_outbox')
+    op.drop_column('users', 'notification_url')
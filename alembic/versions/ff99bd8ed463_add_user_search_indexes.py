@@ -0,0 +1,33 @@
+"""Add user search indexes
+
+Revision ID: ff99bd8ed463
+Revises: c82c20e477fa
+Create Date: 2026-10-19 21:05:37.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'ff99bd8ed463'
+down_revision: Union[str, None] = 'c82c20e477fa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Побайтовое сравнение (COLLATE "C"): строки с общим префиксом образуют непрерывный диапазон индекса
+    op.create_index('ix_users_lower_email', 'users', [sa.text('(lower(email) COLLATE "C")')], unique=False)
+    op.create_index('ix_users_lower_email_trgm', 'users', [sa.text('lower(email) gin_trgm_ops')], unique=False,
+                    postgresql_using='gin')
+    op.create_index('ix_users_lower_full_name_trgm', 'users', [sa.text('lower(full_name) gin_trgm_ops')],
+                    unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_lower_full_name_trgm', table_name='users')
+    op.drop_index('ix_users_lower_email_trgm', table_name='users')
+    op.drop_index('ix_users_lower_email', table_name='users')
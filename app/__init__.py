@@ -1,11 +1,63 @@
 from sanic import Sanic
+from sanic.log import logger
 from app.controllers.admin_controller import bp as bp_admin
 from app.controllers.auth_controller import bp as bp_auth
 from app.controllers.payment_controller import bp as bp_payment
 from app.controllers.user_controller import bp as bp_user
+from app.config import (DB_STATEMENT_TIMEOUT, DB_CONNECT_TIMEOUT, DB_POOL_TIMEOUT, NOTIFICATIONS_ENABLED,
+                        NOTIFICATION_SECRET)
+from app.db import get_engine, dispose_engine
+from app.middlewares.admission_middleware import admit_request, release_request, release_connection
+from app.middlewares.capture_middleware import start_capture, finish_capture, writer as capture_writer
+from app.middlewares.compression_middleware import compress_response
+from app.tasks.ledger_compactor import run_ledger_compactor
+from app.tasks.notification_dispatcher import run_notification_dispatcher, pools as notification_pools
+from app.tasks.token_revocation_sync import run_token_revocation_sync
+from app.tasks.webhook_replay import run_webhook_replay
+from app.utils.pg_listener import listener
+from app.utils.slow_query import slow_query_log
 
 app = Sanic("my_async_app")
 app.blueprint(bp_admin)
 app.blueprint(bp_auth)
 app.blueprint(bp_user)
 app.blueprint(bp_payment)
+
+app.register_middleware(start_capture, 'request')
+app.register_middleware(admit_request, 'request')
+app.register_middleware(release_request, 'response')
+app.register_middleware(compress_response, 'response')
+app.register_middleware(finish_capture, 'response')
+app.add_signal(release_connection, 'http.lifecycle.complete')
+
+
+@app.before_server_start
+async def init_resources(app, _loop):
+    get_engine(statement_timeout=DB_STATEMENT_TIMEOUT, connect_timeout=DB_CONNECT_TIMEOUT,
+               pool_timeout=DB_POOL_TIMEOUT)
+
+
+@app.after_server_stop
+async def release_resources(app, _loop):
+    await slow_query_log.close()
+    await dispose_engine()
+
+
+@app.after_server_start
+async def start_background_tasks(app, _loop):
+    app.add_task(run_ledger_compactor(), name='ledger_compactor')
+    app.add_task(run_webhook_replay(), name='webhook_replay')
+    app.add_task(run_token_revocation_sync(), name='token_revocation_sync')
+    if NOTIFICATIONS_ENABLED and not NOTIFICATION_SECRET:
+        # Подписывать уведомления общим с токенами секретом нельзя: они копятся в очереди до настройки секрета
+        logger.error('NOTIFICATION_SECRET is not set, payment notifications are not dispatched')
+    elif NOTIFICATIONS_ENABLED:
+        app.add_task(run_notification_dispatcher(), name='notification_dispatcher')
+    await listener.start()
+
+
+@app.before_server_stop
+async def stop_background_tasks(app, _loop):
+    await listener.stop()
+    capture_writer.close()
+    notification_pools.close()
@@ -0,0 +1,31 @@
+"""
+Перенос старых платежей из таблицы `payments` в архив (сжатые файлы Arrow IPC в каталоге `ARCHIVE_DIR`).
+
+    python -m app.commands.archive_payments --older-than-days 365 --chunk-size 100000
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from app.db import get_db
+from app.services import archive_service
+
+
+async def run(older_than_days: int, chunk_size: int) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    async with get_db() as session:
+        return await archive_service.archive_payments(session, cutoff, chunk_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old payments to compressed columnar files')
+    parser.add_argument('--older-than-days', type=int, required=True)
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    args = parser.parse_args()
+
+    archived = asyncio.run(run(args.older_than_days, args.chunk_size))
+    print(f'Archived payments: {archived}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Пересчет часовой и суточной статистики платежей (`payment_rollups`) по истории.
+
+    python -m app.commands.backfill_rollups --from 2024-01-01 --to 2024-07-24 --chunk-days 7
+
+Конец периода по умолчанию — начало текущих суток (UTC); статистику текущих суток поддерживает вебхук. Сутки, платежи
+которых перенесены в архив, не пересчитываются.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from app.db import get_db
+from app.models.payments import Payment
+from app.services import rollup_service
+
+
+def _parse_date(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def run(since: datetime, until: datetime, chunk_days: int) -> int:
+    async with get_db() as session:
+        if since is None:
+            since = (await session.execute(select(func.min(Payment.created_at)))).scalar()
+            if since is None:
+                return 0
+        return await rollup_service.backfill(session, since, until, timedelta(days=chunk_days))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill payment rollups from payment history')
+    parser.add_argument('--from', dest='since', type=_parse_date, default=None,
+                        help='Defaults to the oldest payment')
+    parser.add_argument('--to', dest='until', type=_parse_date, default=datetime.now(timezone.utc))
+    parser.add_argument('--chunk-days', type=int, default=1)
+    args = parser.parse_args()
+
+    written = asyncio.run(run(args.since, args.until, args.chunk_days))
+    print(f'Rollup buckets written: {written}')
+
+
+if __name__ == '__main__':
+    main()
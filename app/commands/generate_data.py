@@ -0,0 +1,141 @@
+"""
+Генерация синтетических данных для проверки планов запросов и пагинации на реалистичных объемах.
+
+    python -m app.commands.generate_data --users 1000000 --accounts-per-user 2 --payments-per-account 50 \\
+        --zipf 1.1 --months 12 --seed 42 --jobs 8
+
+Создает пользователей (с одним общим хешем пароля `--password`), по `--accounts-per-user` счетов на
+пользователя и в среднем `--payments-per-account` платежей на счет. Платежи распределяются по счетам по закону
+Ципфа (`--zipf`, 0 — равномерно): на немногие «горячие» счета приходится большая часть платежей. Даты платежей
+равномерно распределены по последним `--months` месяцам, недостающие месячные партиции создаются заранее.
+Данные дописываются после существующих идентификаторов; при одинаковых параметрах и `--seed` содержимое
+одинаково. Строки загружаются через `COPY` пачками по `--chunk-size` на `--jobs` параллельных соединениях
+(не больше размера пула соединений). Статистику `payment_rollups` после загрузки можно пересчитать командой
+`app.commands.backfill_rollups`.
+"""
+import argparse
+import asyncio
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from app.config import LEDGER_MODE
+from app.db import get_db, get_raw_connection
+from app.models.user import get_pwd_context
+from app.services import partition_service, synthetic_data_service
+
+
+async def run_parallel(jobs: int, tasks: list):
+    queue = asyncio.Queue()
+    for task in tasks:
+        queue.put_nowait(task)
+
+    async def worker():
+        async with get_raw_connection() as conn:
+            while not queue.empty():
+                await queue.get_nowait()(conn)
+
+    await asyncio.gather(*[worker() for _ in range(min(jobs, len(tasks)))])
+
+
+def _chunks(first_id: int, count: int, size: int) -> list:
+    return [(start, min(size, first_id + count - start)) for start in range(first_id, first_id + count, size)]
+
+
+def _report(name: str, count: int, started: float):
+    elapsed = time.perf_counter() - started
+    print(f'{name}: {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:,.0f} rows/s)')
+
+
+async def run(args) -> dict:
+    hashed_password = get_pwd_context().hash(args.password)
+    accounts_count = args.users * args.accounts_per_user
+    payments_count = accounts_count * args.payments_per_account
+    until = datetime.now(timezone.utc)
+    first_month = partition_service.add_months(date(until.year, until.month, 1), -(args.months - 1))
+    since = datetime(first_month.year, first_month.month, 1, tzinfo=timezone.utc)
+
+    async with get_db() as session:
+        await partition_service.create_partitions(session, first_month, until.date())
+    async with get_raw_connection() as conn:
+        first_user_id = await synthetic_data_service.get_next_id(conn, 'users')
+        first_account_id = await synthetic_data_service.get_next_id(conn, 'accounts')
+        first_payment_id = await synthetic_data_service.get_next_id(conn, 'payments')
+
+    started = time.perf_counter()
+    await run_parallel(args.jobs, [
+        lambda conn, start=start, count=count: synthetic_data_service.copy_users(conn, start, count, hashed_password)
+        for start, count in _chunks(first_user_id, args.users, args.chunk_size)
+    ])
+    _report('users', args.users, started)
+
+    started = time.perf_counter()
+    await run_parallel(args.jobs, [
+        lambda conn, start=start, count=count: synthetic_data_service.copy_accounts(
+            conn, first_account_id + (start - first_user_id) * args.accounts_per_user, start, count,
+            args.accounts_per_user)
+        for start, count in _chunks(first_user_id, args.users, max(1, args.chunk_size // args.accounts_per_user))
+    ])
+    _report('accounts', accounts_count, started)
+
+    # Популярность не должна совпадать с порядком идентификаторов: ранги перемешиваются тем же зерном
+    account_cdf = synthetic_data_service.zipf_cdf(accounts_count, args.zipf)
+    accounts_by_rank = first_account_id + np.random.default_rng(args.seed).permutation(accounts_count)
+    since_us = synthetic_data_service.to_pg_timestamp(since)
+    until_us = synthetic_data_service.to_pg_timestamp(until)
+
+    async def load_payments(conn, chunk: int, start: int, count: int):
+        payments = await asyncio.to_thread(synthetic_data_service.generate_payments, args.seed, chunk, start, count,
+                                           account_cdf, accounts_by_rank, since_us, until_us)
+        await synthetic_data_service.copy_payments(conn, payments, args.ledger)
+
+    started = time.perf_counter()
+    await run_parallel(args.jobs, [
+        lambda conn, chunk=chunk, start=start, count=count: load_payments(conn, chunk, start, count)
+        for chunk, (start, count) in enumerate(_chunks(first_payment_id, payments_count, args.chunk_size))
+    ])
+    _report('payments', payments_count, started)
+
+    started = time.perf_counter()
+    async with get_raw_connection() as conn:
+        updated = await synthetic_data_service.update_balances(
+            conn, first_account_id, first_account_id + accounts_count - 1)
+        await synthetic_data_service.advance_sequence(conn, 'users', first_user_id + args.users - 1)
+        await synthetic_data_service.advance_sequence(conn, 'accounts', first_account_id + accounts_count - 1)
+        await synthetic_data_service.advance_sequence(conn, 'payments', first_payment_id + payments_count - 1)
+    _report('balances', updated, started)
+
+    return {
+        'users': (first_user_id, first_user_id + args.users - 1),
+        'accounts': (first_account_id, first_account_id + accounts_count - 1),
+        'payments': (first_payment_id, first_payment_id + payments_count - 1),
+        'since': since,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a large synthetic dataset through COPY')
+    parser.add_argument('--users', type=int, required=True)
+    parser.add_argument('--accounts-per-user', type=int, default=2)
+    parser.add_argument('--payments-per-account', type=int, default=10, help='Average, skewed by --zipf')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Skew of payments across accounts (0 = uniform)')
+    parser.add_argument('--months', type=int, default=12, help='Spread payments over this many recent months')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--password', default='password', help='Password shared by all generated users')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help='Rows per COPY')
+    parser.add_argument('--jobs', type=int, default=8, help='Parallel connections')
+    parser.add_argument('--ledger', action=argparse.BooleanOptionalAction, default=LEDGER_MODE,
+                        help='Also write ledger entries (defaults to LEDGER_MODE)')
+    args = parser.parse_args()
+    if args.users < 1 or args.accounts_per_user < 1 or args.payments_per_account < 1 or args.months < 1:
+        parser.error('--users, --accounts-per-user, --payments-per-account and --months must be positive')
+
+    ranges = asyncio.run(run(args))
+    for name in ('users', 'accounts', 'payments'):
+        print(f'{name} ids: {ranges[name][0]}..{ranges[name][1]}')
+    print(f"Rebuild rollups with: python -m app.commands.backfill_rollups --from {ranges['since']:%Y-%m-%d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Обслуживание партиций таблицы `payments`.
+
+Создает месячные партиции заранее и отсоединяет устаревшие. Предназначено для периодического запуска (cron):
+
+    python -m app.commands.payment_partitions --ahead 3 --retain 24
+"""
+import argparse
+import asyncio
+
+from app.db import get_db
+from app.services import partition_service
+
+
+async def run(months_ahead: int, retain_months: int = None):
+    async with get_db() as session:
+        created = await partition_service.create_future_partitions(session, months_ahead)
+        detached = []
+        if retain_months:
+            detached = await partition_service.detach_old_partitions(session, retain_months)
+    return created, detached
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Payments partition maintenance')
+    parser.add_argument('--ahead', type=int, default=3, help='How many future monthly partitions to keep')
+    parser.add_argument('--retain', type=int, default=None,
+                        help='Detach partitions older than this many months (disabled by default)')
+    args = parser.parse_args()
+
+    created, detached = asyncio.run(run(args.ahead, args.retain))
+    print(f'Created partitions: {", ".join(created) or "-"}')
+    print(f'Detached partitions: {", ".join(detached) or "-"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Сверка выгрузки платежной системы с таблицей `payments`.
+
+    python -m app.commands.reconcile settlement.csv --out-dir reports/2024-07-24 --from 2024-07-24 --to 2024-07-25
+
+Подписанные тела вебхуков для пропущенных транзакций записываются в `replay.ndjson` и могут быть повторно
+отправлены на `/webhook/payment`.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timezone
+
+from app.db import get_db
+from app.services import reconciliation_service
+
+
+def _parse_date(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def run(args) -> dict:
+    async with get_db() as session:
+        return await reconciliation_service.reconcile(session, args.provider_file, args.out_dir, args.buckets,
+                                                      args.since, args.until)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile provider settlement export against payments')
+    parser.add_argument('provider_file', help='CSV with transaction_id,amount,account_id,user_id columns')
+    parser.add_argument('--out-dir', required=True)
+    parser.add_argument('--buckets', type=int, default=64, help='More buckets means less memory per bucket')
+    parser.add_argument('--from', dest='since', type=_parse_date, default=None)
+    parser.add_argument('--to', dest='until', type=_parse_date, default=None)
+    summary = asyncio.run(run(parser.parse_args()))
+    print(f"Provider rows: {summary['provider_rows']}, our rows: {summary['our_rows']}")
+    print(f"Missing: {summary['missing']}, extra: {summary['extra']}, mismatched: {summary['mismatched']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,33 @@
+import asyncio
+import json
+import threading
+
 from sanic import response, Blueprint
 from sanic.request import Request
 
-from app.db import get_db
-from app.services import admin_service
+from app.db import get_db, get_raw_connection
+from app.schemas import RegisterPayload, UserUpdatePayload, BulkUserUpdatePayload, BulkUserDeletePayload
+from app.services import admin_service, import_service, rollup_service, notification_service, user_service
+from app.tasks import notification_dispatcher
+from app.utils import single_flight, degraded_mode, profiling
+from app.utils.request_args import parse_date_arg, decode_body
+from app.utils.lock_striping import account_locks
+from app.utils.slow_query import slow_query_log
+from app.utils.token_revocation import revocations
 from app.utils.token_check import check_admin_permissions
-from app.views.responses import all_users_response
+from app.utils.webhook_spool import spool
+from app.views.responses import all_users_response, get_payment_stats_response, get_metrics_response, \
+    get_slow_queries_response, get_profiling_response, search_users_response, bulk_users_response
 
 bp = Blueprint('admin', url_prefix='/admin')
 
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+INT32_MIN = -2 ** 31
+INT32_MAX = 2 ** 31 - 1
+
 
-@bp.post('/users/create')
+@bp.post('/users/create', error_format='json')
 async def create_user(request: Request):
     """
     Создает нового пользователя.
@@ -24,17 +42,55 @@ async def create_user(request: Request):
     Возвращает:
     - JSON-ответ с сообщением об успешном создании пользователя или ошибке.
     """
+    try:
+        data = decode_body(request, RegisterPayload)
+    except ValueError as error:
+        return response.json({'message': str(error)}, status=400)
+
     error_response = await check_admin_permissions(request)
     if error_response:
         return error_response
 
-    data = request.json
     async with get_db() as session:
-        await admin_service.create_user(session, data['email'], data['full_name'], data['password'])
+        await admin_service.create_user(session, data.email, data.full_name, data.password)
         return response.json({'message': 'User created successfully'})
 
 
-@bp.delete('/users/delete/<user_id>')
+@bp.post('/users/import', stream=True, error_format='json')
+async def import_users(request: Request):
+    """
+    Массовый импорт пользователей из потоково загружаемого файла.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Принимает CSV с заголовком (`Content-Type: text/csv`) или NDJSON с полями `email`, `full_name` и `password`
+    (или готовым bcrypt-хешем в `hashed_password`). Тело запроса читается и обрабатывается по мере поступления,
+    ответ также передается потоково в формате NDJSON: по строке на каждую отклоненную запись и итоговая строка
+    со статистикой.
+
+    Аргументы:
+    - request: Sanic Request объект с потоковым телом запроса.
+
+    Возвращает:
+    - Потоковый NDJSON-ответ с ошибками по строкам и итогами импорта.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    content_type = request.headers.get('Content-Type', 'application/x-ndjson')
+    stream = await request.respond(content_type='application/x-ndjson')
+
+    async def report(error: dict):
+        await stream.send(json.dumps(error) + '\n')
+
+    rows = import_service.iter_rows(import_service.iter_lines(request.stream), content_type)
+    async with get_raw_connection() as conn:
+        stats = await import_service.import_users(conn, rows, report)
+    await stream.send(json.dumps(stats) + '\n')
+    await stream.eof()
+
+
+@bp.delete('/users/delete/<user_id>', error_format='json')
 async def delete_user(request: Request, user_id: int):
     """
     Удаляет пользователя по указанному идентификатору.
@@ -61,14 +117,16 @@ async def delete_user(request: Request, user_id: int):
         return response.json({'message': 'User not found'}, status=404)
 
 
-@bp.put('/users/update/<user_id>')
+@bp.put('/users/update/<user_id>', error_format='json')
 async def update_user(request: Request, user_id: int):
     """
     Обновляет информацию о пользователе по указанному идентификатору.
 
     Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
     Если права подтверждены, извлекает данные из запроса и вызывает сервисный метод для обновления пользователя.
-    Возвращает успешный ответ или сообщение об ошибке, если пользователь не найден.
+    Поле `notification_url` задает адрес для уведомлений о платежах (http или https; пустая строка отключает
+    уведомления); в ответ на него возвращается `notification_secret` — ключ, которым подписываются уведомления
+    этому получателю. Возвращает успешный ответ или сообщение об ошибке, если пользователь не найден.
 
     Аргументы:
     - request: Sanic Request объект, содержащий обновленные данные пользователя.
@@ -77,20 +135,141 @@ async def update_user(request: Request, user_id: int):
     Возвращает:
     - JSON-ответ с сообщением об успешном обновлении пользователя или ошибке, если пользователь не найден.
     """
+    try:
+        data = decode_body(request, UserUpdatePayload)
+    except ValueError as error:
+        return response.json({'message': str(error)}, status=400)
+    if data.notification_url and not notification_service.is_valid_url(data.notification_url):
+        return response.json({'message': 'Invalid notification URL'}, status=400)
+
     error_response = await check_admin_permissions(request)
     if error_response:
         return error_response
 
-    data = request.json
     async with get_db() as session:
-        success = await admin_service.update_user(session, user_id, data.get('email'), data.get('full_name'),
-                                                  data.get('password'))
+        success = await admin_service.update_user(session, user_id, data.email, data.full_name, data.password,
+                                                  data.notification_url)
+        if success and data.notification_url and notification_service.NOTIFICATION_SECRET:
+            return response.json({'message': 'User updated successfully',
+                                  'notification_secret': notification_service.signing_key(data.notification_url)})
         if success:
             return response.json({'message': 'User updated successfully'})
         return response.json({'message': 'User not found'}, status=404)
 
 
-@bp.get('/users')
+@bp.post('/users/revoke-tokens/<user_id:int>', error_format='json')
+async def revoke_user_tokens(request: Request, user_id: int):
+    """
+    Отзывает все выпущенные пользователю токены.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Токены перестают приниматься всеми воркерами сразу после commit (через уведомление), а при потере уведомления —
+    не позже следующей синхронизации (`TOKEN_REVOCATION_SYNC_INTERVAL`).
+
+    Аргументы:
+    - request: Sanic Request объект.
+    - user_id: Идентификатор пользователя.
+
+    Возвращает:
+    - JSON-ответ с сообщением об успешном отзыве или ошибке, если пользователь не найден.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    async with get_db() as session:
+        if await admin_service.revoke_user_tokens(session, user_id):
+            return response.json({'message': 'Tokens revoked successfully'})
+        return response.json({'message': 'User not found'}, status=404)
+
+
+def _bulk_target_error(data):
+    # Пользователи выбираются ровно одним способом: списком идентификаторов или фильтром по домену email
+    if (data.ids is None) == (data.email_domain is None):
+        return 'Exactly one of ids or email_domain is required'
+    if data.ids is not None and not data.ids:
+        return 'ids must not be empty'
+    # Идентификаторы пользователей — integer базы данных: значение вне диапазона сломало бы запрос всей части
+    if data.ids is not None and any(not INT32_MIN <= user_id <= INT32_MAX for user_id in data.ids):
+        return 'ids must be 32-bit integers'
+    if data.email_domain is not None and not data.email_domain.strip():
+        return 'email_domain must not be empty'
+    return None
+
+
+@bp.post('/users/bulk/update', error_format='json')
+async def bulk_update_users(request: Request):
+    """
+    Массово обновляет пользователей.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Пользователи выбираются списком `ids` или фильтром `email_domain`; поля `full_name`, `password` и
+    `notification_url` задаются всем выбранным пользователям сразу. Обновление выполняется частями по
+    `ADMIN_BULK_CHUNK_SIZE` пользователей, каждая часть фиксируется отдельно.
+
+    Аргументы:
+    - request: Sanic Request объект, содержащий выбор пользователей и новые значения полей.
+
+    Возвращает:
+    - JSON-ответ с результатом по каждому пользователю и итогами по статусам.
+    """
+    try:
+        data = decode_body(request, BulkUserUpdatePayload)
+    except ValueError as error:
+        return response.json({'message': str(error)}, status=400)
+    error = _bulk_target_error(data)
+    if error is None and not (data.full_name or data.password or data.notification_url is not None):
+        error = 'Nothing to update'
+    if error is None and data.notification_url and not notification_service.is_valid_url(data.notification_url):
+        error = 'Invalid notification URL'
+    if error:
+        return response.json({'message': error}, status=400)
+
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    async with get_db() as session:
+        results = await admin_service.bulk_update_users(session, data.ids, data.email_domain, data.full_name,
+                                                         data.password, data.notification_url)
+    return bulk_users_response(results)
+
+
+@bp.post('/users/bulk/delete', error_format='json')
+async def bulk_delete_users(request: Request):
+    """
+    Массово удаляет пользователей.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Пользователи выбираются списком `ids` или фильтром `email_domain`. Пользователи со счетами пропускаются, если
+    не задан `cascade`: тогда вместе с ними удаляются их счета и все связанные с ними данные (кроме архива
+    платежей). Удаление выполняется частями по `ADMIN_BULK_CHUNK_SIZE` пользователей, каждая часть фиксируется
+    отдельно; пользователи части, которую не удалось обработать, получают статус `error`.
+
+    Аргументы:
+    - request: Sanic Request объект, содержащий выбор пользователей.
+
+    Возвращает:
+    - JSON-ответ с результатом по каждому пользователю и итогами по статусам.
+    """
+    try:
+        data = decode_body(request, BulkUserDeletePayload)
+    except ValueError as error:
+        return response.json({'message': str(error)}, status=400)
+    error = _bulk_target_error(data)
+    if error:
+        return response.json({'message': error}, status=400)
+
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    async with get_db() as session:
+        results = await admin_service.bulk_delete_users(session, data.ids, data.email_domain, data.cascade)
+    return bulk_users_response(results)
+
+
+@bp.get('/users', error_format='json')
 async def get_users(request: Request):
     """
     Возвращает список всех пользователей.
@@ -112,3 +291,281 @@ async def get_users(request: Request):
     async with get_db() as session:
         users = await admin_service.get_users(session)
         return all_users_response(users)
+
+
+@bp.get('/users/search', error_format='json')
+async def search_users(request: Request):
+    """
+    Поиск пользователей по email и полному имени.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Параметр `q` — строка поиска (начало email или подстрока email или полного имени, без учета регистра),
+    `limit` — размер страницы (по умолчанию `SEARCH_DEFAULT_LIMIT`, не больше `SEARCH_MAX_LIMIT`), `cursor` —
+    курсор следующей страницы из предыдущего ответа. Сначала возвращаются совпадения по началу email.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - JSON-ответ со страницей пользователей и курсором следующей страницы или сообщение об ошибке.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    query = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args['limit'][0]) if 'limit' in request.args else SEARCH_DEFAULT_LIMIT
+        cursor = request.args.get('cursor')
+        if cursor:
+            admin_service.decode_search_cursor(cursor)
+    except ValueError:
+        return response.json({'message': 'Invalid query parameters'}, status=400)
+    if not query or not 1 <= limit <= SEARCH_MAX_LIMIT:
+        return response.json({'message': 'Invalid query parameters'}, status=400)
+
+    async with get_db() as session:
+        users, next_cursor = await admin_service.search_users(session, query, limit, cursor)
+        return search_users_response(users, next_cursor)
+
+
+@bp.get('/payments/stats', error_format='json')
+async def get_payment_stats(request: Request):
+    """
+    Возвращает статистику платежей по всем счетам или по счетам выбранного пользователя.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Принимает необязательные параметры `user_id`, `account_id` и период `from`/`to` (ISO 8601). Статистика
+    берется из предагрегированных часовых и суточных корзин.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - JSON-ответ со статистикой платежей или сообщение об ошибке.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    try:
+        since = parse_date_arg(request, 'from')
+        until = parse_date_arg(request, 'to')
+        user_id = int(request.args['user_id'][0]) if 'user_id' in request.args else None
+        account_id = int(request.args['account_id'][0]) if 'account_id' in request.args else None
+    except ValueError:
+        return response.json({'message': 'Invalid query parameters'}, status=400)
+
+    async with get_db() as session:
+        account_ids = None
+        if user_id is not None:
+            account_ids = await user_service.get_account_ids_by_user_id(session, user_id)
+        if account_id is not None:
+            account_ids = [account_id] if account_ids is None or account_id in account_ids else []
+        stats = await rollup_service.get_stats(session, account_ids, since, until)
+        return get_payment_stats_response(stats)
+
+
+@bp.get('/metrics', error_format='json')
+async def get_metrics(request: Request):
+    """
+    Получение метрик текущего воркера.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Возвращает счетчики single-flight по группам: число выполненных запросов (`executions`), подавленных
+    дубликатов (`suppressed`), ошибок, отмен и выполняющихся сейчас вызовов; состояние выключателя базы данных,
+    число ответов, отданных из кеша устаревших ответов, число вебхуков в локальной очереди, время ожидания
+    блокировок счетов вебхуками, размер состояния отзыва токенов и время его синхронизации, счетчики отправки
+    уведомлений о платежах и соединений с их получателями. Счетчики относятся только к воркеру, обработавшему
+    запрос.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - JSON-ответ с метриками или сообщение об ошибке.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    return get_metrics_response({
+        'single_flight': single_flight.get_metrics(),
+        'circuit_breaker': degraded_mode.breaker.get_metrics(),
+        'stale_responses': degraded_mode.stale_responses.get_metrics(),
+        'webhook_spool': {'pending': len(spool.pending())},
+        'slow_queries': slow_query_log.get_metrics(),
+        'account_locks': account_locks.get_metrics(),
+        'token_revocation': revocations.get_metrics(),
+        'notifications': notification_dispatcher.get_metrics(),
+    })
+
+
+@bp.get('/slow-queries', error_format='json')
+async def get_slow_queries(request: Request):
+    """
+    Получение журнала медленных запросов текущего воркера.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Возвращает последние запросы дольше `SLOW_QUERY_THRESHOLD_MS` (начиная с последнего): время, длительность,
+    маршрут, нормализованный SQL и, для выборки из них, план `EXPLAIN (ANALYZE, BUFFERS)`. Необязательный параметр
+    `limit` ограничивает количество записей.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - JSON-ответ с записями журнала или сообщение об ошибке.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    try:
+        limit = int(request.args['limit'][0]) if 'limit' in request.args else None
+    except ValueError:
+        return response.json({'message': 'Invalid query parameters'}, status=400)
+
+    return get_slow_queries_response(slow_query_log.get_entries(limit))
+
+
+@bp.post('/profiling/memory/start', error_format='json')
+async def start_memory_profiling(request: Request):
+    """
+    Включение трассировки выделений памяти (`tracemalloc`) в текущем воркере.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Необязательный параметр `frames` задает глубину сохраняемого стека (по умолчанию 1). Пока трассировка
+    включена, выделения памяти замедляются; выключается она `POST /admin/profiling/memory/stop`.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - JSON-ответ с состоянием трассировки или сообщение об ошибке.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    try:
+        frames = int(request.args.get('frames', 1))
+    except ValueError:
+        return response.json({'message': 'Invalid query parameters'}, status=400)
+
+    started = profiling.start_tracing(frames)
+    return get_profiling_response({'tracing': True, 'started': started, **profiling.get_memory_usage()})
+
+
+@bp.post('/profiling/memory/stop', error_format='json')
+async def stop_memory_profiling(request: Request):
+    """
+    Выключение трассировки выделений памяти в текущем воркере.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - JSON-ответ с состоянием трассировки или сообщение об ошибке.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    stopped = profiling.stop_tracing()
+    return get_profiling_response({'tracing': False, 'stopped': stopped, **profiling.get_memory_usage()})
+
+
+@bp.get('/profiling/memory', error_format='json')
+async def get_memory_profile(request: Request):
+    """
+    Получение крупнейших мест выделения памяти в текущем воркере.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Необязательные параметры: `limit` (количество мест, по умолчанию 20), `group_by` (`lineno`, `filename` или
+    `traceback`) и `diff=true`, при котором отчет показывает прирост с предыдущего вызова. Если трассировка не
+    включена, возвращает ошибку 409.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - JSON-ответ с объемом памяти процесса и местами выделения или сообщение об ошибке.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    group_by = request.args.get('group_by', 'lineno')
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return response.json({'message': 'Invalid query parameters'}, status=400)
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return response.json({'message': 'Invalid query parameters'}, status=400)
+
+    diff = request.args.get('diff', 'false').lower() == 'true'
+    allocations = profiling.get_allocations(limit, diff, group_by)
+    if allocations is None:
+        return response.json({'message': 'Memory tracing is not started'}, status=409)
+    return get_profiling_response({**profiling.get_memory_usage(), **allocations})
+
+
+@bp.get('/profiling/orm', error_format='json')
+async def get_orm_profile(request: Request):
+    """
+    Подсчет живых объектов ORM (`User`, `Account`, `Payment` и др.) и размеров карт идентичности живых сессий
+    в текущем воркере.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - JSON-ответ с количеством объектов по классам или сообщение об ошибке.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    return get_profiling_response({**profiling.get_memory_usage(), **profiling.count_orm_instances()})
+
+
+@bp.post('/profiling/cpu', error_format='json')
+async def get_cpu_profile(request: Request):
+    """
+    Снятие выборочного профиля процессорного времени цикла событий текущего воркера.
+
+    Проверяет, обладает ли запрос администраторскими правами. Если нет, возвращает ошибку.
+    Необязательные параметры: `duration` (секунды, по умолчанию 10, не больше 60), `interval` (секунды между
+    выборками, по умолчанию 0.005) и `limit` (количество функций и стеков в отчете). Пока профиль снимается,
+    воркер продолжает обслуживать запросы, которые и попадают в профиль. Если профиль уже снимается, возвращает
+    ошибку 409.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - JSON-ответ с профилем или сообщение об ошибке.
+    """
+    error_response = await check_admin_permissions(request)
+    if error_response:
+        return error_response
+
+    try:
+        duration = float(request.args.get('duration', 10))
+        interval = float(request.args.get('interval', 0.005))
+        limit = int(request.args.get('limit', 30))
+    except ValueError:
+        return response.json({'message': 'Invalid query parameters'}, status=400)
+
+    if profiling.cpu_sampler.running:
+        return response.json({'message': 'CPU profile is already running'}, status=409)
+    profile = await asyncio.to_thread(profiling.cpu_sampler.profile, threading.get_ident(),
+                                      profiling.event_loop_depth(), duration, interval, limit)
+    if profile is None:
+        return response.json({'message': 'CPU profile is already running'}, status=409)
+    return get_profiling_response(profile)
@@ -1,20 +1,23 @@
 from sanic import response, Request, Blueprint
-from app.services import auth_service
+from app.services import auth_service, revocation_service
 from app.db import get_db
+from app.schemas import RegisterPayload, LoginPayload
 from app.utils.jwt import create_token
+from app.utils.request_args import decode_body
+from app.utils.token_check import extract_and_decode_token
 from app.views.responses import user_auth_response
 
 bp = Blueprint('auth')
 
 
-@bp.post('/register')
+@bp.post('/register', error_format='json')
 async def register(request: Request):
     """
     Регистрация нового пользователя.
 
     Принимает данные пользователя (email, full_name, password) из тела запроса и пытается зарегистрировать пользователя,
     вызывая метод `register_user` сервиса аутентификации. Если регистрация успешна, возвращает сообщение об успешной
-    регистрации. В случае ошибки возвращает сообщение об ошибке и статус 400.
+    регистрации. В случае ошибки (в том числе при некорректном теле запроса) возвращает сообщение об ошибке и статус 400.
 
     Аргументы:
     - request: Sanic Request объект, содержащий данные для регистрации пользователя.
@@ -22,15 +25,19 @@ async def register(request: Request):
     Возвращает:
     - JSON-ответ с сообщением об успешной регистрации или ошибке.
     """
-    data = request.json
+    try:
+        data = decode_body(request, RegisterPayload)
+    except ValueError as error:
+        return response.json({'message': str(error)}, status=400)
+
     async with get_db() as session:
-        user, error = await auth_service.register_user(session, data['email'], data['full_name'], data['password'])
+        user, error = await auth_service.register_user(session, data.email, data.full_name, data.password)
         if error:
             return response.json({'message': error}, status=400)
         return response.json({'message': 'User registered successfully'}, status=201)
 
 
-@bp.post('/login')
+@bp.post('/login', error_format='json')
 async def login(request: Request):
     """
     Аутентификация пользователя и получение JWT-токена.
@@ -38,7 +45,7 @@ async def login(request: Request):
     Принимает данные для аутентификации (email, password) из тела запроса и пытается войти в систему,
     вызывая метод `login_user` сервиса аутентификации. Если пользователь успешно аутентифицирован, создается
     JWT-токен, и возвращается ответ с информацией о пользователе и токене. В случае ошибки возвращает
-    сообщение о неверных учетных данных и статус 400.
+    сообщение о неверных учетных данных и статус 400 (статус 400 возвращается и при некорректном теле запроса).
 
     Аргументы:
     - request: Sanic Request объект, содержащий данные для аутентификации пользователя.
@@ -47,11 +54,40 @@ async def login(request: Request):
     - JSON-ответ с информацией о пользователе и JWT-токене, если аутентификация успешна.
     - JSON-ответ с сообщением об ошибке и статусом 400, если аутентификация не удалась.
     """
-    data = request.json
+    try:
+        data = decode_body(request, LoginPayload)
+    except ValueError as error:
+        return response.json({'message': str(error)}, status=400)
+
     async with get_db() as session:
-        user, authenticated = await auth_service.login_user(session, data['email'], data['password'])
+        user, authenticated = await auth_service.login_user(session, data.email, data.password)
         if authenticated:
             is_admin = getattr(user, 'is_admin', False)
             token = create_token(user.id, is_admin)
             return user_auth_response(user.id, token)
         return response.json({'message': 'Invalid credentials'}, status=400)
+
+
+@bp.post('/logout', error_format='json')
+async def logout(request: Request):
+    """
+    Выход пользователя: отзыв токена, с которым выполнен запрос.
+
+    Токен перестает приниматься всеми воркерами сразу после commit. Токены, выпущенные до появления отзыва (без
+    claim `jti`), отдельно отозвать нельзя; для них возвращается статус 400.
+
+    Аргументы:
+    - request: Sanic Request объект с заголовком Authorization.
+
+    Возвращает:
+    - JSON-ответ с сообщением об успешном выходе или ошибкой.
+    """
+    payload = await extract_and_decode_token(request)
+    if not isinstance(payload, dict):
+        return payload
+
+    async with get_db() as session:
+        if not await revocation_service.revoke_token(session, payload):
+            return response.json({'message': 'Token cannot be revoked'}, status=400)
+        await session.commit()
+    return response.json({'message': 'Logged out successfully'})
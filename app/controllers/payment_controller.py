@@ -1,25 +1,47 @@
+from datetime import datetime, timezone
+
 from sanic import response, Blueprint
+from sanic.log import logger
 from sanic.request import Request
 from sqlalchemy.exc import IntegrityError
 
-from app.db import get_db
-from app.config import SECRET_KEY
-from app.services import payment_service
+from app.db import get_db, get_raw_connection
+from app.schemas import WebhookPayload, as_dict
+from app.config import SECRET_KEY, LEDGER_MODE, WEBHOOK_RAW_PATH
+from app.services import payment_service, ledger_service, rollup_service, stream_service, \
+    raw_payment_service, notification_service
+from app.utils import cache_invalidation
+from app.utils.degraded_mode import database_budget, DatabaseUnavailable
+from app.utils.lock_striping import account_locks
+from app.utils.request_args import decode_body
 from app.utils.signature import generate_signature
+from app.utils.webhook_spool import spool
 
 bp = Blueprint('payment')
 
 
-@bp.post('/webhook/payment')
+@bp.post('/webhook/payment', error_format='json')
 async def handle_webhook(request: Request):
     """
     Обработка вебхука платежной системы.
 
-    Проверяет подпись данных вебхука на соответствие с ожидаемой подписью. Затем выполняет следующие действия:
+    Проверяет тело запроса по схеме `WebhookPayload` (при ошибке возвращает 400 до обращения к базе данных) и подпись данных вебхука на соответствие с ожидаемой подписью. Затем выполняет следующие действия:
     1. Проверяет, существует ли пользователь с указанным `user_id`. Если пользователь не найден, возвращает ошибку 404.
     2. Проверяет, существует ли уже платеж с указанным `transaction_id`. Если платеж уже обработан, возвращает ошибку 400.
     3. Проверяет, существует ли счет с указанным `account_id` для данного пользователя. Если счет не найден, создается новый.
-    4. Создает новый платеж и обновляет баланс счета на указанную сумму. При возникновении ошибок во время транзакции откатывает изменения и возвращает ошибку 500.
+    4. Создает новый платеж вместе с записью журнала операций и обновлением часовой и суточной статистики счета, обновляет баланс счета на указанную сумму (в режиме журнала `LEDGER_MODE` баланс не обновляется на месте, а вычисляется по журналу).
+    5. В той же транзакции публикует сброс кешей пользователя и счета во всех воркерах и событие с новым балансом счета для подписчиков `/user/stream`, затем фиксирует все изменения одним commit: сообщения доставляются только вместе с платежом и балансом. При возникновении ошибок во время транзакции откатывает изменения (сообщения отбрасываются) и возвращает ошибку 500.
+
+    При `WEBHOOK_RAW_PATH=true` шаги 1–5 выполняются с той же семантикой и теми же ошибками на уровне драйвера
+    asyncpg (`raw_payment_service`), без ORM.
+
+    Работа с базой данных ограничена бюджетом `DB_REQUEST_BUDGET`. Если база данных недоступна (выключатель
+    разомкнут, бюджет исчерпан, соединение разорвано), вебхук с проверенной подписью записывается в локальную
+    очередь на диске и подтверждается ответом 202; фоновая задача применит его, когда база данных восстановится.
+
+    Вебхуки одного счета обрабатываются воркером по очереди (`account_locks`, `ACCOUNT_LOCK_STRIPES` полос): они
+    ждут в памяти до получения соединения, а не на блокировках строк в базе данных, и не соревнуются за создание
+    одного и того же счета. Ожидание не входит в бюджет `DB_REQUEST_BUDGET`.
 
     Аргументы:
     - request: Sanic Request объект, содержащий данные вебхука платежной системы.
@@ -27,30 +49,90 @@ async def handle_webhook(request: Request):
     Возвращает:
     - JSON-ответ с сообщением об успешной обработке платежа или с ошибкой в случае проблем.
     """
-    data = request.json
-    expected_signature = generate_signature(data, SECRET_KEY)
+    try:
+        data = decode_body(request, WebhookPayload)
+    except ValueError as error:
+        return response.json({'message': str(error)}, status=400)
 
-    if data['signature'] != expected_signature:
+    expected_signature = generate_signature(as_dict(data), SECRET_KEY)
+    if data.signature != expected_signature:
         return response.json({'message': 'Invalid signature'}, status=400)
 
+    try:
+        async with account_locks.hold(data.account_id), database_budget():
+            return await process_webhook(data)
+    except DatabaseUnavailable as error:
+        logger.warning('Database unavailable, spooling transaction %s: %s', data.transaction_id, error)
+        await spool.append(as_dict(data))
+        return response.json({'message': 'Payment accepted for processing'}, status=202)
+
+
+async def process_webhook(data: WebhookPayload):
+    """
+    Применение проверенного вебхука к базе данных (шаги 1–5 `handle_webhook`).
+
+    Используется обработчиком вебхука и воспроизведением очереди вебхуков.
+
+    Аргументы:
+    - data: Данные вебхука.
+
+    Возвращает:
+    - JSON-ответ с сообщением об успешной обработке платежа или с ошибкой.
+    """
+    if WEBHOOK_RAW_PATH:
+        return await _process_payment_raw(data)
+    return await _process_payment_orm(data)
+
+
+async def _process_payment_orm(data: WebhookPayload):
     async with get_db() as session:
-        user = await payment_service.get_user_by_id(session, data['user_id'])
+        user = await payment_service.get_user_by_id(session, data.user_id)
         if not user:
             return response.json({'message': 'User not found'}, status=404)
 
-        existing_payment = await payment_service.get_payment_by_transaction_id(session, data['transaction_id'])
+        existing_payment = await payment_service.get_payment_by_transaction_id(session, data.transaction_id)
         if existing_payment:
-            return response.json({'message': 'Transaction already processed'}, status=400)
-
-        account = await payment_service.get_account_by_id_and_user_id(session, data['account_id'], data['user_id'])
-        if not account:
-            account = await payment_service.create_account(session, data['account_id'], data['user_id'])
+            message, status = raw_payment_service.ALREADY_PROCESSED
+            return response.json({'message': message}, status=status)
 
+        account = await payment_service.get_account_by_id_and_user_id(session, data.account_id, data.user_id)
         try:
-            await payment_service.create_payment(session, data['transaction_id'], data['amount'], data['account_id'])
-            await payment_service.update_account_balance(session, account, data['amount'])
+            if not account:
+                account = await payment_service.create_account(session, data.account_id, data.user_id)
+            created_at = datetime.now(timezone.utc)
+            ledger_service.add_entry(session, data.account_id, data.amount, data.transaction_id)
+            await rollup_service.add_payment(session, data.account_id, data.amount, created_at)
+            if user.notification_url:
+                await notification_service.enqueue_payment(session, user.notification_url, data.user_id,
+                                                           data.account_id, data.transaction_id, data.amount,
+                                                           created_at)
+            payment_service.add_payment(session, data.transaction_id, data.amount, data.account_id, created_at)
+            if not LEDGER_MODE:
+                await payment_service.add_to_balance(session, account, data.amount)
+            await session.flush()
+
+            if LEDGER_MODE:
+                balance = await ledger_service.get_balance(session, data.account_id)
+            else:
+                balance = account.balance
+            await cache_invalidation.publish(session, cache_invalidation.user_key(data.user_id),
+                                             cache_invalidation.account_key(data.account_id))
+            await stream_service.publish_payment_event(session, data.user_id, data.account_id,
+                                                       data.transaction_id, data.amount, balance)
+            await session.commit()
         except IntegrityError:
             await session.rollback()
             return response.json({'message': 'Failed to process payment'}, status=500)
 
     return response.json({'message': 'Payment processed successfully'})
+
+
+async def _process_payment_raw(data: WebhookPayload):
+    async with get_raw_connection() as conn:
+        balance, error = await raw_payment_service.process_payment(
+            conn, data.user_id, data.account_id, data.transaction_id, data.amount, datetime.now(timezone.utc))
+        if error:
+            message, status = error
+            return response.json({'message': message}, status=status)
+
+    return response.json({'message': 'Payment processed successfully'})
@@ -1,15 +1,23 @@
+import asyncio
+
 from sanic import response, Blueprint
 from sanic.request import Request
 
+from app.config import STREAM_HEARTBEAT_INTERVAL
 from app.db import get_db
-from app.services import user_service
-from app.utils.token_check import extract_and_decode_token
-from app.views.responses import get_user_response, get_accounts_response, get_payments_response
+from app.services import user_service, ledger_service, rollup_service, stream_service
+from app.utils.degraded_mode import serve_stale
+from app.utils.jwt import decode_token
+from app.utils.request_args import parse_date_arg
+from app.utils.token_check import check_revocation, extract_and_decode_token
+from app.views.responses import get_user_response, get_accounts_response, get_payments_response, \
+    get_balance_response, get_payment_stats_response
 
 bp = Blueprint('user', url_prefix='/user')
 
 
-@bp.get('/about')
+@bp.get('/about', error_format='json')
+@serve_stale
 async def get_user(request: Request):
     """
     Получение информации о пользователе.
@@ -26,6 +34,8 @@ async def get_user(request: Request):
     - JSON-ответ с данными пользователя или с ошибкой в случае его отсутствия.
     """
     payload = await extract_and_decode_token(request)
+    if not isinstance(payload, dict):
+        return payload
     user_id = payload['user_id']
 
     async with get_db() as session:
@@ -35,7 +45,8 @@ async def get_user(request: Request):
         return response.json({'message': 'User not found'}, status=404)
 
 
-@bp.get('/accounts')
+@bp.get('/accounts', error_format='json')
+@serve_stale
 async def get_user_accounts(request: Request):
     """
     Получение счетов пользователя.
@@ -51,6 +62,8 @@ async def get_user_accounts(request: Request):
     - JSON-ответ с данными счетов пользователя.
     """
     payload = await extract_and_decode_token(request)
+    if not isinstance(payload, dict):
+        return payload
     user_id = payload['user_id']
 
     async with get_db() as session:
@@ -58,24 +71,199 @@ async def get_user_accounts(request: Request):
         return get_accounts_response(accounts)
 
 
-@bp.get('/payments')
+@bp.get('/accounts/<account_id:int>/balance', error_format='json')
+@serve_stale
+async def get_account_balance(request: Request, account_id: int):
+    """
+    Получение баланса счета пользователя на текущий момент или на момент времени.
+
+    Извлекает и декодирует токен из заголовков запроса, чтобы получить идентификатор пользователя (`user_id`). Затем выполняет следующие действия:
+    1. Разбирает необязательный параметр `at` (дата в формате ISO 8601).
+    2. Проверяет, что счет принадлежит пользователю. Если нет, возвращает ошибку 404.
+    3. Вычисляет баланс по журналу операций: ближайший снимок баланса плюс записи журнала после него.
+
+    Аргументы:
+    - request: Sanic Request объект, содержащий токен в заголовках.
+    - account_id: Идентификатор счета.
+
+    Возвращает:
+    - JSON-ответ с балансом счета или с ошибкой.
+    """
+    payload = await extract_and_decode_token(request)
+    if not isinstance(payload, dict):
+        return payload
+    user_id = payload['user_id']
+
+    try:
+        at = parse_date_arg(request, 'at')
+    except ValueError:
+        return response.json({'message': 'Invalid date format'}, status=400)
+
+    async with get_db() as session:
+        account = await user_service.get_account_by_id_and_user_id(session, account_id, user_id)
+        if not account:
+            return response.json({'message': 'Account not found'}, status=404)
+        balance = await ledger_service.get_balance(session, account_id, at)
+        return get_balance_response(account_id, balance, at)
+
+
+@bp.get('/payments/stats', error_format='json')
+@serve_stale
+async def get_user_payment_stats(request: Request):
+    """
+    Получение статистики платежей пользователя.
+
+    Извлекает и декодирует токен из заголовков запроса, чтобы получить идентификатор пользователя (`user_id`). Затем выполняет следующие действия:
+    1. Разбирает необязательные параметры `from` и `to` (даты в формате ISO 8601), ограничивающие период.
+    2. Получает общую сумму и количество платежей, суммы по счетам и объем по дням из предагрегированной статистики.
+
+    Аргументы:
+    - request: Sanic Request объект, содержащий токен в заголовках.
+
+    Возвращает:
+    - JSON-ответ со статистикой платежей пользователя.
+    """
+    payload = await extract_and_decode_token(request)
+    if not isinstance(payload, dict):
+        return payload
+    user_id = payload['user_id']
+
+    try:
+        since = parse_date_arg(request, 'from')
+        until = parse_date_arg(request, 'to')
+    except ValueError:
+        return response.json({'message': 'Invalid date format'}, status=400)
+
+    async with get_db() as session:
+        account_ids = await user_service.get_account_ids_by_user_id(session, user_id)
+        stats = await rollup_service.get_stats(session, account_ids, since, until)
+        return get_payment_stats_response(stats)
+
+
+@bp.get('/payments', error_format='json')
+@serve_stale
 async def get_user_payments(request: Request):
     """
     Получение платежей пользователя.
 
     Извлекает и декодирует токен из заголовков запроса, чтобы получить идентификатор пользователя (`user_id`). Затем выполняет следующие действия:
-    1. Запрашивает все платежи пользователя по идентификатору `user_id`.
-    2. Возвращает информацию о платежах в формате JSON.
+    1. Разбирает необязательные параметры `from` и `to` (даты в формате ISO 8601), ограничивающие период, и флаг
+       `include_archived`, при котором в ответ добавляются платежи из архива.
+    2. Запрашивает платежи пользователя по идентификатору `user_id` за указанный период.
+    3. Возвращает информацию о платежах в формате JSON.
 
     Аргументы:
     - request: Sanic Request объект, содержащий токен в заголовках.
 
     Возвращает:
-    - JSON-ответ с данными платежей пользователя.
+    - JSON-ответ с данными платежей пользователя или с ошибкой 400 при неверном формате дат.
     """
     payload = await extract_and_decode_token(request)
+    if not isinstance(payload, dict):
+        return payload
     user_id = payload['user_id']
 
+    try:
+        since = parse_date_arg(request, 'from')
+        until = parse_date_arg(request, 'to')
+    except ValueError:
+        return response.json({'message': 'Invalid date format'}, status=400)
+
     async with get_db() as session:
-        payments = await user_service.get_payments_by_user_id(session, user_id)
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
+        payments = await user_service.get_payments_by_user_id(session, user_id, since, until, include_archived)
         return get_payments_response(payments)
+
+
+async def _stream_token_payload(request: Request):
+    """
+    Декодирование JWT для потоковых маршрутов.
+
+    Браузерные WebSocket и EventSource не позволяют задать заголовки, поэтому токен принимается как из заголовка
+    Authorization, так и из параметра `token`.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - dict: Полезные данные токена (или None, если токен отсутствует или недействителен).
+    """
+    token = request.headers.get('Authorization')
+    if not token and request.args.get('token'):
+        token = f"Bearer {request.args.get('token')}"
+    if not token:
+        return None
+    payload = await check_revocation(decode_token(token))
+    if 'error' in payload:
+        return None
+    return payload
+
+
+@bp.websocket('/stream', error_format='json')
+async def stream_events(request: Request, ws):
+    """
+    Поток событий пользователя по WebSocket.
+
+    Проверяет JWT (заголовок Authorization или параметр `token`); при ошибке закрывает соединение с кодом 1008.
+    Затем отправляет клиенту события о зачисленных платежах с новым балансом счета (JSON-объекты с полями `type`,
+    `account_id`, `transaction_id`, `amount`, `balance`) вместо периодического опроса `/user/accounts`.
+
+    Аргументы:
+    - request: Sanic Request объект.
+    - ws: WebSocket-соединение.
+    """
+    payload = await _stream_token_payload(request)
+    if payload is None:
+        await ws.close(code=1008, reason='Unauthorized')
+        return
+
+    user_id = payload['user_id']
+    subscriber = stream_service.subscribe(user_id)
+    closed = asyncio.ensure_future(ws.wait_for_connection_lost())
+    try:
+        while True:
+            event = asyncio.ensure_future(subscriber.queue.get())
+            await asyncio.wait((event, closed), return_when=asyncio.FIRST_COMPLETED)
+            if not event.done():
+                event.cancel()
+                break
+            await ws.send(event.result())
+    finally:
+        closed.cancel()
+        stream_service.unsubscribe(user_id, subscriber)
+
+
+@bp.get('/stream/sse', error_format='json')
+async def stream_events_sse(request: Request):
+    """
+    Поток событий пользователя через Server-Sent Events (для клиентов без WebSocket).
+
+    Проверяет JWT (заголовок Authorization или параметр `token`), затем отправляет те же события, что и
+    `/user/stream`, в формате `text/event-stream`. В паузах между событиями отправляются комментарии-пинги, которые
+    не дают соединению закрыться по таймауту.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - Потоковый ответ с событиями или JSON-ответ с ошибкой 401.
+    """
+    payload = await _stream_token_payload(request)
+    if payload is None:
+        return response.json({'message': 'Unauthorized'}, status=401)
+
+    user_id = payload['user_id']
+    subscriber = stream_service.subscribe(user_id)
+    try:
+        stream = await request.respond(content_type='text/event-stream',
+                                       headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        await stream.send(': connected\n\n')
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), STREAM_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                await stream.send(': ping\n\n')
+                continue
+            await stream.send(f'data: {event}\n\n')
+    finally:
+        stream_service.unsubscribe(user_id, subscriber)
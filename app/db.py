@@ -1,21 +1,230 @@
 from contextlib import asynccontextmanager
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from app.config import DATABASE_URL
+from sqlalchemy import Integer, PrimaryKeyConstraint, any_, literal
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.sql.elements import CollationClause
+from app.config import DATABASE_URL, DB_ECHO, SLOW_QUERY_ENABLED
 
-engine = create_async_engine(DATABASE_URL, echo=True)
-
-AsyncSessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=engine,
-    class_=AsyncSession
-)
+# Движок и фабрика сессий создаются при первом обращении (или в хуке запуска сервера), а не при импорте модуля:
+# так импорт моделей (например, из Alembic или CLI-команд) не тянет за собой драйвер и пул соединений.
+_engine = None
+_session_factory = None
 
 Base = declarative_base()
 
 
+def is_sqlite_url(url: str = DATABASE_URL) -> bool:
+    return url.startswith('sqlite')
+
+
+def is_postgres(session) -> bool:
+    """
+    Проверка, работает ли сессия с Postgres (а не с SQLite).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession.
+
+    Возвращает:
+    - bool: True для Postgres.
+    """
+    return session.bind.dialect.name == 'postgresql'
+
+
+def insert_for(session, model):
+    """
+    Конструкция INSERT диалекта сессии с поддержкой `ON CONFLICT` (`on_conflict_do_update`,
+    `on_conflict_do_nothing`): одинаковый код upsert работает с Postgres и SQLite.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession.
+    - model: Модель или таблица.
+
+    Возвращает:
+    - Insert: Конструкция INSERT.
+    """
+    if is_postgres(session):
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def any_of(session, column, values: list):
+    """
+    Условие принадлежности значения столбца списку.
+
+    В Postgres список передается одним параметром-массивом (`column = ANY(:values)`): текст запроса не зависит от
+    длины списка, и подготовленное выражение переиспользуется. В SQLite используется `IN`.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession.
+    - column: Целочисленный столбец.
+    - values: Список значений.
+
+    Возвращает:
+    - ColumnElement: Условие.
+    """
+    if is_postgres(session):
+        return column == any_(literal(list(values), ARRAY(Integer)))
+    return column.in_(list(values))
+
+
+@compiles(CreateColumn, 'sqlite')
+def _compile_sqlite_column(create, compiler, **kw):
+    # В SQLite автоматически нумеруется только столбец `INTEGER PRIMARY KEY`. Идентификатор, входящий в составной
+    # первичный ключ (как у партиционированной таблицы payments), объявляется таким столбцом, а составной ключ
+    # не создается
+    column = create.element
+    if column.info.get('sqlite_rowid'):
+        return f'{compiler.preparer.format_column(column)} INTEGER NOT NULL PRIMARY KEY'
+    return compiler.visit_create_column(create, **kw)
+
+
+@compiles(CollationClause, 'sqlite')
+def _compile_sqlite_collation(collation, compiler, **kw):
+    # Побайтовое сравнение Postgres (COLLATE "C") в SQLite называется BINARY
+    if collation.collation == 'C':
+        return 'BINARY'
+    return compiler.visit_collation(collation, **kw)
+
+
+@compiles(PrimaryKeyConstraint, 'sqlite')
+def _compile_sqlite_primary_key(constraint, compiler, **kw):
+    if any(column.info.get('sqlite_rowid') for column in constraint.columns):
+        return None
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
+
+def get_engine(statement_timeout: float = None, connect_timeout: float = None, pool_timeout: float = None):
+    """
+    Возвращает асинхронный движок SQLAlchemy, создавая его при первом вызове.
+
+    К событиям движка подключается журнал медленных запросов (`SLOW_QUERY_ENABLED`).
+
+    Таймауты учитываются только при создании движка: сервер создает его в хуке запуска с таймаутами запросов,
+    а CLI-команды (архивация, сверка, обслуживание секций) — без ограничения времени выполнения запросов.
+
+    Для SQLite (`sqlite+aiosqlite://`) таймауты и журнал медленных запросов не используются, включается проверка
+    внешних ключей, а база в памяти живет в единственном соединении пула до `dispose_engine`: все сессии
+    работают через это соединение, поэтому транзакции сессий не должны чередоваться. Механизмы, открывающие
+    вторую сессию посреди чужой транзакции (single-flight, бюджет времени serve-stale), с SQLite отключены.
+    Схема создается `create_schema`.
+
+    Аргументы:
+    - statement_timeout: Предельное время выполнения запроса в секундах (`statement_timeout` на сервере и таймаут
+      ожидания ответа в драйвере), или None.
+    - connect_timeout: Предельное время установки соединения в секундах, или None.
+    - pool_timeout: Предельное время ожидания свободного соединения пула в секундах, или None.
+
+    Возвращает:
+    - AsyncEngine: Движок базы данных.
+    """
+    global _engine
+    if _engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        if is_sqlite_url():
+            _engine = _create_sqlite_engine()
+            return _engine
+        options = {}
+        connect_args = {}
+        if statement_timeout:
+            connect_args['server_settings'] = {'statement_timeout': str(int(statement_timeout * 1000))}
+            # Ответ сервера ждем чуть дольше: при живом сервере запрос отменит он сам, с понятной ошибкой
+            connect_args['command_timeout'] = statement_timeout + 1
+        if connect_timeout:
+            connect_args['timeout'] = connect_timeout
+        if connect_args:
+            options['connect_args'] = connect_args
+        if pool_timeout:
+            options['pool_timeout'] = pool_timeout
+        _engine = create_async_engine(DATABASE_URL, echo=DB_ECHO, **options)
+        if SLOW_QUERY_ENABLED:
+            from app.utils.slow_query import slow_query_log
+            slow_query_log.install(_engine)
+    return _engine
+
+
+def _create_sqlite_engine():
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import StaticPool
+
+    options = {}
+    if DATABASE_URL.rstrip('/') == 'sqlite+aiosqlite:' or ':memory:' in DATABASE_URL:
+        # У каждого соединения своя база в памяти, поэтому все сессии работают через одно соединение (и одну
+        # транзакцию: commit или rollback любой сессии затрагивает изменения остальных)
+        options['poolclass'] = StaticPool
+    engine = create_async_engine(DATABASE_URL, echo=DB_ECHO, **options)
+
+    @event.listens_for(engine.sync_engine, 'connect')
+    def _enable_foreign_keys(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.close()
+
+    return engine
+
+
+async def create_schema():
+    """
+    Создание таблиц всех моделей по `Base.metadata` (для SQLite; схема Postgres создается миграциями Alembic).
+    """
+    import app.models.account
+    import app.models.ledger
+    import app.models.notification
+    import app.models.payments
+    import app.models.rollup
+    import app.models.token_revocation
+    import app.models.user
+
+    async with get_engine().begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+def get_session_factory():
+    """
+    Возвращает фабрику асинхронных сессий, создавая ее при первом вызове.
+
+    Возвращает:
+    - sessionmaker: Фабрика сессий AsyncSession.
+    """
+    global _session_factory
+    if _session_factory is None:
+        from sqlalchemy.ext.asyncio import AsyncSession
+        from sqlalchemy.orm import sessionmaker
+        _session_factory = sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            expire_on_commit=False,
+            bind=get_engine(),
+            class_=AsyncSession
+        )
+    return _session_factory
+
+
+def get_asyncpg_dsn() -> str:
+    """
+    Возвращает строку подключения `DATABASE_URL` в формате, понятном asyncpg (без указания драйвера SQLAlchemy).
+
+    Возвращает:
+    - str: DSN для `asyncpg.connect`.
+    """
+    return DATABASE_URL.replace('postgresql+asyncpg://', 'postgresql://', 1)
+
+
+async def dispose_engine():
+    """
+    Закрывает все соединения пула, если движок был создан.
+    """
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+        _session_factory = None
+
+
 @asynccontextmanager
 async def get_db():
     """
@@ -30,8 +239,26 @@ async def get_db():
     Возвращает:
     - session: Асинхронный сеанс SQLAlchemy для работы с базой данных.
     """
-    async with AsyncSessionLocal() as session:
+    async with get_session_factory()() as session:
         try:
             yield session
         finally:
             await session.close()
+
+
+@asynccontextmanager
+async def get_raw_connection():
+    """
+    Асинхронный контекстный менеджер для получения "сырого" соединения asyncpg из общего пула SQLAlchemy.
+
+    Используется там, где нужны возможности драйвера, недоступные через ORM (например, `COPY`). Соединение
+    возвращается в пул после выхода из контекста. С SQLite недоступно.
+
+    Возвращает:
+    - connection: Соединение asyncpg.
+    """
+    if is_sqlite_url():
+        raise RuntimeError('Raw asyncpg connections require PostgreSQL')
+    async with get_engine().connect() as connection:
+        raw_connection = await connection.get_raw_connection()
+        yield raw_connection.driver_connection
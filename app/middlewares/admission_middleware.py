@@ -0,0 +1,114 @@
+from sanic import Request, json
+
+from app.config import (RATE_LIMIT_ENABLED, RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST, RATE_LIMIT_IP_RATE,
+                        RATE_LIMIT_IP_BURST, RATE_LIMIT_AUTH_RATE, RATE_LIMIT_AUTH_BURST, RATE_LIMIT_IDLE_TTL,
+                        MAX_CONCURRENT_REQUESTS, WEBHOOK_RESERVED_SLOTS)
+from app.utils.jwt import decode_request_token
+from app.utils.rate_limit import TokenBucketTable, ConcurrencyLimiter, retry_after_header
+
+AUTH_PATHS = frozenset({'/login', '/register'})
+PRIORITY_PATHS = frozenset({'/webhook/payment'})
+# Долгоживущие соединения не занимают слоты глобального лимита (по ним только ожидаются события)
+STREAM_PATHS = frozenset({'/user/stream', '/user/stream/sse'})
+
+user_buckets = TokenBucketTable(RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST, RATE_LIMIT_IDLE_TTL)
+ip_buckets = TokenBucketTable(RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, RATE_LIMIT_IDLE_TTL)
+auth_buckets = TokenBucketTable(RATE_LIMIT_AUTH_RATE, RATE_LIMIT_AUTH_BURST, RATE_LIMIT_IDLE_TTL)
+concurrency = ConcurrencyLimiter(MAX_CONCURRENT_REQUESTS, WEBHOOK_RESERVED_SLOTS)
+
+
+def _rate_limit_key(request: Request):
+    """
+    Определяет бакет и ключ, по которому лимитируется запрос.
+
+    Вебхуки платежной системы не лимитируются по частоте. Маршруты аутентификации (bcrypt) имеют отдельный,
+    более строгий бюджет по IP. Запросы с валидным JWT лимитируются по `user_id`, остальные — по IP.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - tuple: (таблица бакетов, ключ) или (None, None), если запрос не лимитируется.
+    """
+    if request.path in PRIORITY_PATHS:
+        return None, None
+    if request.path in AUTH_PATHS:
+        return auth_buckets, request.client_ip
+
+    payload = decode_request_token(request)
+    if payload is not None:
+        # Для лимита достаточно проверенной подписи: токен, отзыв которого еще не проверен, лимитируется по
+        # пользователю
+        payload = payload.get('payload', payload)
+    if payload is not None and 'error' not in payload:
+        return user_buckets, payload['user_id']
+    return ip_buckets, request.client_ip
+
+
+def _release(ctx):
+    if getattr(ctx, 'admitted', False):
+        ctx.admitted = False
+        concurrency.release()
+
+
+async def admit_request(request: Request):
+    """
+    Контроль допуска запроса.
+
+    Сначала проверяет token bucket клиента и при его исчерпании возвращает 429. Затем пытается занять слот
+    глобального лимита одновременных запросов (вебхуки могут занимать зарезервированные слоты) и при перегрузке
+    возвращает 503. В обоих случаях запрос отклоняется сразу, без ожидания в очереди, с заголовком Retry-After.
+
+    Занятый слот отмечается в контексте соединения, а не запроса: если обработчик прерван (клиент отключился,
+    истек таймаут ответа) и response middleware не выполнялся, слот освобождается при закрытии соединения
+    (`release_connection`) или в начале следующего запроса того же соединения.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - json: Ответ с кодом 429 или 503, если запрос отклонен, иначе None.
+    """
+    ctx = request.conn_info.ctx
+    # Соединение HTTP/1.1 обрабатывает запросы по одному: слот предыдущего запроса уже не используется
+    _release(ctx)
+    if not RATE_LIMIT_ENABLED:
+        return None
+
+    buckets, key = _rate_limit_key(request)
+    if buckets is not None:
+        wait = buckets.consume(key)
+        if wait:
+            return json({'message': 'Too many requests'}, status=429, headers=retry_after_header(wait))
+
+    if request.path in STREAM_PATHS:
+        return None
+    if not concurrency.try_acquire(priority=request.path in PRIORITY_PATHS):
+        return json({'message': 'Service overloaded'}, status=503, headers=retry_after_header(1))
+    ctx.admitted = True
+    return None
+
+
+async def release_request(request: Request, _response):
+    """
+    Освобождает слот глобального лимита после формирования ответа.
+
+    Аргументы:
+    - request: Sanic Request объект.
+    - _response: Ответ на запрос (не используется).
+    """
+    _release(request.conn_info.ctx)
+
+
+async def release_connection(conn_info):
+    """
+    Освобождает слот глобального лимита при закрытии соединения (сигнал `http.lifecycle.complete`).
+
+    Сигнал отправляется и тогда, когда обработчик запроса отменен, поэтому слот не теряется при отключении
+    клиента посреди запроса.
+
+    Аргументы:
+    - conn_info: Информация о соединении Sanic.
+    """
+    if conn_info is not None:
+        _release(conn_info.ctx)
@@ -0,0 +1,69 @@
+import json
+import time
+
+from sanic import Request
+
+from app.config import TRAFFIC_CAPTURE_ENABLED
+from app.middlewares.admission_middleware import STREAM_PATHS
+from app.utils.jwt import decode_request_token
+from app.utils.traffic_capture import CaptureWriter, redact
+
+writer = CaptureWriter()
+
+
+async def start_capture(request: Request):
+    """
+    Начало захвата запроса: запоминает время поступления (при `TRAFFIC_CAPTURE_ENABLED=true`).
+
+    Аргументы:
+    - request: Sanic Request объект.
+    """
+    if TRAFFIC_CAPTURE_ENABLED and request.path not in STREAM_PATHS:
+        request.ctx.capture_started = (time.time(), time.perf_counter())
+
+
+def _capture_body(request: Request):
+    # У маршрутов с потоковым телом (stream=True) `request.body` пуст: тело читается обработчиком по частям
+    if not request.body:
+        return None
+    try:
+        return redact(json.loads(request.body))
+    except ValueError:
+        return None
+
+
+async def finish_capture(request: Request, response):
+    """
+    Запись захваченного запроса: время поступления, метод, путь и шаблон маршрута, параметры, статус и
+    длительность обработки, пользователь из JWT (сам токен не сохраняется) и JSON-тело с замененными паролями,
+    подписями и токенами. Потоковые тела (импорт) не сохраняются.
+
+    Аргументы:
+    - request: Sanic Request объект.
+    - response: Ответ на запрос.
+    """
+    started = getattr(request.ctx, 'capture_started', None)
+    if started is None or response is None:
+        return
+    request.ctx.capture_started = None
+    timestamp, perf_started = started
+
+    user_id = is_admin = None
+    payload = decode_request_token(request)
+    if payload is not None:
+        payload = payload.get('payload', payload)
+    if payload is not None and 'error' not in payload:
+        user_id, is_admin = payload['user_id'], payload.get('is_admin', False)
+
+    writer.write({
+        'ts': round(timestamp, 6),
+        'method': request.method,
+        'path': request.path,
+        'route': '/' + request.route.path if request.route is not None else None,
+        'query': request.query_string,
+        'status': response.status,
+        'duration_ms': round((time.perf_counter() - perf_started) * 1000, 3),
+        'user_id': user_id,
+        'is_admin': is_admin,
+        'body': _capture_body(request),
+    })
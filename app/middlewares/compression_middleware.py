@@ -0,0 +1,254 @@
+import time
+import zlib
+
+from sanic import Request
+
+from app.config import COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, COMPRESSION_CPU_BUDGET
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - зависит от окружения
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - зависит от окружения
+    zstandard = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv', 'text/html')
+SKIP_STATUSES = frozenset({204, 206, 304})
+
+# Заготовки контекстов: копия заготовки zlib дешевле создания нового, ZstdCompressor переиспользуется целиком
+_gzip_template = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+_zstd = zstandard.ZstdCompressor(level=ZSTD_LEVEL) if zstandard is not None else None
+
+# Порядок предпочтения при равном q
+SUPPORTED_ENCODINGS = tuple(encoding for encoding, available in (
+    ('zstd', _zstd is not None),
+    ('br', brotli is not None),
+    ('gzip', True),
+) if available)
+
+
+class CpuBudget:
+    """
+    Бюджет процессорного времени на сжатие.
+
+    Время сжатия суммируется в пределах окна `window` секунд. Если оно превысило долю `fraction` окна, сжатие
+    до начала следующего окна пропускается: под нагрузкой ответы отдаются без сжатия, а не ценой задержки
+    остальных запросов.
+
+    Аргументы:
+    - fraction: Допустимая доля процессорного времени одного ядра (0 отключает сжатие).
+    - window: Длина окна в секундах.
+    """
+
+    def __init__(self, fraction: float, window: float = 1.0):
+        self.limit = fraction * window
+        self.window = window
+        self.window_start = time.monotonic()
+        self.spent = 0.0
+
+    def allow(self, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        if now - self.window_start >= self.window:
+            self.window_start = now
+            self.spent = 0.0
+        return self.spent < self.limit
+
+    def charge(self, seconds: float):
+        self.spent += seconds
+
+
+budget = CpuBudget(COMPRESSION_CPU_BUDGET)
+_negotiated = {}
+
+
+def negotiate_encoding(accept_encoding: str):
+    """
+    Выбор алгоритма сжатия по заголовку Accept-Encoding с учетом q-значений.
+
+    Результат кешируется по значению заголовка: у клиентов их немного.
+
+    Аргументы:
+    - accept_encoding: Значение заголовка Accept-Encoding.
+
+    Возвращает:
+    - str: `zstd`, `br` или `gzip` (или None, если ни один не подходит).
+    """
+    if accept_encoding in _negotiated:
+        return _negotiated[accept_encoding]
+
+    weights = {}
+    for item in accept_encoding.lower().split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    wildcard = weights.get('*', 0.0)
+    candidates = [(weights.get(encoding, wildcard), -index, encoding)
+                  for index, encoding in enumerate(SUPPORTED_ENCODINGS)]
+    q, _, encoding = max(candidates)
+    result = encoding if q > 0 else None
+
+    if len(_negotiated) >= 256:
+        _negotiated.clear()
+    _negotiated[accept_encoding] = result
+    return result
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Сжатие тела ответа целиком.
+
+    Аргументы:
+    - body: Тело ответа.
+    - encoding: Алгоритм (`zstd`, `br` или `gzip`).
+
+    Возвращает:
+    - bytes: Сжатое тело.
+    """
+    if encoding == 'zstd':
+        return _zstd.compress(body)
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    compressor = _gzip_template.copy()
+    return compressor.compress(body) + compressor.flush()
+
+
+class StreamEncoder:
+    """
+    Потоковое сжатие ответа по частям.
+
+    Каждая часть сбрасывается на границе блока, чтобы клиент получал данные сразу, а не после заполнения
+    буфера компрессора.
+
+    Аргументы:
+    - encoding: Алгоритм (`zstd`, `br` или `gzip`).
+    """
+
+    __slots__ = ('encoding', 'compressor')
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'zstd':
+            self.compressor = _zstd.compressobj()
+        elif encoding == 'br':
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self.compressor = _gzip_template.copy()
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == 'zstd':
+            return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == 'br':
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'zstd':
+            return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+class CompressedStream:
+    """
+    Обертка над потоком ответа Sanic, сжимающая отправляемые части.
+
+    До первой отправки нельзя отличить потоковый ответ от пустого, поэтому решение принимается при первой
+    отправке, пока заголовки еще не ушли клиенту: если поток сразу завершается без данных, ответ отправляется
+    как есть. Остальные атрибуты делегируются исходному потоку.
+
+    Аргументы:
+    - stream: Исходный поток ответа.
+    - response: Ответ.
+    - encoding: Алгоритм (`zstd`, `br` или `gzip`).
+    """
+
+    __slots__ = ('stream', 'response', 'encoding', 'encoder')
+
+    def __init__(self, stream, response, encoding: str):
+        self.stream = stream
+        self.response = response
+        self.encoding = encoding
+        self.encoder = None
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @property
+    def send(self):
+        # Sanic проверяет `stream.send is None`, чтобы узнать, завершен ли поток
+        return None if self.stream.send is None else self._send
+
+    async def _send(self, data: bytes, end_stream: bool):
+        if self.encoder is None:
+            if not data:
+                await self.stream.send(data, end_stream=end_stream)
+                return
+            self.encoder = StreamEncoder(self.encoding)
+            self.response.headers['Content-Encoding'] = self.encoding
+            self.response.headers.pop('Content-Length', None)
+
+        started = time.perf_counter()
+        chunk = self.encoder.chunk(data) if data else b''
+        if end_stream:
+            chunk += self.encoder.finish()
+        budget.charge(time.perf_counter() - started)
+        if chunk or end_stream:
+            await self.stream.send(chunk, end_stream=end_stream)
+
+
+def _is_compressible(response) -> bool:
+    if response.status < 200 or response.status in SKIP_STATUSES:
+        return False
+    if 'content-encoding' in response.headers:
+        return False
+    content_type = (response.content_type or '').split(';')[0].strip().lower()
+    return content_type in COMPRESSIBLE_TYPES
+
+
+async def compress_response(request: Request, response):
+    """
+    Сжатие ответа алгоритмом, согласованным по заголовку Accept-Encoding (zstd, brotli или gzip).
+
+    Сжимаются только JSON и текстовые ответы (кроме `text/event-stream`). Тела меньше `COMPRESSION_MIN_SIZE`
+    байт отдаются как есть. Потоковые ответы (`request.respond`) сжимаются по частям. При исчерпании бюджета
+    процессорного времени `COMPRESSION_CPU_BUDGET` сжатие временно пропускается.
+
+    Аргументы:
+    - request: Sanic Request объект.
+    - response: Ответ на запрос.
+    """
+    if not COMPRESSION_ENABLED or response is None or not _is_compressible(response):
+        return
+    response.headers.add('Vary', 'Accept-Encoding')
+
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None or not budget.allow():
+        return
+
+    if not response.body:
+        if response.stream is not None:
+            response.stream = CompressedStream(response.stream, response, encoding)
+        return
+
+    if len(response.body) < COMPRESSION_MIN_SIZE:
+        return
+    started = time.perf_counter()
+    body = compress(response.body, encoding)
+    budget.charge(time.perf_counter() - started)
+    response.body = body
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(body))
@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, BigInteger, String, Float, ForeignKey, DateTime, Index
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from app.db import Base
+
+
+class current_xact_id(FunctionElement):
+    # Идентификатор текущей транзакции Postgres (xid8) как bigint. В SQLite (одна пишущая транзакция, компактора
+    # нет) — 0
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(current_xact_id)
+def _compile_current_xact_id(element, compiler, **kw):
+    return '0'
+
+
+@compiles(current_xact_id, 'postgresql')
+def _compile_current_xact_id_postgresql(element, compiler, **kw):
+    return '(pg_current_xact_id()::text::bigint)'
+
+
+class LedgerEntry(Base):
+    __tablename__ = 'ledger_entries'
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    account_id = Column(Integer, ForeignKey('accounts.id'), nullable=False)
+    amount = Column(Float, nullable=False)
+    transaction_id = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    # Транзакция, записавшая строку: запись попадает в снимок, только когда ее транзакция гарантированно завершена
+    xact_id = Column(BigInteger, nullable=False, server_default=current_xact_id())
+
+    __table_args__ = (
+        Index('ix_ledger_entries_account_id_id', 'account_id', 'id'),
+        Index('ix_ledger_entries_account_id_xact_id', 'account_id', 'xact_id'),
+    )
+
+
+class BalanceSnapshot(Base):
+    __tablename__ = 'balance_snapshots'
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    account_id = Column(Integer, ForeignKey('accounts.id'), nullable=False)
+    # Снимок включает записи журнала счета с id <= last_entry_id и xact_id < xmin. Записи транзакций, еще не
+    # завершенных при создании снимка (xact_id >= xmin), в него не входят, даже если их id меньше last_entry_id
+    last_entry_id = Column(BigInteger, nullable=False)
+    xmin = Column(BigInteger, nullable=False)
+    balance = Column(Float, nullable=False)
+    as_of = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index('ix_balance_snapshots_account_id_last_entry_id', 'account_id', 'last_entry_id'),
+        Index('ix_balance_snapshots_account_id_as_of', 'account_id', 'as_of'),
+    )
@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON, Index, text
+
+from app.db import Base
+
+
+class NotificationOutbox(Base):
+    # Уведомление записывается в одной транзакции с платежом и удаляется после доставки
+    __tablename__ = 'notification_outbox'
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    # URL получателя на момент платежа: смена адреса не перенаправляет уже поставленные уведомления
+    destination = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    last_error = Column(String, nullable=True)
+    # Уведомление, доставить которое не удалось, остается в таблице для разбора, но больше не отправляется
+    failed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('ix_notification_outbox_next_attempt_at', 'next_attempt_at',
+              postgresql_where=text('failed_at IS NULL')),
+    )
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 
 from app.db import Base
@@ -6,9 +8,17 @@ from app.db import Base
 
 class Payment(Base):
     __tablename__ = 'payments'
-    id = Column(Integer, primary_key=True, index=True)
-    transaction_id = Column(String, primary_key=True, index=True)
+    # Первичный ключ (id, created_at), как у партиционированной таблицы: ключ партиционирования входит в него
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True, info={'sqlite_rowid': True})
+    transaction_id = Column(String, nullable=False, index=True)
     amount = Column(Float, nullable=False)
     account_id = Column(Integer, ForeignKey('accounts.id'), nullable=False)
+    # Ключ партиционирования таблицы payments (RANGE по месяцам), задается на стороне приложения,
+    # чтобы строка сразу попадала в нужную партицию
+    created_at = Column(DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc))
+
+    account = relationship("Account", back_populates="payments")
 
-    account = relationship("Account", back_populates="payments")
\ No newline at end of file
+    __table_args__ = (
+        Index('ix_payments_account_id_created_at', 'account_id', 'created_at'),
+    )
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index
+
+from app.db import Base
+
+
+class PaymentRollup(Base):
+    __tablename__ = 'payment_rollups'
+    account_id = Column(Integer, ForeignKey('accounts.id'), primary_key=True)
+    # 'hour' или 'day'
+    bucket_size = Column(String(8), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    payment_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_payment_rollups_bucket_size_bucket_start', 'bucket_size', 'bucket_start'),
+    )
@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Index
+
+from app.db import Base
+
+
+class UserTokenEpoch(Base):
+    # Без внешнего ключа на users: отзыв должен пережить удаление пользователя
+    __tablename__ = 'user_token_epochs'
+    user_id = Column(Integer, primary_key=True)
+    # Токены пользователя, выпущенные раньше этого момента (claim `iat`, секунды Unix), недействительны
+    not_before = Column(BigInteger, nullable=False)
+    changed_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index('ix_user_token_epochs_changed_at', 'changed_at'),
+    )
+
+
+class RevokedToken(Base):
+    __tablename__ = 'revoked_tokens'
+    jti = Column(String(32), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    # После истечения срока действия токен отклоняется и без записи об отзыве, поэтому запись можно удалить
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index('ix_revoked_tokens_revoked_at', 'revoked_at'),
+        Index('ix_revoked_tokens_expires_at', 'expires_at'),
+    )
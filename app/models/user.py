@@ -1,10 +1,25 @@
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy import Column, Integer, String, Boolean, Index, func
 from sqlalchemy.orm import relationship
-from passlib.context import CryptContext
 
 from app.db import Base
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_pwd_context = None
+
+
+def get_pwd_context():
+    """
+    Возвращает контекст хеширования паролей, создавая его при первом вызове.
+
+    passlib и backend bcrypt загружаются только когда пароль действительно нужно проверить или захешировать.
+
+    Возвращает:
+    - CryptContext: Контекст хеширования паролей.
+    """
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 
 class User(Base):
@@ -14,11 +29,18 @@ class User(Base):
     full_name = Column(String, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_admin = Column(Boolean, default=False)
+    # Адрес бэкенда владельца для уведомлений о платежах (или None, если уведомления не нужны)
+    notification_url = Column(String, nullable=True)
 
     accounts = relationship("Account", back_populates="owner")
 
+    __table_args__ = (
+        # Поиск по началу email (побайтовое сравнение, как в миграции); триграммные индексы есть только в Postgres
+        Index('ix_users_lower_email', func.lower(email).collate('C')),
+    )
+
     def verify_password(self, password: str) -> bool:
-        return pwd_context.verify(password, self.hashed_password)
+        return get_pwd_context().verify(password, self.hashed_password)
 
     def set_password(self, password: str):
-        self.hashed_password = pwd_context.hash(password)
+        self.hashed_password = get_pwd_context().hash(password)
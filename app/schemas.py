@@ -0,0 +1,159 @@
+import dataclasses
+import json
+from typing import Optional, Union
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - зависит от окружения
+    msgspec = None
+
+
+class ValidationError(ValueError):
+    """
+    Тело запроса не является корректным JSON или не соответствует схеме.
+    """
+
+
+def _define(name: str, fields: list):
+    """
+    Создает класс схемы: `msgspec.Struct`, если msgspec установлен, иначе dataclass с `__slots__`.
+
+    Аргументы:
+    - name: Имя класса.
+    - fields: Поля в формате (имя, тип) или (имя, тип, значение по умолчанию).
+
+    Возвращает:
+    - type: Класс схемы.
+    """
+    if msgspec is not None:
+        return msgspec.defstruct(name, fields, kw_only=True)
+    return _define_dataclass(name, fields)
+
+
+def _define_dataclass(name: str, fields: list):
+    fields = [field if len(field) == 2 else (field[0], field[1], dataclasses.field(default=field[2]))
+              for field in fields]
+    return dataclasses.make_dataclass(name, fields, slots=True, kw_only=True)
+
+
+# Сумма остается int или float в том виде, в каком пришла: от ее строкового представления зависит подпись вебхука
+WebhookPayload = _define('WebhookPayload', [
+    ('transaction_id', str),
+    ('user_id', int),
+    ('account_id', int),
+    ('amount', Union[int, float]),
+    ('signature', str),
+])
+
+LoginPayload = _define('LoginPayload', [
+    ('email', str),
+    ('password', str),
+])
+
+RegisterPayload = _define('RegisterPayload', [
+    ('email', str),
+    ('full_name', str),
+    ('password', str),
+])
+
+UserUpdatePayload = _define('UserUpdatePayload', [
+    ('email', Optional[str], None),
+    ('full_name', Optional[str], None),
+    ('password', Optional[str], None),
+    ('notification_url', Optional[str], None),
+])
+
+# Пользователи выбираются списком идентификаторов `ids` или фильтром `email_domain`
+BulkUserUpdatePayload = _define('BulkUserUpdatePayload', [
+    ('ids', Optional[list[int]], None),
+    ('email_domain', Optional[str], None),
+    ('full_name', Optional[str], None),
+    ('password', Optional[str], None),
+    ('notification_url', Optional[str], None),
+])
+
+BulkUserDeletePayload = _define('BulkUserDeletePayload', [
+    ('ids', Optional[list[int]], None),
+    ('email_domain', Optional[str], None),
+    ('cascade', bool, False),
+])
+
+_decoders = {}
+
+
+def _matches(value, annotation) -> bool:
+    if annotation is bool:
+        return type(value) is bool
+    if annotation is int:
+        return type(value) is int
+    if annotation is float:
+        return type(value) in (int, float)
+    if annotation is str:
+        return isinstance(value, str)
+    if annotation is type(None):
+        return value is None
+    if getattr(annotation, '__origin__', None) is list:
+        return isinstance(value, list) and all(_matches(item, annotation.__args__[0]) for item in value)
+    return any(_matches(value, option) for option in annotation.__args__)
+
+
+def _decode_fallback(schema, body: bytes):
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise ValidationError('Invalid JSON')
+    if not isinstance(data, dict):
+        raise ValidationError(f'Expected `object`, got `{type(data).__name__}`')
+    values = {}
+    for field in dataclasses.fields(schema):
+        if field.name not in data:
+            if field.default is dataclasses.MISSING:
+                raise ValidationError(f'Object missing required field `{field.name}`')
+            continue
+        if not _matches(data[field.name], field.type):
+            raise ValidationError(f'Invalid value for field `$.{field.name}`')
+        values[field.name] = data[field.name]
+    return schema(**values)
+
+
+def decode(schema, body: bytes):
+    """
+    Декодирование и проверка тела запроса по схеме.
+
+    С msgspec объект схемы строится прямо из байтов тела без промежуточного словаря; без msgspec используется
+    `json.loads` с проверкой типов полей. Лишние поля игнорируются. При ошибке выбрасывается `ValidationError`
+    с описанием проблемы.
+
+    Аргументы:
+    - schema: Класс схемы.
+    - body: Тело запроса.
+
+    Возвращает:
+    - Объект схемы.
+    """
+    if msgspec is None:
+        return _decode_fallback(schema, body)
+    decoder = _decoders.get(schema)
+    if decoder is None:
+        decoder = _decoders[schema] = msgspec.json.Decoder(schema)
+    try:
+        return decoder.decode(body)
+    except msgspec.ValidationError as error:
+        raise ValidationError(str(error))
+    except msgspec.DecodeError:
+        raise ValidationError('Invalid JSON')
+
+
+def as_dict(payload) -> dict:
+    """
+    Преобразование объекта схемы в словарь.
+
+    Аргументы:
+    - payload: Объект схемы.
+
+    Возвращает:
+    - dict: Поля объекта.
+    """
+    if msgspec is not None:
+        return msgspec.structs.asdict(payload)
+    return dataclasses.asdict(payload)
@@ -1,8 +1,27 @@
+import base64
+import json
+
+from sanic.log import logger
+from sqlalchemy import and_, delete, func, not_, or_, tuple_, update
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
 
+from app.config import LEDGER_MODE, ADMIN_BULK_CHUNK_SIZE
+from app.db import any_of, is_postgres
+from app.models.account import Account
+from app.models.ledger import LedgerEntry, BalanceSnapshot
+from app.models.payments import Payment
+from app.models.rollup import PaymentRollup
 from app.models.user import User
+from app.services import import_service, ledger_service, revocation_service
+from app.utils.cache_invalidation import publish, user_key, account_key
+
+# Поиск по подстроке идет через триграммный индекс, которому нужно хотя бы 3 символа
+SEARCH_SUBSTRING_MIN_LENGTH = 3
+SEARCH_PREFIX_TIER = 1
+SEARCH_SUBSTRING_TIER = 2
 
 
 async def create_user(session: AsyncSession, email: str, full_name: str, password: str) -> User:
@@ -31,7 +50,7 @@ async def delete_user(session: AsyncSession, user_id: int) -> bool:
     """
     Удаление пользователя по идентификатору.
 
-    Находит пользователя по `user_id` и удаляет его из базы данных, если он существует.
+    Находит пользователя по `user_id` и удаляет его из базы данных, если он существует. Кеши пользователя во всех воркерах сбрасываются после commit, выпущенные пользователю токены отзываются.
 
     Аргументы:
     - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
@@ -45,17 +64,19 @@ async def delete_user(session: AsyncSession, user_id: int) -> bool:
     user = result.scalars().first()
     if user:
         await session.delete(user)
+        await revocation_service.revoke_user_tokens(session, user.id)
+        await publish(session, user_key(user_id))
         await session.commit()
         return True
     return False
 
 
 async def update_user(session: AsyncSession, user_id: int, email: str = None, full_name: str = None,
-                      password: str = None) -> bool:
+                      password: str = None, notification_url: str = None) -> bool:
     """
     Обновление информации о пользователе.
 
-    Находит пользователя по `user_id` и обновляет его данные, если они предоставлены. Сохраняет изменения в базе данных.
+    Находит пользователя по `user_id` и обновляет его данные, если они предоставлены. Сохраняет изменения в базе данных. Кеши пользователя во всех воркерах сбрасываются после commit. При смене пароля выпущенные пользователю токены отзываются.
 
     Аргументы:
     - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
@@ -63,6 +84,8 @@ async def update_user(session: AsyncSession, user_id: int, email: str = None, fu
     - email: Новый email пользователя (или None, если не обновляется).
     - full_name: Новое полное имя пользователя (или None, если не обновляется).
     - password: Новый пароль пользователя (или None, если не обновляется).
+    - notification_url: Новый адрес для уведомлений о платежах (пустая строка отключает уведомления, None — не
+      обновляется).
 
     Возвращает:
     - True, если пользователь был найден и обновлен.
@@ -77,16 +100,212 @@ async def update_user(session: AsyncSession, user_id: int, email: str = None, fu
             user.full_name = full_name
         if password:
             user.set_password(password)
+            await revocation_service.revoke_user_tokens(session, user.id)
+        if notification_url is not None:
+            user.notification_url = notification_url or None
+        await publish(session, user_key(user_id))
         await session.commit()
         return True
     return False
 
 
+async def revoke_user_tokens(session: AsyncSession, user_id: int) -> bool:
+    """
+    Отзыв всех выпущенных пользователю токенов.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - user_id: Идентификатор пользователя.
+
+    Возвращает:
+    - True, если пользователь найден и его токены отозваны.
+    - False, если пользователь не найден.
+    """
+    user = (await session.execute(select(User.id).where(User.id == user_id))).scalar()
+    if user is None:
+        return False
+    await revocation_service.revoke_user_tokens(session, user_id)
+    await session.commit()
+    return True
+
+
+BULK_UPDATED = 'updated'
+BULK_DELETED = 'deleted'
+BULK_NOT_FOUND = 'not_found'
+BULK_HAS_ACCOUNTS = 'has_accounts'
+BULK_ERROR = 'error'
+
+
+async def _iter_user_chunks(session: AsyncSession, ids: list = None, email_domain: str = None):
+    """
+    Выбранные пользователи частями по `ADMIN_BULK_CHUNK_SIZE`.
+
+    Для списка идентификаторов возвращаются части списка (без повторов, в исходном порядке). Для фильтра по домену
+    email идентификаторы выбираются по возрастанию постранично (по ключу, а не смещению), и транзакция чтения
+    завершается до возврата части, чтобы не держать ее открытой во время обработки.
+    """
+    if ids is not None:
+        ids = list(dict.fromkeys(ids))
+        for start in range(0, len(ids), ADMIN_BULK_CHUNK_SIZE):
+            yield ids[start:start + ADMIN_BULK_CHUNK_SIZE]
+        return
+    pattern = f'%@{_escape_like(email_domain.strip().lower())}'
+    after_id = 0
+    while True:
+        result = await session.execute(
+            select(User.id)
+            .where(func.lower(User.email).like(pattern, escape='/'), User.id > after_id)
+            .order_by(User.id)
+            .limit(ADMIN_BULK_CHUNK_SIZE))
+        chunk = list(result.scalars())
+        await session.commit()
+        if not chunk:
+            return
+        yield chunk
+        after_id = chunk[-1]
+
+
+async def _update_users_chunk(session: AsyncSession, chunk: list, values: dict, hashes: list) -> set:
+    if values:
+        result = await session.execute(
+            update(User).where(any_of(session, User.id, chunk)).values(**values).returning(User.id))
+    else:
+        result = await session.execute(select(User.id).where(any_of(session, User.id, chunk)))
+    updated = set(result.scalars())
+    if hashes:
+        rows = [{'id': user_id, 'hashed_password': hashed}
+                for user_id, hashed in zip(chunk, hashes) if user_id in updated]
+        if rows:
+            await session.execute(update(User), rows)
+        await revocation_service.revoke_users_tokens(session, sorted(updated))
+    if updated:
+        await publish(session, *(user_key(user_id) for user_id in updated))
+    await session.commit()
+    return updated
+
+
+async def bulk_update_users(session: AsyncSession, ids: list = None, email_domain: str = None,
+                            full_name: str = None, password: str = None, notification_url: str = None) -> list:
+    """
+    Массовое обновление пользователей.
+
+    Пользователи выбираются списком идентификаторов или фильтром по домену email и обновляются частями по
+    `ADMIN_BULK_CHUNK_SIZE`, каждая часть — отдельной транзакцией: общие поля задаются одной командой
+    `UPDATE ... WHERE id = ANY(:ids) RETURNING id`. Новый пароль хешируется для каждого пользователя отдельно (со
+    своей солью) в пуле процессов до начала транзакции части, хеши записываются одной пакетной командой, а
+    токены пользователей отзываются. Кеши пользователей сбрасываются после commit части. Ошибка базы данных
+    откатывает только свою часть: ее пользователи получают статус `error`, остальные части обрабатываются.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - ids: Идентификаторы пользователей (или None, если используется фильтр).
+    - email_domain: Домен email пользователей (или None, если используется список).
+    - full_name: Новое полное имя (или None, если не обновляется).
+    - password: Новый пароль (или None, если не обновляется).
+    - notification_url: Новый адрес для уведомлений о платежах (пустая строка отключает уведомления, None — не
+      обновляется).
+
+    Возвращает:
+    - list: Пары (идентификатор пользователя, `updated`, `not_found` или `error`) в порядке обработки.
+    """
+    values = {}
+    if full_name:
+        values['full_name'] = full_name
+    if notification_url is not None:
+        values['notification_url'] = notification_url or None
+
+    results = []
+    async for chunk in _iter_user_chunks(session, ids, email_domain):
+        hashes = await import_service.hash_passwords_parallel([password] * len(chunk)) if password else None
+        try:
+            updated = await _update_users_chunk(session, chunk, values, hashes)
+        except SQLAlchemyError:
+            await session.rollback()
+            logger.exception('Bulk update of %d users failed', len(chunk))
+            results += [(user_id, BULK_ERROR) for user_id in chunk]
+            continue
+        results += [(user_id, BULK_UPDATED if user_id in updated else BULK_NOT_FOUND) for user_id in chunk]
+    return results
+
+
+async def _delete_users_chunk(session: AsyncSession, chunk: list, cascade: bool) -> tuple:
+    # Строки пользователей и их счетов блокируются до удаления связанных данных: вебхук, уже записавший платеж или
+    # счет, успевает зафиксироваться (и его данные удаляются вместе с остальными), а новые ждут commit части
+    existing = set((await session.execute(
+        select(User.id).where(any_of(session, User.id, chunk)).order_by(User.id).with_for_update())).scalars())
+    accounts = (await session.execute(
+        select(Account.id, Account.owner_id).where(any_of(session, Account.owner_id, chunk))
+        .order_by(Account.id).with_for_update())).all()
+    owners = {owner_id for _, owner_id in accounts}
+    account_ids = [account_id for account_id, _ in accounts]
+
+    deletable = existing if cascade else existing - owners
+    if cascade and account_ids:
+        for model in (Payment, LedgerEntry, BalanceSnapshot, PaymentRollup):
+            await session.execute(delete(model).where(any_of(session, model.account_id, account_ids)))
+        await session.execute(delete(Account).where(any_of(session, Account.id, account_ids)))
+    deleted = set()
+    if deletable:
+        result = await session.execute(
+            delete(User).where(any_of(session, User.id, sorted(deletable))).returning(User.id))
+        deleted = set(result.scalars())
+        await revocation_service.revoke_users_tokens(session, sorted(deleted))
+        await publish(session, *(user_key(user_id) for user_id in deleted),
+                      *(account_key(account_id) for account_id in account_ids))
+    await session.commit()
+    return existing, deleted
+
+
+async def bulk_delete_users(session: AsyncSession, ids: list = None, email_domain: str = None,
+                            cascade: bool = False) -> list:
+    """
+    Массовое удаление пользователей.
+
+    Пользователи выбираются списком идентификаторов или фильтром по домену email и удаляются частями по
+    `ADMIN_BULK_CHUNK_SIZE`, каждая часть — отдельной транзакцией из нескольких команд `DELETE ... WHERE
+    ... = ANY(:ids)`. Строки пользователей части и их счетов сначала блокируются (`FOR UPDATE`), чтобы
+    параллельный вебхук не добавил платеж или счет удаляемому пользователю. Пользователи со счетами удаляются
+    только при `cascade`: тогда вместе с ними удаляются их счета, платежи, записи журнала, снимки балансов и
+    корзины статистики; иначе они пропускаются. Платежи, перенесенные в архив (`archive_service`), не удаляются:
+    файлы архива неизменяемы, и записи удаленных счетов остаются в них. Токены удаленных пользователей
+    отзываются, кеши пользователей и счетов сбрасываются после commit части. Ошибка базы данных откатывает только
+    свою часть: ее пользователи получают статус `error`, остальные части обрабатываются.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - ids: Идентификаторы пользователей (или None, если используется фильтр).
+    - email_domain: Домен email пользователей (или None, если используется список).
+    - cascade: Если True, удаляются и счета пользователей со всеми связанными данными.
+
+    Возвращает:
+    - list: Пары (идентификатор пользователя, `deleted`, `not_found`, `has_accounts` или `error`) в порядке
+      обработки.
+    """
+    results = []
+    async for chunk in _iter_user_chunks(session, ids, email_domain):
+        try:
+            existing, deleted = await _delete_users_chunk(session, chunk, cascade)
+        except SQLAlchemyError:
+            await session.rollback()
+            logger.exception('Bulk delete of %d users failed', len(chunk))
+            results += [(user_id, BULK_ERROR) for user_id in chunk]
+            continue
+        for user_id in chunk:
+            if user_id in deleted:
+                results.append((user_id, BULK_DELETED))
+            elif user_id in existing:
+                results.append((user_id, BULK_HAS_ACCOUNTS))
+            else:
+                results.append((user_id, BULK_NOT_FOUND))
+    return results
+
+
 async def get_users(session: AsyncSession):
     """
     Получение списка всех пользователей.
 
     Извлекает всех пользователей из базы данных, включая их счета, и возвращает список уникальных пользователей.
+    В режиме журнала (`LEDGER_MODE`) балансы счетов вычисляются по журналу операций.
 
     Аргументы:
     - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
@@ -98,4 +317,115 @@ async def get_users(session: AsyncSession):
         select(User).options(joinedload(User.accounts)).distinct()
     )
     users = result.scalars().unique().all()
+    if LEDGER_MODE:
+        await ledger_service.apply_current_balances(session, [account for user in users for account in user.accounts])
     return users
+
+
+def _prefix_upper_bound(prefix: str):
+    # Наименьшая строка больше всех строк с префиксом `prefix` при побайтовом сравнении UTF-8
+    while prefix:
+        code = ord(prefix[-1])
+        if code < 0x10FFFF:
+            return prefix[:-1] + chr(code + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+def encode_search_cursor(tier: int, user_id: int, email: str = None) -> str:
+    """
+    Курсор продолжения поиска после заданного пользователя.
+
+    Аргументы:
+    - tier: Группа результатов, к которой относится пользователь.
+    - user_id: Идентификатор последнего возвращенного пользователя.
+    - email: Его email в нижнем регистре (`lower(email)` на стороне базы), только для группы префикса.
+
+    Возвращает:
+    - str: Непрозрачный курсор (base64url).
+    """
+    key = [tier, user_id] if tier == SEARCH_SUBSTRING_TIER else [tier, user_id, email]
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor: str) -> tuple:
+    """
+    Разбор курсора продолжения поиска.
+
+    Аргументы:
+    - cursor: Курсор из `encode_search_cursor`.
+
+    Возвращает:
+    - tuple: Группа, идентификатор и email в нижнем регистре (для группы префикса) последнего пользователя
+      (при некорректном курсоре выбрасывается `ValueError`).
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        tier, user_id = int(key[0]), int(key[1])
+        email = str(key[2]) if tier == SEARCH_PREFIX_TIER else None
+    except (TypeError, IndexError, UnicodeDecodeError, ValueError) as error:
+        raise ValueError('Invalid cursor') from error
+    if tier not in (SEARCH_PREFIX_TIER, SEARCH_SUBSTRING_TIER):
+        raise ValueError('Invalid cursor')
+    return tier, user_id, email
+
+
+async def search_users(session: AsyncSession, query: str, limit: int, cursor: str = None) -> tuple:
+    """
+    Поиск пользователей по началу email и по подстроке email или полного имени без учета регистра.
+
+    Результаты ранжируются группами: сначала пользователи, чей email начинается с запроса (в порядке email, точное
+    совпадение первым), затем остальные, у которых запрос встречается внутри email или полного имени (в порядке
+    идентификаторов). Каждая группа выбирается по индексу в своем порядке (`ix_users_lower_email` и триграммные
+    индексы `pg_trgm`), поэтому время ответа не зависит от числа пользователей и номера страницы. Поиск по
+    подстроке выполняется для запросов не короче `SEARCH_SUBSTRING_MIN_LENGTH` символов.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - query: Строка поиска.
+    - limit: Максимальное количество пользователей на странице.
+    - cursor: Курсор продолжения из предыдущего ответа (или None для первой страницы).
+
+    Возвращает:
+    - tuple: Список пользователей и курсор следующей страницы (или None, если результатов больше нет).
+      При некорректном курсоре выбрасывается `ValueError`.
+    """
+    query = query.strip().lower()
+    tier, after_id, after_email = decode_search_cursor(cursor) if cursor else (SEARCH_PREFIX_TIER, None, None)
+    email_key = func.lower(User.email)
+    if is_postgres(session):
+        # Побайтовый порядок совпадает с порядком индекса `ix_users_lower_email`; в SQLite он используется по умолчанию
+        email_key = email_key.collate('C')
+    upper = _prefix_upper_bound(query)
+    prefix_match = and_(email_key >= query, email_key < upper) if upper is not None else email_key >= query
+
+    found = []
+    if tier == SEARCH_PREFIX_TIER:
+        statement = select(User, email_key).where(prefix_match)
+        if after_email is not None:
+            statement = statement.where(tuple_(email_key, User.id) > tuple_(after_email, after_id))
+        result = await session.execute(statement.order_by(email_key, User.id).limit(limit + 1))
+        found = [(SEARCH_PREFIX_TIER, user, email) for user, email in result]
+        after_id = None
+
+    if len(found) <= limit and len(query) >= SEARCH_SUBSTRING_MIN_LENGTH:
+        pattern = f'%{_escape_like(query)}%'
+        statement = select(User).where(
+            or_(func.lower(User.email).like(pattern, escape='/'),
+                func.lower(User.full_name).like(pattern, escape='/')),
+            not_(prefix_match),
+        )
+        if after_id is not None:
+            statement = statement.where(User.id > after_id)
+        result = await session.execute(statement.order_by(User.id).limit(limit + 1 - len(found)))
+        found += [(SEARCH_SUBSTRING_TIER, user, None) for user in result.scalars()]
+
+    next_cursor = None
+    if len(found) > limit:
+        last_tier, last_user, last_email = found[limit - 1]
+        next_cursor = encode_search_cursor(last_tier, last_user.id, last_email)
+    return [user for _, user, _ in found[:limit]], next_cursor
@@ -0,0 +1,334 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import ARCHIVE_DIR
+from app.db import any_of
+from app.models.payments import Payment
+
+INDEX_FILE = 'index.json'
+BATCH_ROWS = 8192
+# Идентификаторы удаляемых строк передаются частями: число параметров запроса ограничено (32767 в asyncpg, столько же
+# в SQLite по умолчанию)
+DELETE_BATCH = 10_000
+
+_index_cache = {'mtime': None, 'entries': []}
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('transaction_id', pa.string()),
+        ('amount', pa.float64()),
+        ('account_id', pa.int64()),
+        ('created_at', pa.timestamp('us', tz='UTC')),
+    ])
+
+
+def _index_path(archive_dir: str) -> str:
+    return os.path.join(archive_dir, INDEX_FILE)
+
+
+def load_index(archive_dir: str = ARCHIVE_DIR) -> list:
+    """
+    Загрузка индекса архивных файлов.
+
+    Индекс хранит для каждого файла диапазоны `account_id` (для всего файла и для каждого record batch) и диапазон
+    `created_at`. Результат кешируется до изменения файла индекса.
+
+    Аргументы:
+    - archive_dir: Каталог архива.
+
+    Возвращает:
+    - list: Список записей индекса.
+    """
+    path = _index_path(archive_dir)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    if _index_cache['mtime'] != (path, mtime):
+        with open(path) as f:
+            _index_cache['entries'] = json.load(f)
+        _index_cache['mtime'] = (path, mtime)
+    return _index_cache['entries']
+
+
+def archived_until(archive_dir: str = ARCHIVE_DIR) -> datetime:
+    """
+    Время самого нового платежа, перенесенного в архив.
+
+    Аргументы:
+    - archive_dir: Каталог архива.
+
+    Возвращает:
+    - datetime: Наибольшее `created_at` по индексу архива (UTC) или None, если архив пуст.
+    """
+    entries = load_index(archive_dir)
+    if not entries:
+        return None
+    latest = max(datetime.fromisoformat(entry['created_at_max']) for entry in entries)
+    return latest if latest.tzinfo else latest.replace(tzinfo=timezone.utc)
+
+
+def _save_index(archive_dir: str, entries: list):
+    path = _index_path(archive_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(entries, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_archive_file(archive_dir: str, rows: list) -> dict:
+    """
+    Запись пачки платежей в сжатый файл Arrow IPC.
+
+    Строки сортируются по `account_id` и записываются record batch'ами по `BATCH_ROWS` строк со сжатием zstd,
+    благодаря чему при чтении можно пропускать не только файлы, но и отдельные batch'и. Файл сначала пишется
+    во временный и затем атомарно переименовывается.
+
+    Аргументы:
+    - archive_dir: Каталог архива.
+    - rows: Список строк (id, transaction_id, amount, account_id, created_at).
+
+    Возвращает:
+    - dict: Запись индекса для созданного файла.
+    """
+    import pyarrow as pa
+
+    schema = _schema()
+    ids, transaction_ids, amounts, account_ids, created = zip(*rows)
+    table = pa.table([ids, transaction_ids, amounts, account_ids, created], schema=schema).sort_by('account_id')
+
+    name = f'payments_{min(created):%Y%m%d%H%M%S}_{min(ids)}_{len(rows)}.arrow'
+    path = os.path.join(archive_dir, name)
+    options = pa.ipc.IpcWriteOptions(compression='zstd')
+    with pa.OSFile(path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=BATCH_ROWS)
+    os.replace(path + '.tmp', path)
+
+    sorted_accounts = table.column('account_id').to_pylist()
+    batches = [[sorted_accounts[start], sorted_accounts[min(start + BATCH_ROWS, len(sorted_accounts)) - 1]]
+               for start in range(0, len(sorted_accounts), BATCH_ROWS)]
+    return {
+        'file': name,
+        'rows': len(rows),
+        'account_id_min': sorted_accounts[0],
+        'account_id_max': sorted_accounts[-1],
+        'created_at_min': min(created).isoformat(),
+        'created_at_max': max(created).isoformat(),
+        'batches': batches,
+    }
+
+
+def read_archived_ids(archive_dir: str, name: str) -> list:
+    """
+    Идентификаторы платежей, записанных в архивный файл.
+
+    Аргументы:
+    - archive_dir: Каталог архива.
+    - name: Имя файла.
+
+    Возвращает:
+    - list: Идентификаторы платежей.
+    """
+    import pyarrow as pa
+
+    with pa.memory_map(os.path.join(archive_dir, name), 'r') as source:
+        return pa.ipc.open_file(source).read_all().column('id').to_pylist()
+
+
+async def _delete_archived(session: AsyncSession, ids: list, created_at_max: datetime):
+    # Граница по created_at позволяет планировщику просматривать только партиции архивируемого периода. Все части
+    # удаляются в одной транзакции
+    for start in range(0, len(ids), DELETE_BATCH):
+        await session.execute(
+            delete(Payment)
+            .where(any_of(session, Payment.id, ids[start:start + DELETE_BATCH]), Payment.created_at <= created_at_max)
+            .execution_options(synchronize_session=False)
+        )
+    await session.commit()
+
+
+def _mark_committed(archive_dir: str, names: set):
+    entries = [{key: value for key, value in entry.items() if key != 'pending'} if entry['file'] in names else entry
+               for entry in load_index(archive_dir)]
+    _save_index(archive_dir, entries)
+
+
+async def finish_pending(session: AsyncSession, archive_dir: str = ARCHIVE_DIR) -> int:
+    """
+    Завершение прерванной архивации.
+
+    Файл регистрируется в индексе с отметкой `pending` до удаления его строк из таблицы `payments`. Если процесс
+    прервался до фиксации удаления, строки таких файлов удаляются из таблицы (они уже в архиве), и отметка
+    снимается. Повторный запуск безопасен: удаление уже удаленных строк ничего не меняет.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - archive_dir: Каталог архива.
+
+    Возвращает:
+    - int: Количество завершенных файлов.
+    """
+    loop = asyncio.get_running_loop()
+    pending = [entry for entry in load_index(archive_dir) if entry.get('pending')]
+    for entry in pending:
+        ids = await loop.run_in_executor(None, read_archived_ids, archive_dir, entry['file'])
+        await _delete_archived(session, ids, datetime.fromisoformat(entry['created_at_max']))
+    if pending:
+        _mark_committed(archive_dir, {entry['file'] for entry in pending})
+    return len(pending)
+
+
+async def archive_payments(session: AsyncSession, cutoff: datetime, chunk_size: int = 100_000,
+                           archive_dir: str = ARCHIVE_DIR) -> int:
+    """
+    Перенос платежей старше `cutoff` из таблицы `payments` в архив.
+
+    Платежи выбираются пачками по `chunk_size` строк (самые старые первыми), каждая пачка записывается в отдельный
+    файл, файл регистрируется в индексе с отметкой `pending`, и только после этого строки удаляются из таблицы в
+    отдельной транзакции, а отметка снимается. Если процесс прервется между регистрацией файла и удалением, строки
+    останутся в горячей таблице (при чтении дубликаты из архива отбрасываются), а следующий запуск сначала удалит
+    их (`finish_pending`), а не заархивирует повторно в новый файл.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - cutoff: Платежи с `created_at` раньше этой даты переносятся в архив.
+    - chunk_size: Размер пачки.
+    - archive_dir: Каталог архива.
+
+    Возвращает:
+    - int: Количество перенесенных платежей.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    await finish_pending(session, archive_dir)
+    total = 0
+    while True:
+        result = await session.execute(
+            select(Payment.id, Payment.transaction_id, Payment.amount, Payment.account_id, Payment.created_at)
+            .where(Payment.created_at < cutoff)
+            .order_by(Payment.created_at, Payment.id)
+            .limit(chunk_size)
+        )
+        rows = [tuple(row) for row in result.all()]
+        if not rows:
+            return total
+
+        entry = await loop.run_in_executor(None, write_archive_file, archive_dir, rows)
+        _save_index(archive_dir, load_index(archive_dir) + [{**entry, 'pending': True}])
+
+        await _delete_archived(session, [row[0] for row in rows], max(row[4] for row in rows))
+        _mark_committed(archive_dir, {entry['file']})
+        total += len(rows)
+
+
+def _overlaps(account_ids: list, low: int, high: int) -> bool:
+    return any(low <= account_id <= high for account_id in account_ids)
+
+
+def scan_archive(account_ids: list, archive_dir: str = ARCHIVE_DIR) -> list:
+    """
+    Поиск архивных платежей по идентификаторам счетов.
+
+    По индексу отбрасываются файлы и record batch'и, диапазон `account_id` которых не содержит нужных счетов.
+    Оставшиеся файлы открываются через memory map, читаются только подходящие batch'и, строки фильтруются
+    векторно средствами pyarrow.
+
+    Аргументы:
+    - account_ids: Идентификаторы счетов.
+    - archive_dir: Каталог архива.
+
+    Возвращает:
+    - list: Список словарей с полями платежа.
+    """
+    if not account_ids:
+        return []
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    value_set = pa.array(account_ids, type=pa.int64())
+    rows = []
+    for entry in load_index(archive_dir):
+        if not _overlaps(account_ids, entry['account_id_min'], entry['account_id_max']):
+            continue
+        with pa.memory_map(os.path.join(archive_dir, entry['file']), 'r') as source:
+            reader = pa.ipc.open_file(source)
+            for number, (low, high) in enumerate(entry['batches']):
+                if not _overlaps(account_ids, low, high):
+                    continue
+                batch = reader.get_batch(number)
+                rows.extend(batch.filter(pc.is_in(batch.column('account_id'), value_set=value_set)).to_pylist())
+    return rows
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def iter_archived_batches(since: datetime = None, until: datetime = None, archive_dir: str = ARCHIVE_DIR):
+    """
+    Потоковое чтение всех архивных платежей за период (для сверки и выгрузок).
+
+    Файлы, диапазон `created_at` которых не пересекается с периодом, пропускаются по индексу; строки оставшихся
+    файлов фильтруются векторно средствами pyarrow.
+
+    Аргументы:
+    - since: Начало периода включительно (или None).
+    - until: Конец периода не включительно (или None).
+    - archive_dir: Каталог архива.
+
+    Возвращает:
+    - Генератор record batch'ей с колонками `_schema()`.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    for entry in load_index(archive_dir):
+        if since is not None and _parse_time(entry['created_at_max']) < since:
+            continue
+        if until is not None and _parse_time(entry['created_at_min']) >= until:
+            continue
+        with pa.memory_map(os.path.join(archive_dir, entry['file']), 'r') as source:
+            reader = pa.ipc.open_file(source)
+            for number in range(reader.num_record_batches):
+                batch = reader.get_batch(number)
+                created_at = batch.column('created_at')
+                if since is not None:
+                    batch = batch.filter(pc.greater_equal(created_at, pa.scalar(since, created_at.type)))
+                    created_at = batch.column('created_at')
+                if until is not None:
+                    batch = batch.filter(pc.less(created_at, pa.scalar(until, created_at.type)))
+                if batch.num_rows:
+                    yield batch
+
+
+async def get_archived_payments(account_ids: list, archive_dir: str = ARCHIVE_DIR) -> list:
+    """
+    Получение архивных платежей по идентификаторам счетов.
+
+    Чтение файлов выполняется в пуле потоков, чтобы не блокировать цикл событий. Возвращаемые объекты `Payment`
+    не привязаны к сессии и используются только для чтения.
+
+    Аргументы:
+    - account_ids: Идентификаторы счетов.
+    - archive_dir: Каталог архива.
+
+    Возвращает:
+    - list: Список объектов Payment.
+    """
+    loop = asyncio.get_running_loop()
+    rows = await loop.run_in_executor(None, scan_archive, list(account_ids), archive_dir)
+    return [Payment(**row) for row in rows]
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import LEDGER_MODE
+from app.db import is_postgres
+from app.models.account import Account
+from app.models.ledger import LedgerEntry
+from app.models.payments import Payment
+from app.models.user import User, get_pwd_context
+
+# Пользователи по умолчанию (как в миграциях с тестовыми данными) получают идентификаторы 1 и 2
+DEFAULT_USERS = (
+    ('testuser@example.com', 'Test User', False),
+    ('adminuser@example.com', 'Admin User', True),
+)
+DEFAULT_PASSWORD = '123456'
+
+
+async def load_fixtures(session: AsyncSession, users: int = 0, accounts_per_user: int = 1,
+                        payments_per_account: int = 0, password: str = DEFAULT_PASSWORD,
+                        ledger: bool = LEDGER_MODE) -> dict:
+    """
+    Загрузка тестовых данных в пустую базу пачками (по одной многострочной команде INSERT на таблицу).
+
+    Создаются пользователи по умолчанию `DEFAULT_USERS` и `users` синтетических пользователей
+    (`fixture-<id>@example.com`) с общим паролем: bcrypt вычисляется один раз, а не для каждого пользователя. У
+    каждого пользователя `accounts_per_user` счетов, у каждого счета `payments_per_account` платежей по 10.0 с
+    интервалом в минуту, заканчивающихся текущим моментом; баланс счета равен сумме его платежей. Идентификаторы
+    назначаются подряд с 1, поэтому данные детерминированы и на них можно ссылаться в проверках. В Postgres
+    последовательности идентификаторов после загрузки сдвигаются за последний идентификатор, чтобы следующие
+    вставки не конфликтовали с тестовыми данными.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - users: Количество синтетических пользователей.
+    - accounts_per_user: Количество счетов у каждого пользователя.
+    - payments_per_account: Количество платежей у каждого счета.
+    - password: Пароль всех пользователей.
+    - ledger: Если True, для платежей создаются и записи журнала операций (режим `LEDGER_MODE`).
+
+    Возвращает:
+    - dict: Количество созданных пользователей, счетов и платежей.
+    """
+    hashed_password = get_pwd_context().hash(password)
+    user_rows = [{'id': user_id, 'email': email, 'full_name': full_name, 'hashed_password': hashed_password,
+                  'is_admin': is_admin}
+                 for user_id, (email, full_name, is_admin) in enumerate(DEFAULT_USERS, start=1)]
+    first_user_id = len(user_rows) + 1
+    user_rows += [{'id': user_id, 'email': f'fixture-{user_id}@example.com', 'full_name': f'Fixture User {user_id}',
+                   'hashed_password': hashed_password, 'is_admin': False}
+                  for user_id in range(first_user_id, first_user_id + users)]
+
+    now = datetime.now(timezone.utc)
+    amount = 10.0
+    account_rows, payment_rows, ledger_rows = [], [], []
+    for user in user_rows:
+        for _ in range(accounts_per_user):
+            account_id = len(account_rows) + 1
+            account_rows.append({'id': account_id, 'balance': amount * payments_per_account, 'owner_id': user['id']})
+            for index in range(payments_per_account):
+                payment_id = len(payment_rows) + 1
+                created_at = now - timedelta(minutes=payments_per_account - index)
+                payment_rows.append({'id': payment_id, 'transaction_id': f'fixture-{payment_id}', 'amount': amount,
+                                     'account_id': account_id, 'created_at': created_at})
+                if ledger:
+                    ledger_rows.append({'account_id': account_id, 'amount': amount,
+                                        'transaction_id': f'fixture-{payment_id}', 'created_at': created_at})
+
+    for model, rows in ((User, user_rows), (Account, account_rows), (Payment, payment_rows),
+                        (LedgerEntry, ledger_rows)):
+        if rows:
+            await session.execute(insert(model), rows)
+    if is_postgres(session):
+        for model in (User, Account, Payment):
+            await session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{model.__tablename__}', 'id'), "
+                f"(SELECT coalesce(max(id), 0) + 1 FROM {model.__tablename__}), false)"
+            ))
+    await session.commit()
+    return {'users': len(user_rows), 'accounts': len(account_rows), 'payments': len(payment_rows)}
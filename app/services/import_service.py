@@ -0,0 +1,299 @@
+import asyncio
+import csv
+import json
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.config import IMPORT_BATCH_SIZE, IMPORT_HASH_WORKERS
+from app.models.user import get_pwd_context
+
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+BCRYPT_HASH_RE = re.compile(r'^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$')
+
+_hash_pool = None
+
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(max_workers=IMPORT_HASH_WORKERS)
+    return _hash_pool
+
+
+def hash_passwords(passwords: list) -> list:
+    """
+    Хеширование списка паролей (выполняется в процессе пула).
+
+    Аргументы:
+    - passwords: Список паролей в открытом виде.
+
+    Возвращает:
+    - list: Список хешей в том же порядке.
+    """
+    pwd_context = get_pwd_context()
+    return [pwd_context.hash(password) for password in passwords]
+
+
+async def hash_passwords_parallel(passwords: list) -> list:
+    """
+    Хеширование паролей, распределенное по пулу процессов.
+
+    bcrypt нагружает CPU, поэтому список делится на части по числу процессов пула, и части хешируются параллельно,
+    не блокируя цикл событий.
+
+    Аргументы:
+    - passwords: Список паролей в открытом виде.
+
+    Возвращает:
+    - list: Список хешей в том же порядке.
+    """
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    pool = _get_hash_pool()
+    step = -(-len(passwords) // IMPORT_HASH_WORKERS)
+    parts = await asyncio.gather(*[
+        loop.run_in_executor(pool, hash_passwords, passwords[start:start + step])
+        for start in range(0, len(passwords), step)
+    ])
+    return [hashed for part in parts for hashed in part]
+
+
+async def iter_lines(stream):
+    """
+    Построчное чтение потокового тела запроса.
+
+    Аргументы:
+    - stream: Поток тела запроса Sanic (`request.stream`).
+
+    Возвращает:
+    - Асинхронный генератор строк (без символов перевода строки).
+    """
+    buffer = b''
+    while True:
+        chunk = await stream.read()
+        if chunk is None:
+            break
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.rstrip(b'\r').decode('utf-8')
+    if buffer.strip():
+        yield buffer.rstrip(b'\r').decode('utf-8')
+
+
+class _LineFeed:
+    """
+    Источник строк для `csv.reader`, пополняемый по мере чтения потока.
+    """
+
+    def __init__(self):
+        self.pending = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.pending:
+            raise StopIteration
+        return self.pending.popleft()
+
+
+async def iter_rows(lines, content_type: str):
+    """
+    Разбор строк загружаемого файла в записи пользователей.
+
+    Поддерживаются CSV с заголовком (`text/csv`) и NDJSON (по одному JSON-объекту в строке). Пустые строки
+    пропускаются. Все записи CSV разбираются одним `csv.reader`; поле в кавычках может содержать переводы строк:
+    строки накапливаются, пока кавычки записи не закрыты, и номером записи считается номер ее первой строки.
+
+    Аргументы:
+    - lines: Асинхронный итератор строк.
+    - content_type: Формат загрузки (`text/csv` или NDJSON).
+
+    Возвращает:
+    - Асинхронный генератор кортежей (номер строки, запись или None, ошибка разбора или None).
+    """
+    is_csv = content_type.startswith('text/csv')
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    header = None
+    record, record_line = [], None
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if is_csv:
+            if not record:
+                if not line.strip():
+                    continue
+                record_line = line_number
+            record.append(line)
+            text = '\n'.join(record)
+            # Нечетное число кавычек: поле в кавычках продолжается на следующей строке
+            if text.count('"') % 2:
+                continue
+            record = []
+            feed.pending.append(text)
+            values = next(reader)
+            if header is None:
+                header = [value.strip() for value in values]
+                continue
+            if len(values) != len(header):
+                yield record_line, None, 'Wrong number of columns'
+                continue
+            yield record_line, dict(zip(header, values)), None
+        elif not line.strip():
+            continue
+        else:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None, 'Invalid JSON'
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, 'Invalid JSON'
+                continue
+            yield line_number, row, None
+    if record:
+        yield record_line, None, 'Unterminated quoted field'
+
+
+def validate_row(row: dict, seen_emails: set):
+    """
+    Проверка записи импортируемого пользователя.
+
+    Запись должна содержать корректный `email`, непустой `full_name` и либо `password`, либо уже готовый
+    bcrypt-хеш в `hashed_password`. Повторы `email` внутри одной загрузки отклоняются.
+
+    Аргументы:
+    - row: Запись пользователя.
+    - seen_emails: Множество уже встреченных в загрузке email (пополняется).
+
+    Возвращает:
+    - str: Сообщение об ошибке (или None, если запись корректна).
+    """
+    email = str(row.get('email') or '').strip()
+    if not EMAIL_RE.match(email):
+        return 'Invalid email'
+    if not str(row.get('full_name') or '').strip():
+        return 'Missing full_name'
+    hashed_password = row.get('hashed_password')
+    if hashed_password:
+        if not BCRYPT_HASH_RE.match(str(hashed_password)):
+            return 'Invalid hashed_password'
+    elif not row.get('password'):
+        return 'Missing password'
+    if email in seen_emails:
+        return 'Duplicate email in upload'
+    seen_emails.add(email)
+    return None
+
+
+async def _prepare_batch(batch: list) -> list:
+    plain = [(index, row['password']) for index, (_, row) in enumerate(batch) if not row.get('hashed_password')]
+    hashed = await hash_passwords_parallel([password for _, password in plain])
+    hashes = [row.get('hashed_password') for _, row in batch]
+    for (index, _), value in zip(plain, hashed):
+        hashes[index] = value
+    return [(line, str(row['email']).strip(), str(row['full_name']).strip(), hashed_password)
+            for (line, row), hashed_password in zip(batch, hashes)]
+
+
+async def _load_batch(conn, records: list) -> list:
+    """
+    Загрузка подготовленной пачки пользователей через `COPY` во временную таблицу и слияние с `users`.
+
+    Аргументы:
+    - conn: Соединение asyncpg.
+    - records: Список кортежей (номер строки, email, full_name, hashed_password).
+
+    Возвращает:
+    - list: Записи, не вставленные из-за уже существующего `email`.
+    """
+    async with conn.transaction():
+        await conn.execute("TRUNCATE users_import")
+        await conn.copy_records_to_table(
+            'users_import', records=records, columns=['line', 'email', 'full_name', 'hashed_password'])
+        inserted = await conn.fetch(
+            """
+            INSERT INTO users (email, full_name, hashed_password, is_admin)
+            SELECT email, full_name, hashed_password, FALSE FROM users_import ORDER BY line
+            ON CONFLICT (email) DO NOTHING
+            RETURNING email
+            """
+        )
+    inserted_emails = {row['email'] for row in inserted}
+    return [record for record in records if record[1] not in inserted_emails]
+
+
+async def import_users(conn, rows, report) -> dict:
+    """
+    Массовый импорт пользователей.
+
+    Записи проверяются по мере поступления, корректные накапливаются в пачки по `IMPORT_BATCH_SIZE`. Пароли пачки
+    хешируются в пуле процессов, и пока пачка хешируется, предыдущая загружается в базу, а тело запроса продолжает
+    читаться. Об ошибках в отдельных строках сообщается через `report` сразу, не дожидаясь конца загрузки.
+
+    Аргументы:
+    - conn: Соединение asyncpg.
+    - rows: Асинхронный итератор (номер строки, запись или None, ошибка разбора или None).
+    - report: Асинхронная функция, принимающая словарь с описанием ошибки строки.
+
+    Возвращает:
+    - dict: Итоги импорта (`imported`, `failed`).
+    """
+    await conn.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS users_import (
+            line INTEGER NOT NULL,
+            email VARCHAR NOT NULL,
+            full_name VARCHAR NOT NULL,
+            hashed_password VARCHAR NOT NULL
+        )
+        """
+    )
+    stats = {'imported': 0, 'failed': 0}
+    seen_emails = set()
+
+    async def load(prepared):
+        records = await prepared
+        conflicts = await _load_batch(conn, records)
+        stats['imported'] += len(records) - len(conflicts)
+        for line, email, _, _ in conflicts:
+            stats['failed'] += 1
+            await report({'line': line, 'email': email, 'error': 'User with this email already exists'})
+
+    pending = None
+
+    async def submit(batch):
+        nonlocal pending
+        previous, pending = pending, asyncio.ensure_future(_prepare_batch(batch))
+        if previous is not None:
+            await load(previous)
+
+    batch = []
+    try:
+        async for line, row, error in rows:
+            if error is None:
+                error = validate_row(row, seen_emails)
+            if error:
+                stats['failed'] += 1
+                await report({'line': line, 'email': row.get('email') if row else None, 'error': error})
+                continue
+            batch.append((line, row))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await submit(batch)
+                batch = []
+        if batch:
+            await submit(batch)
+        if pending is not None:
+            previous, pending = pending, None
+            await load(previous)
+    except BaseException:
+        # Хеширование следующей пачки не должно продолжаться после ошибки загрузки (или отключения клиента)
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        raise
+    return stats
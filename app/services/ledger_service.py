@@ -0,0 +1,202 @@
+from datetime import datetime
+
+from sqlalchemy import text, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.db import is_postgres
+from app.models.account import Account
+from app.models.ledger import LedgerEntry, BalanceSnapshot
+
+# Ключ advisory-блокировки, чтобы компактор одновременно работал только в одном воркере
+COMPACTOR_LOCK_KEY = 7_301_030
+
+
+def add_entry(session: AsyncSession, account_id: int, amount: float, transaction_id: str) -> LedgerEntry:
+    """
+    Добавление записи в журнал операций счета.
+
+    Запись только добавляется в сессию и сохраняется вместе с ближайшим commit, поэтому платеж и запись журнала
+    фиксируются одной транзакцией. Записи журнала никогда не изменяются и не удаляются.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - account_id: Идентификатор счета.
+    - amount: Сумма операции.
+    - transaction_id: Идентификатор транзакции платежной системы.
+
+    Возвращает:
+    - LedgerEntry: Созданная запись журнала.
+    """
+    entry = LedgerEntry(account_id=account_id, amount=amount, transaction_id=transaction_id)
+    session.add(entry)
+    return entry
+
+
+async def get_balance(session: AsyncSession, account_id: int, at: datetime = None) -> float:
+    """
+    Получение баланса счета на текущий момент или на момент `at`.
+
+    Баланс вычисляется как баланс ближайшего предшествующего снимка плюс сумма записей журнала, не вошедших в него
+    (после него или из транзакций, не завершенных к его созданию). Компактор регулярно создает снимки, поэтому
+    объем работы ограничен и не зависит от длины истории.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - account_id: Идентификатор счета.
+    - at: Момент времени (или None для текущего баланса).
+
+    Возвращает:
+    - float: Баланс счета.
+    """
+    snapshot_query = select(BalanceSnapshot).where(BalanceSnapshot.account_id == account_id)
+    if at is not None:
+        snapshot_query = snapshot_query.where(BalanceSnapshot.as_of <= at)
+    result = await session.execute(
+        snapshot_query.order_by(BalanceSnapshot.last_entry_id.desc(), BalanceSnapshot.xmin.desc()).limit(1))
+    snapshot = result.scalars().first()
+
+    entries_query = select(func.coalesce(func.sum(LedgerEntry.amount), 0.0)).where(LedgerEntry.account_id == account_id)
+    if snapshot is not None:
+        entries_query = entries_query.where(
+            or_(LedgerEntry.id > snapshot.last_entry_id, LedgerEntry.xact_id >= snapshot.xmin))
+    if at is not None:
+        entries_query = entries_query.where(LedgerEntry.created_at <= at)
+    delta = (await session.execute(entries_query)).scalar()
+    return (snapshot.balance if snapshot else 0.0) + delta
+
+
+async def get_current_balances(session: AsyncSession, account_ids: list) -> dict:
+    """
+    Получение текущих балансов нескольких счетов одним запросом.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - account_ids: Идентификаторы счетов.
+
+    Возвращает:
+    - dict: Словарь {идентификатор счета: баланс}.
+    """
+    if not account_ids:
+        return {}
+    if not is_postgres(session):
+        return await _get_current_balances_portable(session, account_ids)
+    result = await session.execute(text(
+        """
+        SELECT a.id,
+               coalesce(s.balance, 0) + coalesce((
+                   SELECT sum(e.amount) FROM ledger_entries e
+                   WHERE e.account_id = a.id AND (e.id > coalesce(s.last_entry_id, 0) OR e.xact_id >= s.xmin)
+               ), 0) AS balance
+        FROM accounts a
+        LEFT JOIN LATERAL (
+            SELECT balance, last_entry_id, xmin FROM balance_snapshots
+            WHERE account_id = a.id
+            ORDER BY last_entry_id DESC, xmin DESC
+            LIMIT 1
+        ) s ON true
+        WHERE a.id = ANY(:account_ids)
+        """
+    ), {'account_ids': list(account_ids)})
+    return {account_id: balance for account_id, balance in result.all()}
+
+
+async def _get_current_balances_portable(session: AsyncSession, account_ids: list) -> dict:
+    # Без LATERAL и ANY (SQLite): последний снимок счета выбирается коррелированными подзапросами
+    def latest(column):
+        return (select(column)
+                .where(BalanceSnapshot.account_id == Account.id)
+                .order_by(BalanceSnapshot.last_entry_id.desc(), BalanceSnapshot.xmin.desc())
+                .limit(1)
+                .scalar_subquery())
+
+    snapshot_balance = latest(BalanceSnapshot.balance)
+    entries = (select(func.sum(LedgerEntry.amount))
+               .where(LedgerEntry.account_id == Account.id,
+                      or_(LedgerEntry.id > func.coalesce(latest(BalanceSnapshot.last_entry_id), 0),
+                          LedgerEntry.xact_id >= latest(BalanceSnapshot.xmin)))
+               .scalar_subquery())
+    result = await session.execute(
+        select(Account.id, func.coalesce(snapshot_balance, 0.0) + func.coalesce(entries, 0.0))
+        .where(Account.id.in_(list(account_ids))))
+    return {account_id: balance for account_id, balance in result.all()}
+
+
+async def apply_current_balances(session: AsyncSession, accounts) -> None:
+    """
+    Подстановка текущих балансов из журнала в объекты счетов.
+
+    В режиме журнала `Account.balance` является лишь кешем, который обновляет компактор. Перед отдачей клиенту
+    баланс пересчитывается по журналу и записывается в объекты без пометки их измененными.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - accounts: Объекты счетов.
+    """
+    balances = await get_current_balances(session, [account.id for account in accounts])
+    for account in accounts:
+        set_committed_value(account, 'balance', balances.get(account.id, 0.0))
+
+
+async def compact_snapshots(session: AsyncSession, min_entries: int, update_cache: bool) -> int:
+    """
+    Создание снимков баланса для счетов с накопившимися записями журнала.
+
+    Для каждого счета, у которого вне последнего снимка накопилось не меньше `min_entries` записей, создается
+    новый снимок. В снимок входят только записи транзакций старше горизонта `pg_snapshot_xmin` (самой старой
+    незавершенной транзакции): такие транзакции завершены, и их записи видны. Запись транзакции, которая
+    фиксируется долго (зависший commit, переключение на реплику), получает идентификатор раньше уже вошедших в
+    снимок записей, но остается вне снимка (`xact_id >= xmin`) и учитывается в балансе как запись после него, а в
+    снимок попадает при следующей компакции после фиксации. Одновременно работает только один компактор
+    (транзакционная advisory-блокировка).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - min_entries: Минимальное число новых записей для создания снимка.
+    - update_cache: Если True, в `Account.balance` записывается баланс нового снимка.
+
+    Возвращает:
+    - int: Количество созданных снимков (или 0, если блокировку получить не удалось).
+    """
+    locked = (await session.execute(text("SELECT pg_try_advisory_xact_lock(:key)"),
+                                    {'key': COMPACTOR_LOCK_KEY})).scalar()
+    if not locked:
+        await session.rollback()
+        return 0
+
+    result = await session.execute(text(
+        """
+        WITH horizon AS (
+            SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS xmin
+        ), latest AS (
+            SELECT DISTINCT ON (account_id) account_id, last_entry_id, xmin, balance, as_of
+            FROM balance_snapshots
+            ORDER BY account_id, last_entry_id DESC, xmin DESC
+        ), pending AS (
+            SELECT e.account_id, max(e.id) AS last_entry_id, sum(e.amount) AS delta, max(e.created_at) AS as_of
+            FROM ledger_entries e
+            CROSS JOIN horizon h
+            LEFT JOIN latest l ON l.account_id = e.account_id
+            WHERE e.xact_id < h.xmin
+              AND (l.account_id IS NULL OR e.id > l.last_entry_id OR e.xact_id >= l.xmin)
+            GROUP BY e.account_id
+            HAVING count(*) >= :min_entries
+        )
+        INSERT INTO balance_snapshots (account_id, last_entry_id, xmin, balance, as_of)
+        SELECT p.account_id, greatest(p.last_entry_id, l.last_entry_id), h.xmin, coalesce(l.balance, 0) + p.delta,
+               greatest(p.as_of, l.as_of)
+        FROM pending p
+        CROSS JOIN horizon h
+        LEFT JOIN latest l ON l.account_id = p.account_id
+        RETURNING account_id, balance
+        """
+    ), {'min_entries': min_entries})
+    snapshots = result.all()
+
+    if update_cache and snapshots:
+        await session.execute(
+            text("UPDATE accounts SET balance = :balance WHERE id = :account_id"),
+            [{'account_id': account_id, 'balance': balance} for account_id, balance in snapshots])
+    await session.commit()
+    return len(snapshots)
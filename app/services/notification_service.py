@@ -0,0 +1,207 @@
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from sqlalchemy import case, delete, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import NOTIFICATION_SECRET, NOTIFICATION_MAX_ATTEMPTS
+from app.db import is_postgres
+from app.models.notification import NotificationOutbox
+from app.utils.pg_listener import notify
+
+# Канал Postgres, которым диспетчер уведомлений будится сразу после фиксации платежа
+CHANNEL = 'notification_outbox'
+EVENT_PAYMENT = 'payment.received'
+SIGNATURE_HEADER = 'X-Notification-Signature'
+
+
+def is_valid_url(url: str) -> bool:
+    """
+    Проверка адреса получателя уведомлений.
+
+    Аргументы:
+    - url: URL.
+
+    Возвращает:
+    - bool: True, если это абсолютный URL со схемой `http` или `https`.
+    """
+    try:
+        parts = urlsplit(url)
+        # Некорректный порт обнаруживается только при обращении к нему
+        parts.port
+    except ValueError:
+        return False
+    return parts.scheme in ('http', 'https') and bool(parts.hostname)
+
+
+def payment_event(user_id: int, account_id: int, transaction_id: str, amount: float, created_at: datetime) -> dict:
+    """
+    Событие о зачислении платежа для бэкенда владельца счета.
+
+    Аргументы:
+    - user_id: Идентификатор пользователя.
+    - account_id: Идентификатор счета.
+    - transaction_id: Идентификатор транзакции.
+    - amount: Сумма платежа.
+    - created_at: Время платежа.
+
+    Возвращает:
+    - dict: Событие.
+    """
+    return {
+        'type': EVENT_PAYMENT,
+        'user_id': user_id,
+        'account_id': account_id,
+        'transaction_id': transaction_id,
+        'amount': amount,
+        'created_at': created_at.isoformat(),
+    }
+
+
+def encode_batch(events: list) -> bytes:
+    return json.dumps({'events': events}, separators=(',', ':')).encode()
+
+
+def signing_key(destination: str) -> str:
+    """
+    Ключ подписи уведомлений для получателя.
+
+    Ключ выводится из `NOTIFICATION_SECRET` и URL получателя (HMAC-SHA256, hex), поэтому у каждого получателя
+    свой ключ, а раскрытие одного ключа не позволяет подделать уведомления другим получателям. Без
+    `NOTIFICATION_SECRET` выбрасывается `RuntimeError`.
+
+    Аргументы:
+    - destination: URL получателя.
+
+    Возвращает:
+    - str: Ключ подписи.
+    """
+    if not NOTIFICATION_SECRET:
+        raise RuntimeError('NOTIFICATION_SECRET is not set')
+    return hmac.new(NOTIFICATION_SECRET.encode(), destination.encode(), hashlib.sha256).hexdigest()
+
+
+def sign(body: bytes, destination: str) -> str:
+    """
+    Подпись тела уведомления (HMAC-SHA256 ключом получателя `signing_key`, hex).
+
+    Аргументы:
+    - body: Тело запроса.
+    - destination: URL получателя.
+
+    Возвращает:
+    - str: Подпись.
+    """
+    return hmac.new(signing_key(destination).encode(), body, hashlib.sha256).hexdigest()
+
+
+async def enqueue_payment(session: AsyncSession, destination: str, user_id: int, account_id: int,
+                          transaction_id: str, amount: float, created_at: datetime):
+    """
+    Постановка уведомления о платеже в очередь отправки.
+
+    Изменения не фиксируются: уведомление сохраняется вместе с платежом при ближайшем commit (и теряется вместе с
+    ним при откате), а диспетчер будится уведомлением `CHANNEL` только после фиксации.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - destination: URL получателя.
+    - user_id: Идентификатор пользователя.
+    - account_id: Идентификатор счета.
+    - transaction_id: Идентификатор транзакции.
+    - amount: Сумма платежа.
+    - created_at: Время платежа.
+    """
+    session.add(NotificationOutbox(
+        destination=destination, payload=payment_event(user_id, account_id, transaction_id, amount, created_at),
+        created_at=created_at, next_attempt_at=created_at))
+    await notify(session, CHANNEL, '')
+
+
+def _now(session: AsyncSession, seconds: float = 0):
+    # Текущее время базы данных со сдвигом. SQLite хранит время текстом в формате SQLAlchemy, и сдвинутое время
+    # записывается в том же формате, чтобы сравнение строк совпадало со сравнением времени
+    if is_postgres(session):
+        return func.now() + timedelta(seconds=seconds)
+    return func.strftime('%Y-%m-%d %H:%M:%f000', 'now', f'{seconds:+f} seconds')
+
+
+async def claim_due(session: AsyncSession, limit: int, lease: float) -> list:
+    """
+    Захват уведомлений, которые пора отправить.
+
+    Захваченные уведомления откладываются на `lease` секунд, а счетчик попыток увеличивается сразу: если воркер
+    упадет во время отправки, уведомление будет отправлено повторно после истечения аренды. Параллельные
+    диспетчеры (другие воркеры и узлы) пропускают уже захваченные строки (`FOR UPDATE SKIP LOCKED`).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - limit: Максимальное количество уведомлений.
+    - lease: Время аренды в секундах.
+
+    Возвращает:
+    - list: Строки (идентификатор, получатель, событие, номер попытки) в порядке постановки в очередь.
+    """
+    due = (select(NotificationOutbox.id)
+           .where(NotificationOutbox.failed_at.is_(None), NotificationOutbox.next_attempt_at <= _now(session))
+           .order_by(NotificationOutbox.next_attempt_at)
+           .limit(limit)
+           .with_for_update(skip_locked=True))
+    result = await session.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(due.scalar_subquery()))
+        .values(next_attempt_at=_now(session, lease), attempts=NotificationOutbox.attempts + 1)
+        .returning(NotificationOutbox.id, NotificationOutbox.destination, NotificationOutbox.payload,
+                   NotificationOutbox.attempts))
+    rows = sorted(result.all())
+    await session.commit()
+    return rows
+
+
+async def mark_delivered(session: AsyncSession, ids: list):
+    """
+    Удаление доставленных уведомлений.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - ids: Идентификаторы уведомлений.
+    """
+    await session.execute(delete(NotificationOutbox).where(NotificationOutbox.id.in_(ids)))
+    await session.commit()
+
+
+async def reschedule(session: AsyncSession, ids: list, error: str, delay: float, permanent: bool = False) -> int:
+    """
+    Перенос неудачной отправки.
+
+    Уведомления, исчерпавшие `NOTIFICATION_MAX_ATTEMPTS` попыток или отклоненные получателем окончательно,
+    помечаются `failed_at` и больше не отправляются.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - ids: Идентификаторы уведомлений.
+    - error: Описание ошибки.
+    - delay: Задержка до следующей попытки в секундах.
+    - permanent: True, если повторять отправку бессмысленно.
+
+    Возвращает:
+    - int: Количество уведомлений, помеченных `failed_at`.
+    """
+    if permanent:
+        failed_at = _now(session)
+    else:
+        failed_at = case((NotificationOutbox.attempts >= NOTIFICATION_MAX_ATTEMPTS, _now(session)), else_=None)
+    result = await session.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(ids))
+        .values(next_attempt_at=_now(session, delay), last_error=error[:500],
+                failed_at=failed_at)
+        .returning(NotificationOutbox.failed_at))
+    failed = sum(1 for (failed_at,) in result.all() if failed_at is not None)
+    await session.commit()
+    return failed
+
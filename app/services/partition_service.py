@@ -0,0 +1,150 @@
+import re
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+PARTITION_NAME_RE = re.compile(r'^payments_p(\d{4})(\d{2})$')
+
+
+def add_months(month: date, months: int) -> date:
+    """
+    Сдвигает первое число месяца на заданное количество месяцев.
+
+    Аргументы:
+    - month: Дата (используются только год и месяц).
+    - months: На сколько месяцев сдвинуть (может быть отрицательным).
+
+    Возвращает:
+    - date: Первое число получившегося месяца.
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """
+    Имя месячной партиции таблицы `payments`.
+
+    Аргументы:
+    - month: Любая дата внутри месяца.
+
+    Возвращает:
+    - str: Имя партиции вида `payments_pYYYYMM`.
+    """
+    return f'payments_p{month:%Y%m}'
+
+
+async def get_partitions(session: AsyncSession) -> list:
+    """
+    Получение списка месячных партиций таблицы `payments`.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+
+    Возвращает:
+    - list: Список кортежей (имя партиции, первое число месяца), отсортированный по месяцу.
+    """
+    result = await session.execute(text(
+        """
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'payments'
+        """
+    ))
+    partitions = []
+    for name in result.scalars():
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+async def create_partitions(session: AsyncSession, first_month: date, last_month: date) -> list:
+    """
+    Создание месячных партиций таблицы `payments` за диапазон месяцев (включительно).
+
+    Уже существующие партиции пропускаются. Партиция создается отдельной таблицей и присоединяется к `payments`
+    после того, как строки за ее месяц перенесены в нее из `payments_default` (иначе присоединение завершится
+    ошибкой); перенос и присоединение выполняются в одной транзакции.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - first_month: Любая дата внутри первого месяца.
+    - last_month: Любая дата внутри последнего месяца.
+
+    Возвращает:
+    - list: Имена созданных партиций.
+    """
+    existing = {name for name, _ in await get_partitions(session)}
+    created = []
+    start = first_month.replace(day=1)
+    while start <= last_month:
+        name = partition_name(start)
+        if name not in existing:
+            lower, upper = start.isoformat(), add_months(start, 1).isoformat()
+            await session.execute(text(
+                f"CREATE TABLE {name} (LIKE payments INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            ))
+            await session.execute(text(
+                f"""
+                WITH moved AS (
+                    DELETE FROM payments_default
+                    WHERE created_at >= '{lower}' AND created_at < '{upper}'
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+                """
+            ))
+            await session.execute(text(
+                f"ALTER TABLE payments ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+            ))
+            created.append(name)
+        start = add_months(start, 1)
+    await session.commit()
+    return created
+
+
+async def create_future_partitions(session: AsyncSession, months_ahead: int, today: date = None) -> list:
+    """
+    Создание месячных партиций таблицы `payments` на текущий и следующие месяцы.
+
+    Уже существующие партиции пропускаются, поэтому команду безопасно запускать повторно (например, по cron).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - months_ahead: На сколько месяцев вперед должны существовать партиции.
+    - today: Текущая дата (или None, чтобы взять сегодняшнюю).
+
+    Возвращает:
+    - list: Имена созданных партиций.
+    """
+    current = (today or date.today()).replace(day=1)
+    return await create_partitions(session, current, add_months(current, months_ahead))
+
+
+async def detach_old_partitions(session: AsyncSession, retain_months: int, today: date = None) -> list:
+    """
+    Отсоединение месячных партиций старше заданного срока хранения.
+
+    Отсоединенные партиции остаются в базе как обычные таблицы: их можно выгрузить в архив и удалить отдельно.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - retain_months: Сколько последних месяцев (включая текущий) оставить в таблице `payments`.
+    - today: Текущая дата (или None, чтобы взять сегодняшнюю).
+
+    Возвращает:
+    - list: Имена отсоединенных партиций.
+    """
+    cutoff = add_months((today or date.today()).replace(day=1), -(retain_months - 1))
+    detached = []
+    for name, month in await get_partitions(session):
+        if month >= cutoff:
+            break
+        await session.execute(text(f"ALTER TABLE payments DETACH PARTITION {name}"))
+        detached.append(name)
+    await session.commit()
+    return detached
@@ -1,9 +1,14 @@
+from datetime import datetime
+
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.models.account import Account
 from app.models.payments import Payment
 from app.models.user import User
+from app.services import user_service
 
 
 async def get_user_by_id(session: AsyncSession, user_id: int) -> User:
@@ -11,6 +16,7 @@ async def get_user_by_id(session: AsyncSession, user_id: int) -> User:
     Получение пользователя по его идентификатору.
 
     Выполняет запрос к базе данных для получения пользователя по предоставленному `user_id`.
+    Объединяется с одинаковыми одновременными вызовами `user_service.get_user_by_id` (single-flight).
 
     Аргументы:
     - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
@@ -19,8 +25,7 @@ async def get_user_by_id(session: AsyncSession, user_id: int) -> User:
     Возвращает:
     - User: Объект пользователя (или None, если пользователь не найден).
     """
-    result = await session.execute(select(User).where(User.id == user_id))
-    return result.scalars().first()
+    return await user_service.get_user_by_id(session, user_id)
 
 
 async def get_payment_by_transaction_id(session: AsyncSession, transaction_id: str) -> Payment:
@@ -80,7 +85,33 @@ async def create_account(session: AsyncSession, account_id: int, user_id: int) -
     return account
 
 
-async def create_payment(session: AsyncSession, transaction_id: str, amount: float, account_id: int) -> Payment:
+def add_payment(session: AsyncSession, transaction_id: str, amount: float, account_id: int,
+                created_at: datetime = None) -> Payment:
+    """
+    Добавление нового платежа в сессию.
+
+    Изменения не фиксируются: платеж сохраняется вместе с ближайшим commit, то есть в одной транзакции с балансом
+    счета, журналом и уведомлениями.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - transaction_id: Идентификатор транзакции.
+    - amount: Сумма платежа.
+    - account_id: Идентификатор счета, на который поступает платеж.
+    - created_at: Время платежа (или None, чтобы взять текущее).
+
+    Возвращает:
+    - Payment: Добавленный объект платежа.
+    """
+    payment = Payment(transaction_id=transaction_id, amount=amount, account_id=account_id)
+    if created_at is not None:
+        payment.created_at = created_at
+    session.add(payment)
+    return payment
+
+
+async def create_payment(session: AsyncSession, transaction_id: str, amount: float, account_id: int,
+                         created_at: datetime = None) -> Payment:
     """
     Создание нового платежа.
 
@@ -91,16 +122,39 @@ async def create_payment(session: AsyncSession, transaction_id: str, amount: flo
     - transaction_id: Идентификатор транзакции.
     - amount: Сумма платежа.
     - account_id: Идентификатор счета, на который поступает платеж.
+    - created_at: Время платежа (или None, чтобы взять текущее).
 
     Возвращает:
     - Payment: Созданный объект платежа.
     """
-    payment = Payment(transaction_id=transaction_id, amount=amount, account_id=account_id)
-    session.add(payment)
+    payment = add_payment(session, transaction_id, amount, account_id, created_at)
     await session.commit()
     return payment
 
 
+async def add_to_balance(session: AsyncSession, account: Account, amount: float) -> Account:
+    """
+    Увеличение баланса счета без фиксации изменений (они сохраняются вместе с ближайшим commit).
+
+    Баланс увеличивается на стороне базы данных (`UPDATE ... SET balance = balance + :amount`), а не
+    пересчитывается из прочитанного ранее значения: одновременные платежи одного счета не теряют обновления друг
+    друга. Новый баланс записывается в объект счета.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - account: Объект счета, баланс которого нужно обновить.
+    - amount: Сумма, на которую нужно увеличить баланс.
+
+    Возвращает:
+    - Account: Обновленный объект счета.
+    """
+    result = await session.execute(
+        update(Account).where(Account.id == account.id).values(balance=Account.balance + amount)
+        .returning(Account.balance).execution_options(synchronize_session=False))
+    set_committed_value(account, 'balance', result.scalar_one())
+    return account
+
+
 async def update_account_balance(session: AsyncSession, account: Account, amount: float) -> Account:
     """
     Обновление баланса счета.
@@ -115,6 +169,6 @@ async def update_account_balance(session: AsyncSession, account: Account, amount
     Возвращает:
     - Account: Обновленный объект счета.
     """
-    account.balance += amount
+    await add_to_balance(session, account, amount)
     await session.commit()
     return account
@@ -0,0 +1,138 @@
+import json
+from datetime import datetime
+
+from app.config import LEDGER_MODE
+from app.services import notification_service, stream_service
+from app.services.rollup_service import BUCKET_HOUR, BUCKET_DAY, truncate
+from app.utils import cache_invalidation
+
+# Ошибки с тем же текстом и статусом, что и у обработки вебхука через ORM
+USER_NOT_FOUND = ('User not found', 404)
+ALREADY_PROCESSED = ('Transaction already processed', 400)
+PAYMENT_FAILED = ('Failed to process payment', 500)
+
+CHECK_PAYMENT = """
+    SELECT EXISTS (SELECT 1 FROM users WHERE id = $1) AS user_exists,
+           EXISTS (SELECT 1 FROM payments WHERE transaction_id = $2) AS processed,
+           EXISTS (SELECT 1 FROM accounts WHERE id = $3 AND owner_id = $1) AS account_exists,
+           (SELECT notification_url FROM users WHERE id = $1) AS notification_url
+"""
+
+CREATE_ACCOUNT = "INSERT INTO accounts (id, balance, owner_id) VALUES ($1, 0, $2)"
+
+# Запись журнала, корзины статистики, платеж, уведомление владельцу (если задан адрес) и (вне режима журнала)
+# баланс пишутся одной командой, то есть атомарно и за один обмен с сервером. Баланс в режиме журнала — снимок
+# плюс записи журнала после него; новая запись этой же командой еще не видна, поэтому сумма платежа добавляется
+# явно.
+INSERT_PAYMENT = """
+    WITH ledger AS (
+        INSERT INTO ledger_entries (account_id, amount, transaction_id, created_at)
+        VALUES ($1, $2, $3, $4)
+    ), rollups AS (
+        INSERT INTO payment_rollups (account_id, bucket_size, bucket_start, total_amount, payment_count)
+        VALUES ($1, $7, $5, $2, 1), ($1, $8, $6, $2, 1)
+        ON CONFLICT (account_id, bucket_size, bucket_start) DO UPDATE
+        SET total_amount = payment_rollups.total_amount + excluded.total_amount,
+            payment_count = payment_rollups.payment_count + excluded.payment_count
+    ), payment AS (
+        INSERT INTO payments (transaction_id, amount, account_id, created_at)
+        VALUES ($3, $2, $1, $4)
+    ), outbox AS (
+        INSERT INTO notification_outbox (destination, payload, created_at, attempts, next_attempt_at)
+        SELECT $10::varchar, $11::json, $4, 0, $4
+        WHERE $10::varchar IS NOT NULL
+    ), updated AS (
+        UPDATE accounts SET balance = balance + $2
+        WHERE id = $1 AND NOT $9
+        RETURNING balance
+    )
+    SELECT CASE WHEN $9 THEN (
+        SELECT coalesce(s.balance, 0) + coalesce((
+                   SELECT sum(e.amount) FROM ledger_entries e
+                   WHERE e.account_id = $1 AND (e.id > coalesce(s.last_entry_id, 0) OR e.xact_id >= s.xmin)
+               ), 0) + $2
+        FROM (SELECT 1) AS one
+        LEFT JOIN LATERAL (
+            SELECT balance, last_entry_id, xmin FROM balance_snapshots
+            WHERE account_id = $1
+            ORDER BY last_entry_id DESC, xmin DESC
+            LIMIT 1
+        ) s ON true
+    ) ELSE (SELECT balance FROM updated) END AS balance
+"""
+
+PUBLISH = "SELECT pg_notify($1, $2), pg_notify($3, $4)"
+WAKE_NOTIFICATIONS = "SELECT pg_notify($1, '')"
+
+
+async def process_payment(conn, user_id: int, account_id: int, transaction_id: str, amount: float,
+                          created_at: datetime) -> (float, tuple):
+    """
+    Обработка платежа вебхука на уровне драйвера asyncpg, без ORM.
+
+    Повторяет семантику обработки через `payment_service`: проверяет пользователя и повторную транзакцию, создает
+    счет при его отсутствии, записывает платеж, запись журнала, корзины статистики и уведомление владельцу
+    (`notification_service`) и обновляет баланс (в режиме журнала `LEDGER_MODE` баланс не обновляется на месте).
+    Запросы выполняются подготовленными выражениями из кеша соединения asyncpg; проверки объединены в один
+    запрос, а запись — в одну команду. Создание счета, запись и публикация сброса кешей и события о платеже
+    (`publish_payment`) выполняются в одной транзакции: сообщения доставляются только вместе с платежом.
+
+    Аргументы:
+    - conn: Соединение asyncpg.
+    - user_id: Идентификатор пользователя.
+    - account_id: Идентификатор счета.
+    - transaction_id: Идентификатор транзакции.
+    - amount: Сумма платежа.
+    - created_at: Время платежа.
+
+    Возвращает:
+    - float: Баланс счета после платежа (или None, если произошла ошибка).
+    - tuple: Ошибка (сообщение, HTTP-статус) или None, если платеж обработан.
+    """
+    import asyncpg
+
+    check = await conn.fetchrow(CHECK_PAYMENT, user_id, transaction_id, account_id)
+    destination = check['notification_url']
+    if not check['user_exists']:
+        return None, USER_NOT_FOUND
+    if check['processed']:
+        return None, ALREADY_PROCESSED
+
+    try:
+        async with conn.transaction():
+            if not check['account_exists']:
+                await conn.execute(CREATE_ACCOUNT, account_id, user_id)
+            balance = await conn.fetchval(
+                INSERT_PAYMENT, account_id, amount, transaction_id, created_at, truncate(created_at, BUCKET_HOUR),
+                truncate(created_at, BUCKET_DAY), BUCKET_HOUR, BUCKET_DAY, LEDGER_MODE, destination,
+                json.dumps(notification_service.payment_event(user_id, account_id, transaction_id, amount,
+                                                              created_at))
+                if destination else None)
+            await publish_payment(conn, user_id, account_id, transaction_id, amount, balance)
+            if destination:
+                await conn.execute(WAKE_NOTIFICATIONS, notification_service.CHANNEL)
+    except asyncpg.IntegrityConstraintViolationError:
+        return None, PAYMENT_FAILED
+    return balance, None
+
+
+async def publish_payment(conn, user_id: int, account_id: int, transaction_id: str, amount: float,
+                          balance: float) -> None:
+    """
+    Публикация инвалидации кешей и события о платеже (одним запросом) в транзакции платежа: сообщения
+    доставляются после ее commit.
+
+    Аргументы:
+    - conn: Соединение asyncpg.
+    - user_id: Идентификатор пользователя.
+    - account_id: Идентификатор счета.
+    - transaction_id: Идентификатор транзакции.
+    - amount: Сумма платежа.
+    - balance: Баланс счета после платежа.
+    """
+    await conn.execute(
+        PUBLISH,
+        cache_invalidation.CHANNEL,
+        cache_invalidation.encode(cache_invalidation.user_key(user_id), cache_invalidation.account_key(account_id)),
+        stream_service.CHANNEL,
+        stream_service.payment_event(user_id, account_id, transaction_id, amount, balance))
@@ -0,0 +1,349 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import SECRET_KEY, ARCHIVE_DIR
+from app.models.account import Account
+from app.models.payments import Payment
+from app.services import archive_service
+from app.utils.signature import generate_signature
+
+CHUNK_ROWS = 500_000
+AMOUNT_TOLERANCE = 1e-6
+PROVIDER_COLUMNS = {
+    'transaction_id': pa.string(),
+    'amount': pa.float64(),
+    'account_id': pa.int64(),
+    'user_id': pa.int64(),
+}
+
+
+def _encode_transaction_ids(values) -> np.ndarray:
+    # Идентификаторы хранятся байтами UTF-8 фиксированной ширины, равной самому длинному идентификатору пачки.
+    # При объединении пачек NumPy приводит ширину к наибольшей, поэтому длинные идентификаторы не обрезаются
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        return pc.cast(pc.fill_null(values, ''), pa.binary()).to_numpy(zero_copy_only=False).astype(bytes)
+    return np.array([value.encode('utf-8') for value in values], dtype=bytes)
+
+
+def _hash_weights(width: int) -> np.ndarray:
+    # Вес байта зависит только от его позиции (splitmix64), поэтому хеш не зависит от ширины массива: нулевые байты
+    # дополнения ничего не добавляют, и один идентификатор попадает в одну корзину в пачках разной ширины
+    weights = np.arange(1, width + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    weights ^= weights >> np.uint64(30)
+    weights *= np.uint64(0xBF58476D1CE4E5B9)
+    weights ^= weights >> np.uint64(27)
+    return weights
+
+
+def _bucket_of(transaction_ids: np.ndarray, buckets: int) -> np.ndarray:
+    # Хеш накапливается по одному столбцу байтов: временные массивы занимают одну колонку uint64, а не матрицу
+    # строки × ширина
+    width = transaction_ids.dtype.itemsize
+    columns = transaction_ids.view(np.uint8).reshape(-1, width)
+    weights = _hash_weights(width)
+    hashes = np.zeros(len(transaction_ids), dtype=np.uint64)
+    term = np.empty_like(hashes)
+    for position in range(width):
+        np.multiply(columns[:, position], weights[position], out=term, dtype=np.uint64)
+        hashes += term
+    return (hashes % np.uint64(buckets)).astype(np.int64)
+
+
+class _Partitioner:
+    """
+    Раскладывает колонки одной стороны сверки по корзинам на диске по хешу `transaction_id`.
+
+    Каждая корзина затем помещается в память целиком, поэтому пиковое потребление памяти определяется размером
+    одной корзины и размером входной пачки, а не общим числом строк.
+    """
+
+    def __init__(self, directory: str, side: str, buckets: int):
+        self.directory = directory
+        self.side = side
+        self.buckets = buckets
+        self.chunks = 0
+        self.rows = 0
+
+    def add(self, transaction_ids, amounts, account_ids, user_ids, payment_ids=None):
+        transaction_ids = _encode_transaction_ids(transaction_ids)
+        if not len(transaction_ids):
+            return
+        amounts = np.asarray(amounts, dtype=np.float64)
+        account_ids = np.asarray(account_ids, dtype=np.int64)
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        # Идентификатор платежа в базе (-1 для строк выгрузки): по нему отбрасываются копии одного платежа из
+        # таблицы и архива
+        payment_ids = np.full(len(transaction_ids), -1, dtype=np.int64) if payment_ids is None \
+            else np.asarray(payment_ids, dtype=np.int64)
+        bucket_ids = _bucket_of(transaction_ids, self.buckets)
+        order = np.argsort(bucket_ids, kind='stable')
+        bounds = np.searchsorted(bucket_ids[order], np.arange(self.buckets + 1))
+        for bucket in range(self.buckets):
+            selected = order[bounds[bucket]:bounds[bucket + 1]]
+            if len(selected):
+                np.savez(os.path.join(self.directory, f'{self.side}_{bucket}_{self.chunks}.npz'),
+                         transaction_id=transaction_ids[selected], amount=amounts[selected],
+                         account_id=account_ids[selected], user_id=user_ids[selected],
+                         payment_id=payment_ids[selected])
+        self.chunks += 1
+        self.rows += len(transaction_ids)
+
+    def load(self, bucket: int) -> dict:
+        parts = []
+        for chunk in range(self.chunks):
+            path = os.path.join(self.directory, f'{self.side}_{bucket}_{chunk}.npz')
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    parts.append({key: data[key] for key in data.files})
+        if not parts:
+            return {'transaction_id': np.empty(0, dtype='S1'), 'amount': np.empty(0),
+                    'account_id': np.empty(0, dtype=np.int64), 'user_id': np.empty(0, dtype=np.int64),
+                    'payment_id': np.empty(0, dtype=np.int64)}
+        return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def read_provider_file(path: str, partitioner: _Partitioner):
+    """
+    Потоковое чтение выгрузки платежной системы (CSV с колонками transaction_id, amount, account_id, user_id).
+
+    Аргументы:
+    - path: Путь к CSV-файлу.
+    - partitioner: Раскладчик строк по корзинам.
+    """
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=16 << 20),
+        convert_options=pa_csv.ConvertOptions(column_types=PROVIDER_COLUMNS,
+                                              include_columns=list(PROVIDER_COLUMNS)))
+    for batch in reader:
+        partitioner.add(batch.column('transaction_id'),
+                        batch.column('amount').to_numpy(),
+                        batch.column('account_id').to_numpy(),
+                        batch.column('user_id').to_numpy())
+
+
+async def read_payments(session: AsyncSession, partitioner: _Partitioner, since: datetime = None,
+                        until: datetime = None):
+    """
+    Потоковое чтение платежей из базы данных пачками по `CHUNK_ROWS` строк (серверный курсор).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - partitioner: Раскладчик строк по корзинам.
+    - since: Начало периода включительно (или None).
+    - until: Конец периода не включительно (или None).
+    """
+    query = select(Payment.transaction_id, Payment.amount, Payment.account_id, Account.owner_id,
+                   Payment.id).join(Account)
+    if since is not None:
+        query = query.where(Payment.created_at >= since)
+    if until is not None:
+        query = query.where(Payment.created_at < until)
+    result = await session.stream(query.execution_options(yield_per=CHUNK_ROWS))
+    async for rows in result.partitions():
+        transaction_ids, amounts, account_ids, user_ids, payment_ids = zip(*rows)
+        partitioner.add(transaction_ids, amounts, account_ids, user_ids, payment_ids)
+
+
+async def read_archived_payments(session: AsyncSession, partitioner: _Partitioner, since: datetime = None,
+                                 until: datetime = None, archive_dir: str = ARCHIVE_DIR):
+    """
+    Потоковое чтение платежей, перенесенных в архив (`archive_service`), за период.
+
+    Владельцы счетов архивных платежей определяются по таблице `accounts` (-1, если счет удален).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - partitioner: Раскладчик строк по корзинам.
+    - since: Начало периода включительно (или None).
+    - until: Конец периода не включительно (или None).
+    - archive_dir: Каталог архива.
+    """
+    accounts = (await session.execute(select(Account.id, Account.owner_id).order_by(Account.id))).all()
+    known_accounts = np.array([account_id for account_id, _ in accounts], dtype=np.int64)
+    owners = np.array([owner_id for _, owner_id in accounts], dtype=np.int64)
+    for batch in archive_service.iter_archived_batches(since, until, archive_dir):
+        account_ids = batch.column('account_id').to_numpy()
+        user_ids = np.full(len(account_ids), -1, dtype=np.int64)
+        if len(known_accounts):
+            position = np.minimum(np.searchsorted(known_accounts, account_ids), len(known_accounts) - 1)
+            known = known_accounts[position] == account_ids
+            user_ids[known] = owners[position[known]]
+        partitioner.add(batch.column('transaction_id'), batch.column('amount').to_numpy(), account_ids, user_ids,
+                        batch.column('id').to_numpy())
+
+
+def _account_totals(totals: dict, account_ids: np.ndarray, amounts: np.ndarray, column: int):
+    if not len(account_ids):
+        return
+    unique, inverse = np.unique(account_ids, return_inverse=True)
+    sums = np.bincount(inverse, weights=amounts)
+    counts = np.bincount(inverse)
+    for account_id, amount, count in zip(unique.tolist(), sums.tolist(), counts.tolist()):
+        row = totals.setdefault(account_id, [0.0, 0, 0.0, 0])
+        row[column] += amount
+        row[column + 1] += count
+
+
+def drop_repeated_payments(ours: dict) -> dict:
+    """
+    Отбрасывание повторных копий одного платежа базы (строки таблицы и архива с одним идентификатором платежа,
+    например после прерванной архивации).
+
+    Аргументы:
+    - ours: Колонки платежей из базы данных.
+
+    Возвращает:
+    - dict: Колонки без повторных копий.
+    """
+    _, first = np.unique(ours['payment_id'], return_index=True)
+    if len(first) == len(ours['payment_id']):
+        return ours
+    keep = np.sort(first)
+    return {key: values[keep] for key, values in ours.items()}
+
+
+def _repeated(transaction_ids: np.ndarray) -> tuple:
+    unique, counts = np.unique(transaction_ids, return_counts=True)
+    return unique[counts > 1], counts[counts > 1]
+
+
+def reconcile_bucket(provider: dict, ours: dict) -> dict:
+    """
+    Сверка одной корзины векторными операциями NumPy.
+
+    Отсутствующие и лишние транзакции выбираются проверкой принадлежности (`np.isin`), поэтому все повторы одной
+    транзакции считаются найденными; сами повторы `transaction_id` на каждой стороне выявляются отдельно. Суммы
+    сравниваются для первой строки каждой общей транзакции (`np.intersect1d`).
+
+    Аргументы:
+    - provider: Колонки выгрузки платежной системы.
+    - ours: Колонки платежей из базы данных.
+
+    Возвращает:
+    - dict: Индексы отсутствующих у нас (`missing`), лишних (`extra`) и расходящихся по сумме (`mismatched`,
+      пары индексов) строк и повторяющиеся идентификаторы с числом повторов (`duplicates`, по сторонам).
+    """
+    _, provider_index, ours_index = np.intersect1d(
+        provider['transaction_id'], ours['transaction_id'], assume_unique=False, return_indices=True)
+    differs = np.abs(provider['amount'][provider_index] - ours['amount'][ours_index]) > AMOUNT_TOLERANCE
+
+    return {
+        'missing': np.flatnonzero(~np.isin(provider['transaction_id'], ours['transaction_id'])),
+        'extra': np.flatnonzero(~np.isin(ours['transaction_id'], provider['transaction_id'])),
+        'mismatched': (provider_index[differs], ours_index[differs]),
+        'duplicates': {'provider': _repeated(provider['transaction_id']), 'ours': _repeated(ours['transaction_id'])},
+    }
+
+
+def _decode(transaction_id: bytes) -> str:
+    return transaction_id.decode('utf-8')
+
+
+async def reconcile(session: AsyncSession, provider_path: str, out_dir: str, buckets: int = 64,
+                    since: datetime = None, until: datetime = None, archive_dir: str = ARCHIVE_DIR) -> dict:
+    """
+    Сверка выгрузки платежной системы с таблицей `payments` и архивом платежей.
+
+    Обе стороны читаются потоково и раскладываются по корзинам на диске, затем каждая корзина сверяется в памяти.
+    В каталог `out_dir` записываются:
+    - `missing.csv`, `extra.csv`, `mismatched.csv` — расхождения по транзакциям;
+    - `duplicates.csv` — идентификаторы транзакций, повторяющиеся в выгрузке или в базе;
+    - `replay.ndjson` — подписанные тела вебхуков для отсутствующих у нас транзакций;
+    - `report.json` — итоги и суммы по счетам.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - provider_path: Путь к CSV-выгрузке платежной системы.
+    - out_dir: Каталог для отчетов.
+    - buckets: Количество корзин (больше корзин — меньше потребление памяти).
+    - since: Начало сверяемого периода включительно (или None).
+    - until: Конец сверяемого периода не включительно (или None).
+    - archive_dir: Каталог архива платежей.
+
+    Возвращает:
+    - dict: Итоги сверки.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix='reconcile_', dir=out_dir)
+    try:
+        provider_side = _Partitioner(work_dir, 'provider', buckets)
+        ours_side = _Partitioner(work_dir, 'ours', buckets)
+        read_provider_file(provider_path, provider_side)
+        await read_payments(session, ours_side, since, until)
+        await read_archived_payments(session, ours_side, since, until, archive_dir)
+
+        summary = {'provider_rows': provider_side.rows, 'our_rows': 0,
+                   'missing': 0, 'extra': 0, 'mismatched': 0, 'duplicates': 0}
+        totals = {}
+        with open(os.path.join(out_dir, 'missing.csv'), 'w', newline='') as missing_file, \
+                open(os.path.join(out_dir, 'extra.csv'), 'w', newline='') as extra_file, \
+                open(os.path.join(out_dir, 'mismatched.csv'), 'w', newline='') as mismatched_file, \
+                open(os.path.join(out_dir, 'duplicates.csv'), 'w', newline='') as duplicates_file, \
+                open(os.path.join(out_dir, 'replay.ndjson'), 'w') as replay_file:
+            missing_writer = csv.writer(missing_file)
+            extra_writer = csv.writer(extra_file)
+            mismatched_writer = csv.writer(mismatched_file)
+            duplicates_writer = csv.writer(duplicates_file)
+            missing_writer.writerow(['transaction_id', 'amount', 'account_id', 'user_id'])
+            extra_writer.writerow(['transaction_id', 'amount', 'account_id', 'user_id'])
+            mismatched_writer.writerow(['transaction_id', 'provider_amount', 'our_amount', 'account_id'])
+            duplicates_writer.writerow(['side', 'transaction_id', 'count'])
+
+            for bucket in range(buckets):
+                provider = provider_side.load(bucket)
+                ours = drop_repeated_payments(ours_side.load(bucket))
+                summary['our_rows'] += len(ours['transaction_id'])
+                _account_totals(totals, provider['account_id'], provider['amount'], 0)
+                _account_totals(totals, ours['account_id'], ours['amount'], 2)
+                result = reconcile_bucket(provider, ours)
+
+                for index in result['missing'].tolist():
+                    data = {
+                        'transaction_id': _decode(provider['transaction_id'][index]),
+                        'user_id': int(provider['user_id'][index]),
+                        'account_id': int(provider['account_id'][index]),
+                        'amount': float(provider['amount'][index]),
+                    }
+                    missing_writer.writerow([data['transaction_id'], data['amount'], data['account_id'],
+                                             data['user_id']])
+                    data['signature'] = generate_signature(data, SECRET_KEY)
+                    replay_file.write(json.dumps(data) + '\n')
+                for index in result['extra'].tolist():
+                    extra_writer.writerow([_decode(ours['transaction_id'][index]), float(ours['amount'][index]),
+                                           int(ours['account_id'][index]), int(ours['user_id'][index])])
+                provider_index, ours_index = result['mismatched']
+                for p, o in zip(provider_index.tolist(), ours_index.tolist()):
+                    mismatched_writer.writerow([_decode(provider['transaction_id'][p]), float(provider['amount'][p]),
+                                                float(ours['amount'][o]), int(ours['account_id'][o])])
+
+                for side, (transaction_ids, counts) in result['duplicates'].items():
+                    for transaction_id, count in zip(transaction_ids.tolist(), counts.tolist()):
+                        duplicates_writer.writerow([side, _decode(transaction_id), count])
+                    summary['duplicates'] += len(transaction_ids)
+
+                summary['missing'] += len(result['missing'])
+                summary['extra'] += len(result['extra'])
+                summary['mismatched'] += len(provider_index)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary['accounts'] = [
+        {'account_id': account_id, 'provider_total': provider_total, 'provider_count': provider_count,
+         'our_total': our_total, 'our_count': our_count, 'difference': provider_total - our_total}
+        for account_id, (provider_total, provider_count, our_total, our_count) in sorted(totals.items())
+    ]
+    with open(os.path.join(out_dir, 'report.json'), 'w') as report_file:
+        json.dump(summary, report_file, indent=2)
+    return summary
@@ -0,0 +1,153 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.db import insert_for, is_postgres
+from app.models.token_revocation import UserTokenEpoch, RevokedToken
+from app.utils.pg_listener import notify
+from app.utils.token_revocation import CHANNEL, encode_user, encode_users, encode_jti
+
+
+async def revoke_user_tokens(session: AsyncSession, user_id: int) -> int:
+    """
+    Отзыв всех выпущенных до текущего момента токенов пользователя.
+
+    Изменения не фиксируются: отзыв сохраняется и рассылается воркерам вместе с ближайшим commit, то есть в одной
+    транзакции с изменением пользователя (удаление, смена пароля). Момент отзыва округляется вверх до секунды
+    (точность claim `iat`): токен, выпущенный в ту же секунду после отзыва, тоже будет отозван.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - user_id: Идентификатор пользователя.
+
+    Возвращает:
+    - int: Момент отзыва (секунды Unix).
+    """
+    not_before = math.ceil(datetime.now(timezone.utc).timestamp())
+    # Время изменения берется по часам базы данных: по нему идет инкрементальная синхронизация
+    statement = insert_for(session, UserTokenEpoch).values(
+        user_id=user_id, not_before=not_before, changed_at=func.now())
+    # В SQLite аналог greatest — скалярная max с несколькими аргументами
+    greatest = func.greatest if is_postgres(session) else func.max
+    await session.execute(statement.on_conflict_do_update(
+        index_elements=[UserTokenEpoch.user_id],
+        set_={'not_before': greatest(UserTokenEpoch.not_before, statement.excluded.not_before),
+              'changed_at': statement.excluded.changed_at}))
+    await notify(session, CHANNEL, encode_user(user_id, not_before))
+    return not_before
+
+
+async def revoke_users_tokens(session: AsyncSession, user_ids: list) -> int:
+    """
+    Отзыв всех выпущенных до текущего момента токенов нескольких пользователей одной командой.
+
+    Работает как `revoke_user_tokens` (изменения не фиксируются), но записывает отзывы одним многострочным upsert
+    и рассылает их несколькими уведомлениями вместо уведомления на каждого пользователя.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - user_ids: Идентификаторы пользователей.
+
+    Возвращает:
+    - int: Момент отзыва (секунды Unix).
+    """
+    not_before = math.ceil(datetime.now(timezone.utc).timestamp())
+    if not user_ids:
+        return not_before
+    statement = insert_for(session, UserTokenEpoch).values(
+        [{'user_id': user_id, 'not_before': not_before, 'changed_at': func.now()} for user_id in user_ids])
+    greatest = func.greatest if is_postgres(session) else func.max
+    await session.execute(statement.on_conflict_do_update(
+        index_elements=[UserTokenEpoch.user_id],
+        set_={'not_before': greatest(UserTokenEpoch.not_before, statement.excluded.not_before),
+              'changed_at': statement.excluded.changed_at}))
+    for payload in encode_users(user_ids, not_before):
+        await notify(session, CHANNEL, payload)
+    return not_before
+
+
+async def revoke_token(session: AsyncSession, payload: dict) -> bool:
+    """
+    Отзыв одного токена по его `jti` (выход из системы). Изменения не фиксируются.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - payload: Полезные данные декодированного токена.
+
+    Возвращает:
+    - bool: False, если у токена нет `jti` (выпущен до появления отзыва) и отозвать его отдельно нельзя.
+    """
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    statement = insert_for(session, RevokedToken).values(
+        jti=jti, user_id=payload['user_id'], expires_at=datetime.fromtimestamp(payload['exp'], timezone.utc),
+        revoked_at=func.now())
+    await session.execute(statement.on_conflict_do_nothing(index_elements=[RevokedToken.jti]))
+    await notify(session, CHANNEL, encode_jti(jti))
+    return True
+
+
+async def is_token_revoked(session: AsyncSession, payload: dict) -> bool:
+    """
+    Проверка отзыва токена по базе данных (когда состояние отзыва в памяти воркера устарело).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - payload: Полезные данные декодированного токена.
+
+    Возвращает:
+    - bool: True, если токен отозван.
+    """
+    not_before = await session.scalar(
+        select(UserTokenEpoch.not_before).where(UserTokenEpoch.user_id == payload.get('user_id')))
+    if not_before is not None and payload.get('iat', 0) < not_before:
+        return True
+    jti = payload.get('jti')
+    if jti is None:
+        return False
+    return await session.scalar(select(RevokedToken.jti).where(RevokedToken.jti == jti)) is not None
+
+
+async def get_revocations(session: AsyncSession, since: datetime = None) -> tuple:
+    """
+    Получение отзывов, измененных после заданного момента (или всех действующих).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - since: Момент, после которого искать изменения (или None для полного состояния).
+
+    Возвращает:
+    - tuple: Время базы данных на момент запроса, список пар (пользователь, `not_before`) и список `jti`
+      отозванных токенов, срок действия которых еще не истек.
+    """
+    now = (await session.execute(select(func.now()))).scalar()
+    epochs = select(UserTokenEpoch.user_id, UserTokenEpoch.not_before)
+    tokens = select(RevokedToken.jti).where(RevokedToken.expires_at > now)
+    if since is not None:
+        epochs = epochs.where(UserTokenEpoch.changed_at > since)
+        tokens = tokens.where(RevokedToken.revoked_at > since)
+    return now, list((await session.execute(epochs)).all()), list((await session.execute(tokens)).scalars())
+
+
+async def purge_expired(session: AsyncSession, max_token_age: timedelta) -> int:
+    """
+    Удаление отзывов, которые больше ничего не отклоняют: отозванных токенов с истекшим сроком действия и
+    отзывов всех токенов пользователя старше срока действия токена.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - max_token_age: Срок действия токена.
+
+    Возвращает:
+    - int: Количество удаленных записей.
+    """
+    now = datetime.now(timezone.utc)
+    tokens = await session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+    epochs = await session.execute(delete(UserTokenEpoch).where(
+        UserTokenEpoch.not_before <= int((now - max_token_age).timestamp())))
+    await session.commit()
+    return tokens.rowcount + epochs.rowcount
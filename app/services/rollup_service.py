@@ -0,0 +1,200 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, func, literal, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import ARCHIVE_DIR
+from app.db import insert_for, is_postgres
+from app.models.payments import Payment
+from app.models.rollup import PaymentRollup
+from app.services import archive_service
+
+BUCKET_HOUR = 'hour'
+BUCKET_DAY = 'day'
+
+
+def truncate(moment: datetime, bucket_size: str) -> datetime:
+    """
+    Начало часовой или суточной корзины (в UTC), в которую попадает момент времени.
+
+    Аргументы:
+    - moment: Момент времени с часовым поясом.
+    - bucket_size: `hour` или `day`.
+
+    Возвращает:
+    - datetime: Начало корзины.
+    """
+    moment = moment.astimezone(timezone.utc)
+    if bucket_size == BUCKET_DAY:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil(moment: datetime, bucket_size: str) -> datetime:
+    start = truncate(moment, bucket_size)
+    if start == moment:
+        return start
+    return start + (timedelta(days=1) if bucket_size == BUCKET_DAY else timedelta(hours=1))
+
+
+async def add_payment(session: AsyncSession, account_id: int, amount: float, created_at: datetime) -> None:
+    """
+    Инкрементальное обновление часовой и суточной корзин счета при поступлении платежа.
+
+    Изменения не фиксируются: они сохраняются вместе с ближайшим commit, то есть в одной транзакции с платежом.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - account_id: Идентификатор счета.
+    - amount: Сумма платежа.
+    - created_at: Время платежа (то же, что записывается в `Payment.created_at`).
+    """
+    for bucket_size in (BUCKET_HOUR, BUCKET_DAY):
+        statement = insert_for(session, PaymentRollup).values(
+            account_id=account_id, bucket_size=bucket_size, bucket_start=truncate(created_at, bucket_size),
+            total_amount=amount, payment_count=1)
+        await session.execute(statement.on_conflict_do_update(
+            index_elements=[PaymentRollup.account_id, PaymentRollup.bucket_size, PaymentRollup.bucket_start],
+            set_={'total_amount': PaymentRollup.total_amount + statement.excluded.total_amount,
+                  'payment_count': PaymentRollup.payment_count + statement.excluded.payment_count}))
+
+
+def _bucket_ranges(since: datetime, until: datetime) -> list:
+    """
+    Разбиение периода на минимальный набор корзин: суточные для целых дней и часовые для краев периода.
+
+    Границы периода округляются до часа (начало вниз, конец вверх). Без начала периода берутся все суточные корзины
+    до последнего (неполного) дня, а он, как и первый день, — из часовых корзин.
+
+    Возвращает:
+    - list: Список кортежей (размер корзины, начало включительно или None, конец не включительно).
+    """
+    until = _ceil(until, BUCKET_HOUR)
+    last_day = truncate(until, BUCKET_DAY)
+    if since is None:
+        ranges = [(BUCKET_DAY, None, last_day)]
+        if last_day < until:
+            ranges.append((BUCKET_HOUR, last_day, until))
+        return ranges
+    since = truncate(since, BUCKET_HOUR)
+    first_day = _ceil(since, BUCKET_DAY)
+    if first_day >= last_day:
+        return [(BUCKET_HOUR, since, until)]
+    ranges = [(BUCKET_DAY, first_day, last_day)]
+    if since < first_day:
+        ranges.append((BUCKET_HOUR, since, first_day))
+    if last_day < until:
+        ranges.append((BUCKET_HOUR, last_day, until))
+    return ranges
+
+
+async def get_stats(session: AsyncSession, account_ids: list = None, since: datetime = None,
+                    until: datetime = None) -> dict:
+    """
+    Получение статистики платежей по счетам из предагрегированных корзин.
+
+    Читается O(число корзин) строк независимо от числа платежей: целые дни берутся из суточных корзин, края
+    периода — из часовых. Без указания периода используются только суточные корзины.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - account_ids: Идентификаторы счетов (или None для всех счетов).
+    - since: Начало периода (или None, без ограничения).
+    - until: Конец периода (или None, до текущего момента).
+
+    Возвращает:
+    - dict: Общие сумма и количество платежей, суммы по счетам и объем по дням.
+    """
+    if since is None and until is None:
+        ranges = [(BUCKET_DAY, None, None)]
+    else:
+        ranges = _bucket_ranges(since, until or datetime.now(timezone.utc))
+
+    conditions = []
+    for bucket_size, start, end in ranges:
+        condition = [PaymentRollup.bucket_size == bucket_size]
+        if start is not None:
+            condition.append(PaymentRollup.bucket_start >= start)
+        if end is not None:
+            condition.append(PaymentRollup.bucket_start < end)
+        conditions.append(and_(*condition))
+    query = select(PaymentRollup).where(or_(*conditions))
+    if account_ids is not None:
+        query = query.where(PaymentRollup.account_id.in_(account_ids))
+    result = await session.execute(query)
+
+    accounts = {}
+    daily = {}
+    for rollup in result.scalars():
+        account = accounts.setdefault(rollup.account_id, {'account_id': rollup.account_id, 'total_amount': 0.0,
+                                                          'payment_count': 0})
+        account['total_amount'] += rollup.total_amount
+        account['payment_count'] += rollup.payment_count
+        day = daily.setdefault(rollup.bucket_start.date().isoformat(), {'total_amount': 0.0, 'payment_count': 0})
+        day['total_amount'] += rollup.total_amount
+        day['payment_count'] += rollup.payment_count
+
+    return {
+        'total_amount': sum(account['total_amount'] for account in accounts.values()),
+        'payment_count': sum(account['payment_count'] for account in accounts.values()),
+        'accounts': [accounts[account_id] for account_id in sorted(accounts)],
+        'daily': [{'date': date, **daily[date]} for date in sorted(daily)],
+    }
+
+
+def _bucket_start(session: AsyncSession, bucket_size: str):
+    # Начало корзины платежа на стороне базы данных. SQLite хранит время текстом в формате SQLAlchemy, и начало
+    # корзины записывается в том же формате, что и при вставке из `add_payment`
+    if is_postgres(session):
+        return func.date_trunc(bucket_size, Payment.created_at, 'UTC')
+    pattern = '%Y-%m-%d 00:00:00.000000' if bucket_size == BUCKET_DAY else '%Y-%m-%d %H:00:00.000000'
+    return func.strftime(pattern, Payment.created_at)
+
+
+async def backfill(session: AsyncSession, since: datetime, until: datetime,
+                   chunk: timedelta = timedelta(days=1), archive_dir: str = ARCHIVE_DIR) -> int:
+    """
+    Пересчет корзин по истории платежей.
+
+    Период обрабатывается частями по `chunk` целых суток, каждая часть агрегируется на стороне базы данных через
+    `INSERT ... SELECT ... GROUP BY` и фиксируется отдельной транзакцией. Значения корзин перезаписываются, поэтому
+    команду можно запускать повторно. Границы периода выравниваются на начало суток (UTC), чтобы не перезаписать
+    суточную корзину текущего дня, которую обновляют вебхуки. Агрегируется только таблица `payments`, поэтому
+    начало периода сдвигается на сутки, следующие за самым новым архивным платежом (`archive_service`): корзины
+    суток, платежи которых полностью или частично перенесены в архив, сохраняют значения, посчитанные до архивации.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - since: Начало периода.
+    - until: Конец периода (не включительно).
+    - chunk: Размер обрабатываемой за одну транзакцию части (целое число суток).
+    - archive_dir: Каталог архива платежей.
+
+    Возвращает:
+    - int: Количество записанных корзин.
+    """
+    written = 0
+    start = truncate(since, BUCKET_DAY)
+    archived_until = archive_service.archived_until(archive_dir)
+    if archived_until is not None:
+        start = max(start, truncate(archived_until, BUCKET_DAY) + timedelta(days=1))
+    until = truncate(until, BUCKET_DAY)
+    while start < until:
+        end = min(start + chunk, until)
+        for bucket_size in (BUCKET_HOUR, BUCKET_DAY):
+            bucket_start = _bucket_start(session, bucket_size)
+            aggregated = (select(Payment.account_id, literal(bucket_size), bucket_start, func.sum(Payment.amount),
+                                 func.count())
+                          .where(Payment.created_at >= start, Payment.created_at < end)
+                          .group_by(Payment.account_id, bucket_start))
+            statement = insert_for(session, PaymentRollup).from_select(
+                ['account_id', 'bucket_size', 'bucket_start', 'total_amount', 'payment_count'], aggregated)
+            result = await session.execute(statement.on_conflict_do_update(
+                index_elements=[PaymentRollup.account_id, PaymentRollup.bucket_size, PaymentRollup.bucket_start],
+                set_={'total_amount': statement.excluded.total_amount,
+                      'payment_count': statement.excluded.payment_count}))
+            written += result.rowcount
+        await session.commit()
+        start = end
+    return written
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import STREAM_QUEUE_SIZE
+from app.utils.pg_listener import listener, notify
+
+# Канал Postgres, через который события расходятся по всем воркерам и узлам
+CHANNEL = 'user_events'
+
+
+class Subscriber:
+    """
+    Подписка одного соединения на события пользователя.
+
+    События хранятся уже сериализованными строками в небольшой ограниченной очереди: медленный клиент не копит
+    память, при переполнении отбрасывается самое старое событие (актуальный баланс содержится в последнем).
+    """
+
+    __slots__ = ('queue',)
+
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    def push(self, event: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+# Подписки текущего воркера: {идентификатор пользователя: множество подписок}
+_subscribers = {}
+
+
+def subscribe(user_id: int) -> Subscriber:
+    """
+    Регистрация подписки на события пользователя.
+
+    Аргументы:
+    - user_id: Идентификатор пользователя.
+
+    Возвращает:
+    - Subscriber: Подписка, из очереди которой читаются события.
+    """
+    subscriber = Subscriber()
+    _subscribers.setdefault(user_id, set()).add(subscriber)
+    return subscriber
+
+
+def unsubscribe(user_id: int, subscriber: Subscriber):
+    """
+    Удаление подписки.
+
+    Аргументы:
+    - user_id: Идентификатор пользователя.
+    - subscriber: Подписка.
+    """
+    subscribers = _subscribers.get(user_id)
+    if subscribers is not None:
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del _subscribers[user_id]
+
+
+def dispatch(payload: str):
+    """
+    Рассылка полученного через NOTIFY события подпискам пользователя в текущем воркере.
+
+    Аргументы:
+    - payload: Событие в формате JSON (содержит `user_id`).
+    """
+    subscribers = _subscribers.get(json.loads(payload)['user_id'])
+    if subscribers:
+        for subscriber in subscribers:
+            subscriber.push(payload)
+
+
+listener.add_listener(CHANNEL, dispatch)
+
+
+def payment_event(user_id: int, account_id: int, transaction_id: str, amount: float, balance: float) -> str:
+    """
+    Сериализация события о зачисленном платеже.
+
+    Возвращает:
+    - str: Событие в компактном формате JSON.
+    """
+    return json.dumps({'type': 'payment', 'user_id': user_id, 'account_id': account_id,
+                       'transaction_id': transaction_id, 'amount': amount, 'balance': balance},
+                      separators=(',', ':'))
+
+
+async def publish_payment_event(session: AsyncSession, user_id: int, account_id: int, transaction_id: str,
+                                amount: float, balance: float) -> None:
+    """
+    Публикация события о зачисленном платеже и новом балансе счета.
+
+    Событие отправляется через `pg_notify` в транзакции платежа и доставляется слушателям всех воркеров, включая
+    текущий, только после ее commit; при откате оно отбрасывается. Изменения не фиксируются.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - user_id: Идентификатор пользователя.
+    - account_id: Идентификатор счета.
+    - transaction_id: Идентификатор транзакции.
+    - amount: Сумма платежа.
+    - balance: Баланс счета после платежа.
+    """
+    event = payment_event(user_id, account_id, transaction_id, amount, balance)
+    await notify(session, CHANNEL, event)
@@ -0,0 +1,264 @@
+import struct
+from datetime import datetime, timezone
+
+import numpy as np
+
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+COPY_TRAILER = struct.pack('>h', -1)
+
+TRANSACTION_PREFIX = b'syn'
+TRANSACTION_DIGITS = 13
+_HEX = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+_HEX_SHIFTS = np.arange(TRANSACTION_DIGITS - 1, -1, -1, dtype=np.int64) * 4
+
+# Строка бинарного формата COPY: число полей, затем для каждого поля длина и значение (big-endian, без
+# выравнивания). Все поля фиксированной ширины, поэтому пачка строк — это массив структур numpy без цикла в Python.
+PAYMENT_COLUMNS = ('id', 'transaction_id', 'amount', 'account_id', 'created_at')
+PAYMENT_ROW = np.dtype([
+    ('fields', '>i2'),
+    ('id_length', '>i4'), ('id', '>i4'),
+    ('transaction_id_length', '>i4'), ('transaction_id', f'S{len(TRANSACTION_PREFIX) + TRANSACTION_DIGITS}'),
+    ('amount_length', '>i4'), ('amount', '>f8'),
+    ('account_id_length', '>i4'), ('account_id', '>i4'),
+    ('created_at_length', '>i4'), ('created_at', '>i8'),
+])
+
+# Идентификатор записи журнала заполняется последовательностью таблицы
+LEDGER_COLUMNS = ('account_id', 'amount', 'transaction_id', 'created_at')
+LEDGER_ROW = np.dtype([
+    ('fields', '>i2'),
+    ('account_id_length', '>i4'), ('account_id', '>i4'),
+    ('amount_length', '>i4'), ('amount', '>f8'),
+    ('transaction_id_length', '>i4'), ('transaction_id', PAYMENT_ROW['transaction_id']),
+    ('created_at_length', '>i4'), ('created_at', '>i8'),
+])
+
+
+def to_pg_timestamp(moment: datetime) -> int:
+    """
+    Перевод момента времени во внутреннее представление `timestamptz` (микросекунды от 2000-01-01 UTC).
+
+    Аргументы:
+    - moment: Момент времени с часовым поясом.
+
+    Возвращает:
+    - int: Количество микросекунд.
+    """
+    delta = moment - PG_EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def zipf_cdf(count: int, exponent: float) -> np.ndarray:
+    """
+    Функция распределения ограниченного закона Ципфа: вероятность ранга `k` пропорциональна `1 / k ** exponent`.
+
+    Аргументы:
+    - count: Количество рангов.
+    - exponent: Показатель (0 — равномерное распределение, чем больше, тем сильнее перекос).
+
+    Возвращает:
+    - np.ndarray: Накопленные вероятности рангов `1..count`.
+    """
+    weights = np.arange(1, count + 1, dtype=np.float64) ** -exponent
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+    return cdf
+
+
+def transaction_ids(ids: np.ndarray) -> np.ndarray:
+    """
+    Идентификаторы транзакций синтетических платежей: префикс `syn` и номер платежа в шестнадцатеричном виде.
+
+    Аргументы:
+    - ids: Номера платежей.
+
+    Возвращает:
+    - np.ndarray: Массив байтовых строк фиксированной длины.
+    """
+    digits = _HEX[(ids.astype(np.int64)[:, None] >> _HEX_SHIFTS) & 0xF]
+    chars = np.empty((len(ids), len(TRANSACTION_PREFIX) + TRANSACTION_DIGITS), dtype=np.uint8)
+    chars[:, :len(TRANSACTION_PREFIX)] = np.frombuffer(TRANSACTION_PREFIX, dtype=np.uint8)
+    chars[:, len(TRANSACTION_PREFIX):] = digits
+    return chars.view(PAYMENT_ROW['transaction_id']).ravel()
+
+
+def generate_payments(seed: int, chunk: int, first_id: int, count: int, account_cdf: np.ndarray,
+                      accounts_by_rank: np.ndarray, since_us: int, until_us: int) -> dict:
+    """
+    Генерация пачки платежей.
+
+    Генератор случайных чисел пачки инициализируется парой (seed, номер пачки), поэтому содержимое пачки не
+    зависит от порядка и параллельности загрузки.
+
+    Аргументы:
+    - seed: Зерно генератора.
+    - chunk: Номер пачки.
+    - first_id: Номер первого платежа пачки.
+    - count: Количество платежей.
+    - account_cdf: Функция распределения рангов счетов (`zipf_cdf`).
+    - accounts_by_rank: Идентификаторы счетов в порядке убывания популярности.
+    - since_us: Начало периода (`to_pg_timestamp`).
+    - until_us: Конец периода, не включая.
+
+    Возвращает:
+    - dict: Массивы `id`, `transaction_id`, `amount`, `account_id`, `created_at`.
+    """
+    rng = np.random.default_rng([seed, chunk])
+    ids = np.arange(first_id, first_id + count, dtype=np.int64)
+    ranks = np.minimum(np.searchsorted(account_cdf, rng.random(count)), len(account_cdf) - 1)
+    return {
+        'id': ids,
+        'transaction_id': transaction_ids(ids),
+        'amount': np.round(rng.lognormal(mean=3.0, sigma=1.2, size=count) + 0.01, 2),
+        'account_id': accounts_by_rank[ranks],
+        'created_at': np.sort(rng.integers(since_us, until_us, size=count)),
+    }
+
+
+def _encode(dtype: np.dtype, columns: dict) -> bytes:
+    count = len(next(iter(columns.values())))
+    rows = np.empty(count, dtype=dtype)
+    rows['fields'] = len(columns)
+    for name, values in columns.items():
+        rows[f'{name}_length'] = dtype[name].itemsize
+        rows[name] = values
+    return b''.join((COPY_HEADER, rows.tobytes(), COPY_TRAILER))
+
+
+def encode_payments(payments: dict) -> bytes:
+    """
+    Кодирование пачки платежей в бинарный формат `COPY` (колонки `PAYMENT_COLUMNS`).
+
+    Аргументы:
+    - payments: Пачка платежей (`generate_payments`).
+
+    Возвращает:
+    - bytes: Данные для `COPY ... FROM STDIN (FORMAT binary)`.
+    """
+    return _encode(PAYMENT_ROW, {name: payments[name] for name in PAYMENT_COLUMNS})
+
+
+def encode_ledger_entries(payments: dict) -> bytes:
+    """
+    Кодирование записей журнала, соответствующих пачке платежей, в бинарный формат `COPY` (`LEDGER_COLUMNS`).
+
+    Аргументы:
+    - payments: Пачка платежей (`generate_payments`).
+
+    Возвращает:
+    - bytes: Данные для `COPY ... FROM STDIN (FORMAT binary)`.
+    """
+    return _encode(LEDGER_ROW, {name: payments[name] for name in LEDGER_COLUMNS})
+
+
+async def get_next_id(conn, table: str) -> int:
+    """
+    Первый свободный идентификатор таблицы: больше и существующих строк, и выданных последовательностью.
+
+    Аргументы:
+    - conn: Соединение asyncpg.
+    - table: Имя таблицы с последовательностью `<table>_id_seq`.
+
+    Возвращает:
+    - int: Идентификатор.
+    """
+    return await conn.fetchval(
+        f"SELECT GREATEST((SELECT coalesce(max(id), 0) FROM {table}), (SELECT last_value FROM {table}_id_seq)) + 1"
+    )
+
+
+async def advance_sequence(conn, table: str, last_id: int):
+    """
+    Сдвиг последовательности `<table>_id_seq` за последний загруженный идентификатор.
+
+    Аргументы:
+    - conn: Соединение asyncpg.
+    - table: Имя таблицы.
+    - last_id: Последний загруженный идентификатор.
+    """
+    await conn.execute(
+        f"SELECT setval('{table}_id_seq', GREATEST($1::bigint, (SELECT last_value FROM {table}_id_seq)))", last_id
+    )
+
+
+async def copy_users(conn, first_id: int, count: int, hashed_password: str):
+    """
+    Загрузка синтетических пользователей через `COPY`.
+
+    Аргументы:
+    - conn: Соединение asyncpg.
+    - first_id: Идентификатор первого пользователя.
+    - count: Количество пользователей.
+    - hashed_password: Общий для всех пользователей хеш пароля.
+    """
+    await conn.copy_records_to_table(
+        'users',
+        records=((user_id, f'synthetic-{user_id}@example.com', f'Synthetic User {user_id}', hashed_password, False)
+                 for user_id in range(first_id, first_id + count)),
+        columns=['id', 'email', 'full_name', 'hashed_password', 'is_admin'],
+    )
+
+
+async def copy_accounts(conn, first_id: int, first_user_id: int, users: int, accounts_per_user: int):
+    """
+    Загрузка синтетических счетов пользователей `first_user_id..first_user_id + users - 1` через `COPY`: у каждого
+    пользователя `accounts_per_user` счетов с идентификаторами подряд. Балансы нулевые до `update_balances`.
+
+    Аргументы:
+    - conn: Соединение asyncpg.
+    - first_id: Идентификатор первого счета первого пользователя.
+    - first_user_id: Идентификатор первого пользователя.
+    - users: Количество пользователей.
+    - accounts_per_user: Количество счетов у каждого пользователя.
+    """
+    await conn.copy_records_to_table(
+        'accounts',
+        records=((first_id + offset, 0.0, first_user_id + offset // accounts_per_user)
+                 for offset in range(users * accounts_per_user)),
+        columns=['id', 'balance', 'owner_id'],
+    )
+
+
+async def copy_payments(conn, payments: dict, ledger: bool = False):
+    """
+    Загрузка пачки платежей (и, при `ledger=True`, соответствующих записей журнала) через бинарный `COPY`.
+
+    Аргументы:
+    - conn: Соединение asyncpg.
+    - payments: Пачка платежей (`generate_payments`).
+    - ledger: True, чтобы загрузить записи журнала.
+    """
+    await conn.copy_to_table('payments', source=encode_payments(payments), columns=PAYMENT_COLUMNS,
+                             format='binary')
+    if ledger:
+        await conn.copy_to_table('ledger_entries', source=encode_ledger_entries(payments), columns=LEDGER_COLUMNS,
+                                 format='binary')
+
+
+async def update_balances(conn, first_account_id: int, last_account_id: int) -> int:
+    """
+    Пересчет балансов синтетических счетов по загруженным платежам одним запросом.
+
+    Аргументы:
+    - conn: Соединение asyncpg.
+    - first_account_id: Первый синтетический счет.
+    - last_account_id: Последний синтетический счет.
+
+    Возвращает:
+    - int: Количество обновленных счетов.
+    """
+    status = await conn.execute(
+        """
+        UPDATE accounts SET balance = totals.amount
+        FROM (
+            SELECT account_id, sum(amount) AS amount
+            FROM payments
+            WHERE account_id BETWEEN $1 AND $2
+            GROUP BY account_id
+        ) totals
+        WHERE accounts.id = totals.account_id
+        """,
+        first_account_id, last_account_id,
+    )
+    return int(status.split()[-1])
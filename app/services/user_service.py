@@ -1,12 +1,19 @@
+from datetime import datetime
 from typing import Any, Sequence
 
 from sqlalchemy import Row, RowMapping
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.config import LEDGER_MODE
 from app.models.account import Account
 from app.models.payments import Payment
 from app.models.user import User
+from app.services import archive_service, ledger_service
+from app.utils.single_flight import get_group, run_shared
+
+# Одинаковые одновременные чтения (например, при массовом переподключении клиентов) выполняются одним запросом
+_reads = get_group('user_reads')
 
 
 async def get_user_by_id(session: AsyncSession, user_id: int) -> User:
@@ -14,6 +21,7 @@ async def get_user_by_id(session: AsyncSession, user_id: int) -> User:
     Получение пользователя по его идентификатору.
 
     Выполняет запрос к базе данных для получения пользователя по предоставленному `user_id`.
+    Одинаковые одновременные вызовы в воркере объединяются в один запрос (single-flight).
 
     Аргументы:
     - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
@@ -22,6 +30,10 @@ async def get_user_by_id(session: AsyncSession, user_id: int) -> User:
     Возвращает:
     - User: Объект пользователя (или None, если пользователь не найден).
     """
+    return await run_shared(_reads, ('user', user_id), session, _get_user_by_id, user_id)
+
+
+async def _get_user_by_id(session: AsyncSession, user_id: int) -> User:
     result = await session.execute(select(User).where(User.id == user_id))
     return result.scalars().first()
 
@@ -31,6 +43,8 @@ async def get_accounts_by_user_id(session: AsyncSession, user_id: int) -> Sequen
     Получение счетов пользователя по его идентификатору.
 
     Выполняет запрос к базе данных для получения всех счетов пользователя по предоставленному `user_id`.
+    В режиме журнала (`LEDGER_MODE`) балансы счетов вычисляются по журналу операций.
+    Одинаковые одновременные вызовы в воркере объединяются в один запрос (single-flight).
 
     Аргументы:
     - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
@@ -39,23 +53,110 @@ async def get_accounts_by_user_id(session: AsyncSession, user_id: int) -> Sequen
     Возвращает:
     - Sequence[Row[Any] | RowMapping | Any]: Список объектов счетов пользователя (или пустой список, если счета не найдены).
     """
+    return await run_shared(_reads, ('accounts', user_id), session, _get_accounts_by_user_id, user_id)
+
+
+async def _get_accounts_by_user_id(session: AsyncSession, user_id: int) -> Sequence[Row[Any] | RowMapping | Any]:
     result = await session.execute(select(Account).where(Account.owner_id == user_id))
-    return result.scalars().all()
+    accounts = result.scalars().all()
+    if LEDGER_MODE:
+        await ledger_service.apply_current_balances(session, accounts)
+    return accounts
+
+
+async def get_account_ids_by_user_id(session: AsyncSession, user_id: int) -> list:
+    """
+    Получение идентификаторов счетов пользователя.
+
+    Одинаковые одновременные вызовы в воркере объединяются в один запрос (single-flight).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - user_id: Идентификатор пользователя.
+
+    Возвращает:
+    - list: Список идентификаторов счетов (или пустой список, если счета не найдены).
+    """
+    return await run_shared(_reads, ('account_ids', user_id), session, _get_account_ids_by_user_id, user_id)
+
+
+async def _get_account_ids_by_user_id(session: AsyncSession, user_id: int) -> list:
+    result = await session.execute(select(Account.id).where(Account.owner_id == user_id))
+    return list(result.scalars().all())
+
+
+async def get_account_by_id_and_user_id(session: AsyncSession, account_id: int, user_id: int) -> Account:
+    """
+    Получение счета по его идентификатору и идентификатору пользователя.
+
+    Выполняет запрос к базе данных для получения счета по предоставленным `account_id` и `user_id`.
+    Одинаковые одновременные вызовы в воркере объединяются в один запрос (single-flight).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - account_id: Идентификатор счета.
+    - user_id: Идентификатор пользователя.
+
+    Возвращает:
+    - Account: Объект счета (или None, если счет не найден).
+    """
+    return await run_shared(_reads, ('account', account_id, user_id), session, _get_account_by_id_and_user_id,
+                            account_id, user_id)
+
+
+async def _get_account_by_id_and_user_id(session: AsyncSession, account_id: int, user_id: int) -> Account:
+    result = await session.execute(
+        select(Account).where(Account.id == account_id, Account.owner_id == user_id))
+    return result.scalars().first()
 
 
-async def get_payments_by_user_id(session: AsyncSession, user_id: int) -> Sequence[Row[Any] | RowMapping | Any]:
+async def get_payments_by_user_id(session: AsyncSession, user_id: int, since: datetime = None,
+                                  until: datetime = None,
+                                  include_archived: bool = False) -> Sequence[Row[Any] | RowMapping | Any]:
     """
     Получение платежей пользователя по его идентификатору.
 
     Выполняет запрос к базе данных для получения всех платежей пользователя по предоставленному `user_id`,
-    включая данные связанных счетов.
+    включая данные связанных счетов. Таблица `payments` партиционирована по `created_at`, поэтому при указании
+    границ периода планировщик просматривает только партиции, пересекающиеся с этим периодом.
+    Одинаковые одновременные вызовы в воркере объединяются в один запрос (single-flight).
 
     Аргументы:
     - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
     - user_id: Идентификатор пользователя.
+    - since: Начало периода включительно (или None, без ограничения).
+    - until: Конец периода не включительно (или None, без ограничения).
+    - include_archived: Если True, к платежам из базы добавляются платежи, перенесенные в архив.
 
     Возвращает:
     - Sequence[Row[Any] | RowMapping | Any]: Список объектов платежей пользователя (или пустой список, если платежи не найдены).
     """
-    result = await session.execute(select(Payment).join(Account).where(Account.owner_id == user_id))
-    return result.scalars().all()
+    return await run_shared(_reads, ('payments', user_id, since, until, include_archived), session,
+                            _get_payments_by_user_id, user_id, since, until, include_archived)
+
+
+async def _get_payments_by_user_id(session: AsyncSession, user_id: int, since: datetime = None,
+                                   until: datetime = None,
+                                   include_archived: bool = False) -> Sequence[Row[Any] | RowMapping | Any]:
+    query = select(Payment).join(Account).where(Account.owner_id == user_id)
+    if since is not None:
+        query = query.where(Payment.created_at >= since)
+    if until is not None:
+        query = query.where(Payment.created_at < until)
+    result = await session.execute(query)
+    payments = result.scalars().all()
+    if not include_archived:
+        return payments
+
+    account_ids = await _get_account_ids_by_user_id(session, user_id)
+    # Платеж может одновременно оказаться в таблице и в архиве (или в двух архивных файлах) после прерванной
+    # архивации: каждая транзакция возвращается один раз, приоритет у строки из таблицы
+    seen = {payment.transaction_id for payment in payments}
+    archived = []
+    for payment in await archive_service.get_archived_payments(account_ids):
+        if payment.transaction_id in seen:
+            continue
+        if (since is None or payment.created_at >= since) and (until is None or payment.created_at < until):
+            seen.add(payment.transaction_id)
+            archived.append(payment)
+    return list(payments) + archived
@@ -0,0 +1,26 @@
+import asyncio
+
+from sanic.log import logger
+
+from app.config import LEDGER_MODE, LEDGER_COMPACT_INTERVAL, LEDGER_SNAPSHOT_MIN_ENTRIES
+from app.db import get_db
+from app.services import ledger_service
+
+
+async def run_ledger_compactor():
+    """
+    Фоновая задача, периодически создающая снимки балансов по журналу операций.
+
+    Запускается в каждом воркере, но благодаря advisory-блокировке за один проход снимки создает только один
+    из них. Ошибки логируются и не останавливают задачу.
+    """
+    while True:
+        await asyncio.sleep(LEDGER_COMPACT_INTERVAL)
+        try:
+            async with get_db() as session:
+                created = await ledger_service.compact_snapshots(
+                    session, LEDGER_SNAPSHOT_MIN_ENTRIES, update_cache=LEDGER_MODE)
+            if created:
+                logger.info('Ledger compactor created %d balance snapshots', created)
+        except Exception:
+            logger.exception('Ledger compaction failed')
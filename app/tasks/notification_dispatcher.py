@@ -0,0 +1,149 @@
+import asyncio
+import math
+import random
+
+from sanic.log import logger
+
+from app.config import (NOTIFICATION_BATCH_WINDOW, NOTIFICATION_BATCH_SIZE, NOTIFICATION_CLAIM_SIZE,
+                        NOTIFICATION_CONCURRENCY, NOTIFICATION_CONNECTIONS_PER_DESTINATION, NOTIFICATION_TIMEOUT,
+                        NOTIFICATION_RETRY_BASE, NOTIFICATION_RETRY_MAX, NOTIFICATION_POLL_INTERVAL)
+from app.db import get_db
+from app.services import notification_service
+from app.utils.http_pool import HttpPools
+from app.utils.pg_listener import listener
+
+# Аренда захваченных уведомлений покрывает худший случай: каждое уведомление захвата — отдельный пакет, и
+# пакеты отправляются волнами по `NOTIFICATION_CONCURRENCY` с таймаутом каждой
+LEASE = NOTIFICATION_TIMEOUT * (math.ceil(NOTIFICATION_CLAIM_SIZE / NOTIFICATION_CONCURRENCY) + 1)
+
+pools = HttpPools(NOTIFICATION_CONNECTIONS_PER_DESTINATION)
+_wake = asyncio.Event()
+_concurrency = asyncio.Semaphore(NOTIFICATION_CONCURRENCY)
+_stats = {'claimed': 0, 'batches': 0, 'delivered': 0, 'retried': 0, 'failed': 0, 'in_flight': 0}
+
+
+def _retry_delay(attempts: int, retry_after: str = None) -> float:
+    # Экспоненциальная задержка со случайным разбросом, чтобы повторы к одному получателю не шли волной
+    delay = min(NOTIFICATION_RETRY_MAX, NOTIFICATION_RETRY_BASE * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, min(NOTIFICATION_RETRY_MAX, int(retry_after)))
+    return delay
+
+
+async def deliver(destination: str, rows: list) -> bool:
+    """
+    Отправка пакета уведомлений одному получателю и запись результата.
+
+    Пакет отправляется одним запросом `POST` с телом `{"events": [...]}` и подписью тела в заголовке
+    `X-Notification-Signature`. Ответ 2xx удаляет уведомления из очереди; ответ 4xx (кроме 408 и 429) означает,
+    что получатель отклоняет пакет окончательно; остальные ответы и сетевые ошибки переносят отправку с
+    экспоненциальной задержкой (с учетом заголовка `Retry-After`).
+
+    Аргументы:
+    - destination: URL получателя.
+    - rows: Захваченные уведомления (идентификатор, получатель, событие, номер попытки).
+
+    Возвращает:
+    - bool: True, если пакет доставлен.
+    """
+    ids = [row[0] for row in rows]
+    body = notification_service.encode_batch([row[2] for row in rows])
+    headers = {'Content-Type': 'application/json',
+               notification_service.SIGNATURE_HEADER: notification_service.sign(body, destination)}
+    status, response_headers, error = None, {}, None
+    try:
+        pool, target = pools.get(destination)
+    except ValueError as exc:
+        pool, target, error = None, None, str(exc)
+
+    if pool is not None:
+        async with _concurrency:
+            _stats['in_flight'] += 1
+            try:
+                async with asyncio.timeout(NOTIFICATION_TIMEOUT):
+                    status, response_headers, _body = await pool.request('POST', target, headers, body)
+            except (OSError, TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                    ValueError) as exc:
+                error = f'{type(exc).__name__}: {exc}'
+            finally:
+                _stats['in_flight'] -= 1
+    _stats['batches'] += 1
+
+    async with get_db() as session:
+        if status is not None and 200 <= status < 300:
+            await notification_service.mark_delivered(session, ids)
+            _stats['delivered'] += len(ids)
+            return True
+        if status is not None:
+            error = f'HTTP {status}'
+        permanent = pool is None or (status is not None and 400 <= status < 500 and status not in (408, 429))
+        delay = _retry_delay(max(row[3] for row in rows), response_headers.get('retry-after'))
+        failed = await notification_service.reschedule(session, ids, error, delay, permanent=permanent)
+    _stats['failed'] += failed
+    _stats['retried'] += len(ids) - failed
+    logger.warning('Notification batch of %d to %s failed: %s', len(ids), destination, error)
+    return False
+
+
+async def dispatch_due() -> int:
+    """
+    Захват уведомлений, которые пора отправить, и их отправка пакетами по получателям.
+
+    Уведомления одного получателя объединяются в пакеты до `NOTIFICATION_BATCH_SIZE` событий; пакеты разных
+    получателей отправляются параллельно (не больше `NOTIFICATION_CONCURRENCY` запросов одновременно) через
+    keep-alive соединения пула получателя.
+
+    Возвращает:
+    - int: Количество захваченных уведомлений.
+    """
+    async with get_db() as session:
+        rows = await notification_service.claim_due(session, NOTIFICATION_CLAIM_SIZE, LEASE)
+    _stats['claimed'] += len(rows)
+
+    by_destination = {}
+    for row in rows:
+        by_destination.setdefault(row[1], []).append(row)
+    batches = [(destination, destination_rows[start:start + NOTIFICATION_BATCH_SIZE])
+               for destination, destination_rows in by_destination.items()
+               for start in range(0, len(destination_rows), NOTIFICATION_BATCH_SIZE)]
+    results = await asyncio.gather(*(deliver(destination, batch) for destination, batch in batches),
+                                   return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            # Уведомления пакета остаются захваченными и будут отправлены повторно после истечения аренды
+            logger.error('Notification batch failed', exc_info=result)
+    return len(rows)
+
+
+async def run_notification_dispatcher():
+    """
+    Фоновая задача, отправляющая уведомления о платежах получателям (`dispatch_due`).
+
+    Диспетчер будится уведомлением Postgres после фиксации платежа или раз в `NOTIFICATION_POLL_INTERVAL` секунд
+    (повторы по расписанию и потерянные уведомления), затем ждет `NOTIFICATION_BATCH_WINDOW` секунд, чтобы
+    собрать платежи в пакеты, и отправляет очередь, пока она не опустеет. Ошибки логируются и не останавливают
+    задачу. Без `NOTIFICATION_SECRET` задача не запускается (`RuntimeError`): уведомления остаются в очереди.
+    """
+    if not notification_service.NOTIFICATION_SECRET:
+        raise RuntimeError('NOTIFICATION_SECRET is not set')
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), NOTIFICATION_POLL_INTERVAL)
+        except TimeoutError:
+            pass
+        _wake.clear()
+        await asyncio.sleep(NOTIFICATION_BATCH_WINDOW)
+        try:
+            while await dispatch_due() == NOTIFICATION_CLAIM_SIZE:
+                pass
+            pools.prune()
+        except Exception:
+            logger.exception('Notification dispatch failed')
+
+
+def get_metrics() -> dict:
+    return {**_stats, 'destinations': pools.get_metrics()}
+
+
+listener.add_listener(notification_service.CHANNEL, lambda _payload: _wake.set())
+listener.on_reconnect(_wake.set)
@@ -0,0 +1,52 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from sanic.log import logger
+
+from app.config import (TOKEN_REVOCATION_SYNC_INTERVAL, TOKEN_REVOCATION_SYNC_LOOKBACK,
+                        TOKEN_REVOCATION_FULL_RELOAD)
+from app.db import get_db
+from app.services import revocation_service
+from app.utils.jwt import TOKEN_LIFETIME
+from app.utils.token_revocation import revocations
+
+_since = None
+
+
+async def sync_revocations() -> bool:
+    """
+    Синхронизация состояния отзыва токенов воркера с базой данных.
+
+    Полное состояние загружается при первом вызове, после переподключения слушателя уведомлений и раз в
+    `TOKEN_REVOCATION_FULL_RELOAD` секунд (заодно удаляются истекшие отзывы); в остальных случаях загружаются
+    только изменения. Транзакции фиксируются не в порядке своего начала, поэтому изменения запрашиваются с
+    запасом `TOKEN_REVOCATION_SYNC_LOOKBACK` секунд; повторное применение отзыва ничего не меняет.
+
+    Возвращает:
+    - bool: True, если загружено полное состояние.
+    """
+    global _since
+    full = (revocations.stale or revocations.full_reload_at is None
+            or time.time() - revocations.full_reload_at >= TOKEN_REVOCATION_FULL_RELOAD)
+    async with get_db() as session:
+        if full:
+            await revocation_service.purge_expired(session, TOKEN_LIFETIME)
+        now, epochs, jtis = await revocation_service.get_revocations(session, None if full else _since)
+    revocations.apply(epochs, jtis, full=full)
+    _since = now - timedelta(seconds=TOKEN_REVOCATION_SYNC_LOOKBACK)
+    return full
+
+
+async def run_token_revocation_sync():
+    """
+    Фоновая задача, периодически синхронизирующая состояние отзыва токенов воркера (`sync_revocations`).
+    Ошибки логируются и не останавливают задачу; до восстановления базы данных действует последнее известное
+    состояние.
+    """
+    while True:
+        try:
+            await sync_revocations()
+        except Exception:
+            logger.exception('Token revocation sync failed')
+        await asyncio.sleep(TOKEN_REVOCATION_SYNC_INTERVAL)
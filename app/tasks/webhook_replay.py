@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from sanic.log import logger
+
+from app.config import WEBHOOK_REPLAY_INTERVAL
+from app.controllers.payment_controller import process_webhook
+from app.schemas import WebhookPayload
+from app.services.raw_payment_service import ALREADY_PROCESSED
+from app.utils.degraded_mode import database_budget, DatabaseUnavailable
+from app.utils.lock_striping import account_locks
+from app.utils.webhook_spool import spool
+
+
+async def replay_spool() -> int:
+    """
+    Применение вебхуков из локальной очереди в порядке поступления.
+
+    Очередь воспроизводит только воркер, получивший ее блокировку. Проход прерывается, как только база данных
+    снова оказывается недоступной. Повторное применение безопасно: платеж, баланс, журнал и корзины статистики
+    фиксируются одной транзакцией (`process_webhook`), поэтому уже обработанная транзакция (например, если ответ
+    базы данных был потерян после commit) означает, что платеж применен полностью, и вебхук просто удаляется из
+    очереди. Вебхуки, которые завершились другой ошибкой (пользователь не найден, ошибка записи), переносятся в
+    `failed` для разбора.
+
+    Возвращает:
+    - int: Количество примененных вебхуков.
+    """
+    if not spool.pending():
+        return 0
+    replayed = 0
+    with spool.lock() as locked:
+        if not locked:
+            return 0
+        for name in spool.pending():
+            try:
+                data = WebhookPayload(**spool.read(name))
+            except (ValueError, TypeError):
+                logger.error('Unreadable spooled webhook %s, moved to %s', name, spool.failed_directory)
+                spool.reject(name)
+                continue
+            try:
+                async with account_locks.hold(data.account_id), database_budget():
+                    result = await process_webhook(data)
+            except DatabaseUnavailable:
+                break
+            if result.status == 200:
+                replayed += 1
+            elif (json.loads(result.body)['message'], result.status) != ALREADY_PROCESSED:
+                logger.error('Spooled transaction %s failed with status %d, moved to %s',
+                             data.transaction_id, result.status, spool.failed_directory)
+                spool.reject(name)
+                continue
+            spool.remove(name)
+    return replayed
+
+
+async def run_webhook_replay():
+    """
+    Фоновая задача, периодически применяющая вебхуки, принятые в локальную очередь при недоступности базы данных.
+    Ошибки логируются и не останавливают задачу.
+    """
+    while True:
+        await asyncio.sleep(WEBHOOK_REPLAY_INTERVAL)
+        try:
+            replayed = await replay_spool()
+            if replayed:
+                logger.info('Replayed %d spooled webhooks', replayed)
+        except Exception:
+            logger.exception('Webhook spool replay failed')
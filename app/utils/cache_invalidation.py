@@ -0,0 +1,202 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import CACHE_INVALIDATION_COALESCE, CACHE_MAX_ENTRIES
+from app.utils.pg_listener import listener, notify
+
+# Канал Postgres, через который сообщения об инвалидации расходятся по всем воркерам и узлам
+CHANNEL = 'cache_invalidation'
+# Сообщение о полном сбросе всех кешей
+FLUSH_ALL = '*'
+# Ограничение полезной нагрузки NOTIFY (8000 байт) с запасом
+MAX_PAYLOAD = 7900
+
+
+def user_key(user_id: int) -> str:
+    return f'user:{user_id}'
+
+
+def account_key(account_id: int) -> str:
+    return f'account:{account_id}'
+
+
+class InvalidatingCache:
+    """
+    Кеш в памяти процесса, записи которого сбрасываются по ключам инвалидации (`user:42`, `account:7`).
+
+    Каждая запись помечается одним или несколькими ключами инвалидации; по умолчанию ключом служит сам ключ записи.
+    Размер ограничен `max_entries`: при переполнении вытесняются самые старые записи. Кеш регистрируется в шине
+    при создании.
+
+    Аргументы:
+    - max_entries: Максимальное количество записей.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = {}
+        self._tags = {}
+        register_cache(self)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, tags: tuple = None):
+        """
+        Сохранение записи.
+
+        Аргументы:
+        - key: Ключ записи.
+        - value: Значение.
+        - tags: Ключи инвалидации записи (или None, если ключом инвалидации служит ключ записи).
+        """
+        self.pop(key)
+        while len(self._data) >= self.max_entries:
+            self.pop(next(iter(self._data)))
+        tags = (key,) if tags is None else tuple(tags)
+        self._data[key] = (value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+    def pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tags):
+        """
+        Сброс записей, помеченных любым из ключей инвалидации.
+
+        Аргументы:
+        - tags: Ключи инвалидации.
+        """
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self.pop(key)
+
+    def clear(self):
+        self._data.clear()
+        self._tags.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_caches = []
+_pending = set()
+_flush_scheduled = False
+
+
+def register_cache(cache):
+    """
+    Регистрация кеша в шине инвалидации.
+
+    Аргументы:
+    - cache: Объект с методами `invalidate(tags)` и `clear()`.
+    """
+    _caches.append(cache)
+
+
+def flush_all():
+    """
+    Полный сброс всех зарегистрированных кешей текущего воркера и накопленных ключей.
+    """
+    global _flush_scheduled
+    _flush_scheduled = False
+    _pending.clear()
+    for cache in _caches:
+        cache.clear()
+
+
+def _apply_pending():
+    global _flush_scheduled
+    _flush_scheduled = False
+    tags = set(_pending)
+    _pending.clear()
+    if FLUSH_ALL in tags:
+        flush_all()
+        return
+    for cache in _caches:
+        cache.invalidate(tags)
+
+
+def _on_notify(payload: str):
+    """
+    Обработка сообщения об инвалидации.
+
+    Ключи накапливаются и применяются одним проходом через `CACHE_INVALIDATION_COALESCE` секунд после первого
+    сообщения, поэтому всплеск сообщений не приводит к повторному обходу кешей.
+    """
+    global _flush_scheduled
+    _pending.update(payload.split(','))
+    if not _flush_scheduled:
+        _flush_scheduled = True
+        asyncio.get_running_loop().call_later(CACHE_INVALIDATION_COALESCE, _apply_pending)
+
+
+listener.add_listener(CHANNEL, _on_notify)
+# Сообщения, отправленные во время разрыва соединения, потеряны: кеши могли устареть
+listener.on_reconnect(flush_all)
+
+
+def encode(*tags: str) -> str:
+    """
+    Сериализация ключей инвалидации в полезную нагрузку NOTIFY.
+
+    Слишком длинный список заменяется сообщением о полном сбросе.
+
+    Возвращает:
+    - str: Ключи через запятую (или `*`).
+    """
+    payload = ','.join(sorted(set(tags)))
+    if len(payload.encode()) > MAX_PAYLOAD:
+        return FLUSH_ALL
+    return payload
+
+
+def encode_batches(*tags: str) -> list:
+    """
+    Сериализация ключей инвалидации в несколько полезных нагрузок NOTIFY.
+
+    Ключи делятся на сообщения не длиннее `MAX_PAYLOAD`, поэтому длинный список (например, после массового удаления
+    пользователей) не заменяется полным сбросом кешей.
+
+    Возвращает:
+    - list: Полезные нагрузки (ключи через запятую).
+    """
+    payloads, current, size = [], [], 0
+    for tag in sorted(set(tags)):
+        length = len(tag.encode())
+        if current and size + 1 + length > MAX_PAYLOAD:
+            payloads.append(','.join(current))
+            current, size = [], 0
+        size += length + (1 if current else 0)
+        current.append(tag)
+    if current:
+        payloads.append(','.join(current))
+    return payloads
+
+
+async def publish(session: AsyncSession, *tags: str) -> None:
+    """
+    Публикация сообщения об инвалидации ключей.
+
+    Сообщение отправляется через `pg_notify` в транзакции сессии и доставляется всем воркерам (включая текущий)
+    только после ее commit; при откате оно отбрасывается. Поэтому вызывать нужно до commit изменяющей данные
+    транзакции. Одинаковые сообщения в одной транзакции Postgres доставляет один раз. Длинный список ключей
+    отправляется несколькими сообщениями (`encode_batches`).
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession для взаимодействия с базой данных.
+    - tags: Ключи инвалидации (`user:42`, `account:7`).
+    """
+    for payload in encode_batches(*tags):
+        await notify(session, CHANNEL, payload)
@@ -0,0 +1,83 @@
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель (circuit breaker) для обращений к внешней зависимости.
+
+    После `failure_threshold` ошибок подряд выключатель размыкается, и вызовы отклоняются сразу, без ожидания
+    таймаутов. Через `reset_timeout` секунд он переходит в полуоткрытое состояние и пропускает один пробный
+    вызов: успех замыкает выключатель, ошибка снова размыкает его. Если пробный вызов не сообщил результат
+    за `reset_timeout` секунд, пропускается следующий.
+
+    Аргументы:
+    - failure_threshold: Число ошибок подряд, после которого выключатель размыкается.
+    - reset_timeout: Через сколько секунд после размыкания пропускается пробный вызов.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self.stats = {'opened': 0, 'rejected': 0}
+
+    def allow(self, now: float = None) -> bool:
+        """
+        Проверяет, можно ли выполнить вызов.
+
+        Аргументы:
+        - now: Текущее время по `time.monotonic()` (или None, чтобы взять его автоматически).
+
+        Возвращает:
+        - bool: True, если вызов разрешен (в полуоткрытом состоянии — как пробный), иначе False.
+        """
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self.probe_started = now
+            return True
+        if self.state == HALF_OPEN and now - self.probe_started >= self.reset_timeout:
+            self.probe_started = now
+            return True
+        self.stats['rejected'] += 1
+        return False
+
+    def retry_after(self, now: float = None) -> float:
+        """
+        Через сколько секунд выключатель пропустит следующий пробный вызов.
+
+        Аргументы:
+        - now: Текущее время по `time.monotonic()` (или None, чтобы взять его автоматически).
+
+        Возвращает:
+        - float: Число секунд (0, если выключатель замкнут).
+        """
+        if self.state == CLOSED:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        since = self.opened_at if self.state == OPEN else self.probe_started
+        return max(0.0, self.reset_timeout - (now - since))
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self, now: float = None):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.stats['opened'] += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic() if now is None else now
+
+    def get_metrics(self) -> dict:
+        return {'state': self.state, 'failures': self.failures, **self.stats}
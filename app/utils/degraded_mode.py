@@ -0,0 +1,203 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import wraps
+
+from sanic import response
+from sanic.log import logger
+
+from app.config import (DB_REQUEST_BUDGET, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, STALE_CACHE_MAX_AGE,
+                        STALE_CACHE_MAX_BYTES)
+from app.db import is_sqlite_url
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.jwt import decode_request_token
+from app.utils.rate_limit import retry_after_header
+
+# Классы SQLSTATE, означающие недоступность базы данных, а не ошибку запроса: ошибки соединения (08),
+# нехватка ресурсов (53, в том числе too_many_connections) и вмешательство оператора (57: отмена запроса по
+# statement_timeout, остановка сервера, сервер еще запускается)
+UNAVAILABLE_SQLSTATE_CLASSES = frozenset({'08', '53', '57'})
+
+
+class DatabaseUnavailable(Exception):
+    """
+    База данных недоступна или не уложилась в бюджет времени запроса.
+    """
+
+
+class CircuitOpen(DatabaseUnavailable):
+    """
+    Обращение к базе данных отклонено разомкнутым выключателем, без попытки подключения.
+    """
+
+
+breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+
+
+def is_unavailable(error: BaseException) -> bool:
+    """
+    Проверяет, вызвана ли ошибка недоступностью базы данных (таймауты, разрыв соединения, отказ в подключении),
+    а не самим запросом.
+
+    Аргументы:
+    - error: Исключение.
+
+    Возвращает:
+    - bool: True, если ошибка означает недоступность базы данных.
+    """
+    import asyncpg
+    from sqlalchemy import exc
+
+    if isinstance(error, (TimeoutError, OSError, exc.TimeoutError)):
+        return True
+    if isinstance(error, exc.DBAPIError):
+        if error.connection_invalidated or isinstance(error, exc.InterfaceError):
+            return True
+        error = error.orig
+    sqlstate = getattr(error, 'sqlstate', None)
+    if sqlstate:
+        return sqlstate[:2] in UNAVAILABLE_SQLSTATE_CLASSES
+    return isinstance(error, asyncpg.InterfaceError)
+
+
+@asynccontextmanager
+async def database_budget(budget: float = DB_REQUEST_BUDGET):
+    """
+    Асинхронный контекстный менеджер, ограничивающий время работы с базой данных в рамках запроса.
+
+    Если выключатель разомкнут, сразу выбрасывает `CircuitOpen`. Если блок не уложился в `budget` секунд
+    или завершился ошибкой недоступности базы данных, регистрирует сбой в выключателе и выбрасывает
+    `DatabaseUnavailable`; остальные исключения пробрасываются без изменений.
+
+    Аргументы:
+    - budget: Бюджет времени в секундах.
+    """
+    if not breaker.allow():
+        raise CircuitOpen('Circuit breaker is open')
+    try:
+        async with asyncio.timeout(budget):
+            yield
+    except Exception as error:
+        if not is_unavailable(error):
+            raise
+        breaker.record_failure()
+        raise DatabaseUnavailable(str(error) or type(error).__name__) from error
+    breaker.record_success()
+
+
+class StaleResponseCache:
+    """
+    Последние успешные ответы read-эндпоинтов, отдаваемые, пока база данных недоступна.
+
+    Хранится тело ответа и его тип; записи старше `max_age` секунд не отдаются. Общий объем тел ограничен
+    `max_bytes`: при превышении вытесняются записи, к которым дольше всего не обращались.
+
+    Аргументы:
+    - max_age: Максимальный возраст отдаваемой записи в секундах.
+    - max_bytes: Максимальный суммарный размер тел в байтах.
+    """
+
+    def __init__(self, max_age: float = STALE_CACHE_MAX_AGE, max_bytes: int = STALE_CACHE_MAX_BYTES):
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self.stats = {'served': 0, 'missed': 0}
+
+    def get(self, key, now: float = None):
+        """
+        Получение сохраненного ответа.
+
+        Аргументы:
+        - key: Ключ записи.
+        - now: Текущее время по `time.time()` (или None, чтобы взять его автоматически).
+
+        Возвращает:
+        - tuple: (тело, тип содержимого, возраст в секундах) или None, если записи нет или она слишком старая.
+        """
+        entry = self._data.get(key)
+        now = time.time() if now is None else now
+        if entry is None or now - entry[2] > self.max_age:
+            self.stats['missed'] += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats['served'] += 1
+        return entry[0], entry[1], now - entry[2]
+
+    def set(self, key, body: bytes, content_type: str, now: float = None):
+        self.pop(key)
+        if len(body) > self.max_bytes:
+            return
+        self._data[key] = (body, content_type, time.time() if now is None else now)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            self.pop(next(iter(self._data)))
+
+    def pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_metrics(self) -> dict:
+        return {'entries': len(self._data), 'bytes': self.size, **self.stats}
+
+
+stale_responses = StaleResponseCache()
+
+
+def _stale_key(request):
+    payload = decode_request_token(request)
+    if payload is None or 'error' in payload:
+        return None
+    return payload['user_id'], request.path, request.query_string
+
+
+def serve_stale(handler):
+    """
+    Декоратор read-эндпоинта: бюджет времени на базу данных и отдача последнего успешного ответа при ее
+    недоступности.
+
+    Обработчик выполняется внутри `database_budget`. Успешные ответы (200) запоминаются по пользователю, пути
+    и параметрам запроса. Если база данных недоступна (выключатель разомкнут, бюджет исчерпан, соединение
+    разорвано), отдается сохраненный ответ с заголовками `Age` (возраст в секундах) и `X-Stale-Response: true`,
+    а при его отсутствии — ошибка 503 с заголовком Retry-After.
+
+    С SQLite обработчик не оборачивается: база в памяти процесса не бывает недоступной, а отмена запроса по
+    бюджету времени оборвала бы транзакцию на соединении, общем для всех сессий.
+
+    Аргументы:
+    - handler: Обработчик Sanic.
+
+    Возвращает:
+    - Обработчик Sanic.
+    """
+
+    if is_sqlite_url():
+        return handler
+
+    @wraps(handler)
+    async def wrapper(request, *args, **kwargs):
+        key = _stale_key(request)
+        try:
+            async with database_budget():
+                result = await handler(request, *args, **kwargs)
+        except DatabaseUnavailable as error:
+            if not isinstance(error, CircuitOpen):
+                logger.warning('Database unavailable for %s: %s', request.path, error)
+            cached = stale_responses.get(key) if key is not None else None
+            if cached is None:
+                return response.json({'message': 'Service temporarily unavailable'}, status=503,
+                                     headers=retry_after_header(breaker.retry_after() or 1))
+            body, content_type, age = cached
+            return response.raw(body, content_type=content_type,
+                                headers={'Age': str(int(age)), 'X-Stale-Response': 'true'})
+
+        if key is not None and result.status == 200 and result.body:
+            stale_responses.set(key, result.body, result.content_type)
+        return result
+
+    return wrapper
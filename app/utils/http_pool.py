@@ -0,0 +1,184 @@
+import asyncio
+import ssl
+import time
+from urllib.parse import urlsplit
+
+MAX_RESPONSE_BYTES = 64 * 1024
+
+
+class HttpPool:
+    """
+    Пул keep-alive соединений HTTP/1.1 к одному адресу (схема, хост, порт).
+
+    Одновременно открыто не больше `limit` соединений; свободные соединения переиспользуются и закрываются, если
+    простаивали дольше `idle_timeout` секунд. Если переиспользованное соединение оказалось закрыто сервером до
+    ответа, запрос один раз повторяется на новом соединении. Тело ответа читается не больше `MAX_RESPONSE_BYTES`
+    байт; ответ без длины или с более длинным телом закрывает соединение.
+
+    Аргументы:
+    - scheme: `http` или `https`.
+    - host: Хост.
+    - port: Порт.
+    - limit: Максимальное количество одновременных соединений.
+    - idle_timeout: Время простоя, после которого соединение не переиспользуется.
+    """
+
+    def __init__(self, scheme: str, host: str, port: int, limit: int, idle_timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.ssl = ssl.create_default_context() if scheme == 'https' else None
+        self.idle_timeout = idle_timeout
+        self.stats = {'requests': 0, 'connections': 0, 'reused': 0}
+        self._idle = []
+        self._slots = asyncio.Semaphore(limit)
+
+    def _take_idle(self):
+        now = time.monotonic()
+        while self._idle:
+            reader, writer, idle_since = self._idle.pop()
+            if now - idle_since < self.idle_timeout and not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    async def request(self, method: str, target: str, headers: dict, body: bytes) -> tuple:
+        """
+        Выполнение запроса.
+
+        Аргументы:
+        - method: HTTP-метод.
+        - target: Путь с параметрами запроса.
+        - headers: Заголовки запроса.
+        - body: Тело запроса.
+
+        Возвращает:
+        - tuple: HTTP-статус, заголовки ответа (имена в нижнем регистре) и тело ответа.
+        """
+        async with self._slots:
+            self.stats['requests'] += 1
+            connection = self._take_idle()
+            if connection is not None:
+                self.stats['reused'] += 1
+                try:
+                    return await self._exchange(connection, method, target, headers, body)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    pass
+            reader_writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+            self.stats['connections'] += 1
+            return await self._exchange(reader_writer, method, target, headers, body)
+
+    async def _exchange(self, connection, method, target, headers, body) -> tuple:
+        reader, writer = connection
+        try:
+            lines = [f'{method} {target} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+            lines += [f'{name}: {value}' for name, value in headers.items()]
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+
+            head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+            status = int(head[0].split(' ', 2)[1])
+            response_headers = {}
+            for line in head[1:]:
+                if line:
+                    name, _, value = line.partition(':')
+                    response_headers[name.strip().lower()] = value.strip()
+
+            keep_alive = response_headers.get('connection', '').lower() != 'close'
+            if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+                response_body = await self._read_chunked(reader)
+            elif 'content-length' in response_headers:
+                length = int(response_headers['content-length'])
+                if length > MAX_RESPONSE_BYTES:
+                    response_body, keep_alive = await reader.read(MAX_RESPONSE_BYTES), False
+                else:
+                    response_body = await reader.readexactly(length)
+            else:
+                response_body, keep_alive = await reader.read(MAX_RESPONSE_BYTES), False
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive and response_body is not None:
+            self._idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+        return status, response_headers, response_body or b''
+
+    @staticmethod
+    async def _read_chunked(reader) -> bytes:
+        chunks = []
+        received = 0
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            if size == 0:
+                await reader.readuntil(b'\r\n')
+                return b''.join(chunks)
+            received += size
+            if received > MAX_RESPONSE_BYTES:
+                # Слишком длинное тело не дочитывается: вызывающий закроет соединение
+                return None
+            chunks.append((await reader.readexactly(size + 2))[:-2])
+
+    def prune(self):
+        """
+        Закрытие соединений, простаивающих дольше `idle_timeout`.
+        """
+        now = time.monotonic()
+        fresh = []
+        for reader, writer, idle_since in self._idle:
+            if now - idle_since < self.idle_timeout and not writer.is_closing():
+                fresh.append((reader, writer, idle_since))
+            else:
+                writer.close()
+        self._idle = fresh
+
+    def close(self):
+        for _reader, writer, _idle_since in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+class HttpPools:
+    """
+    Набор пулов `HttpPool`, по одному на адрес назначения.
+
+    Аргументы:
+    - limit: Максимальное количество одновременных соединений с одним адресом.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._pools = {}
+
+    def get(self, url: str) -> tuple:
+        """
+        Пул для адреса URL.
+
+        Аргументы:
+        - url: URL назначения.
+
+        Возвращает:
+        - tuple: Пул и путь с параметрами запроса (при неподдерживаемой схеме выбрасывается `ValueError`).
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f'Unsupported URL: {url}')
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = HttpPool(parts.scheme, parts.hostname, port, self.limit)
+        return pool, (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+
+    def get_metrics(self) -> dict:
+        return {f'{scheme}://{host}:{port}': dict(pool.stats) for (scheme, host, port), pool in self._pools.items()}
+
+    def prune(self):
+        """
+        Закрытие простаивающих соединений всех пулов.
+        """
+        for pool in self._pools.values():
+            pool.prune()
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
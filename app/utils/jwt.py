@@ -1,26 +1,68 @@
-import jwt
+import uuid
 from datetime import datetime, timedelta, timezone
 
 from app.config import SECRET_JWT_KEY
+from app.utils.token_revocation import revocations
+
+TOKEN_LIFETIME = timedelta(days=1)
+# Ошибка токена, отзыв которого нельзя проверить по состоянию в памяти (оно устарело): такой токен не принимается
+# без проверки по базе данных (`app.utils.token_check.check_revocation`)
+REVOCATION_UNKNOWN = 'Token revocation state unavailable'
 
 
 def create_token(user_id: int, is_admin: bool):
-    expiration = datetime.now(timezone.utc) + timedelta(days=1)
+    import jwt
+
+    issued_at = datetime.now(timezone.utc)
     payload = {
         'user_id': user_id,
         'is_admin': is_admin,
-        'exp': expiration
+        'iat': int(issued_at.timestamp()),
+        'jti': uuid.uuid4().hex,
+        'exp': issued_at + TOKEN_LIFETIME
     }
     token = jwt.encode(payload, SECRET_JWT_KEY, algorithm='HS256')
     return token
 
 
 def decode_token(token: str):
+    import jwt
+
     try:
         token = token.split('Bearer ')[1]
         payload = jwt.decode(token, SECRET_JWT_KEY, algorithms=['HS256'])
-        return payload
     except jwt.ExpiredSignatureError:
         return {'error': 'Token has expired'}
     except jwt.InvalidTokenError:
         return {'error': 'Invalid token'}
+    # Отзыв проверяется по состоянию в памяти воркера, без запроса к базе данных
+    revoked = revocations.is_revoked(payload)
+    if revoked:
+        return {'error': 'Token has been revoked'}
+    if revoked is None:
+        return {'error': REVOCATION_UNKNOWN, 'payload': payload}
+    return payload
+
+
+def decode_request_token(request):
+    """
+    Декодирование токена из заголовка Authorization запроса.
+
+    Результат сохраняется в контексте запроса, поэтому middleware и обработчик одного запроса проверяют подпись
+    токена один раз.
+
+    Аргументы:
+    - request: Sanic Request объект.
+
+    Возвращает:
+    - dict: Полезные данные токена или словарь с ключом `error` (или None, если заголовок отсутствует).
+    """
+    token = request.headers.get('Authorization')
+    if not token:
+        return None
+    cached = getattr(request.ctx, 'token_payload', None)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    payload = decode_token(token)
+    request.ctx.token_payload = (token, payload)
+    return payload
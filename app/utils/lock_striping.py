@@ -0,0 +1,88 @@
+import asyncio
+import bisect
+import time
+from contextlib import asynccontextmanager
+
+from app.config import ACCOUNT_LOCK_STRIPES
+
+# Верхние границы корзин гистограммы ожидания, мс
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class StripedLock:
+    """
+    Таблица блокировок asyncio с фиксированным числом полос (lock striping).
+
+    Ключ отображается на одну из `stripes` блокировок по хешу, поэтому память не растет с числом ключей, а работа
+    с одним ключом выполняется строго последовательно в пределах воркера. Разные ключи, попавшие в одну полосу,
+    тоже ждут друг друга; чем больше полос, тем реже такие ложные конфликты. Ожидание идет в памяти, до получения
+    соединения с базой данных. Время ожидания учитывается в метриках.
+
+    Аргументы:
+    - stripes: Количество полос (0 — блокировки выключены).
+    """
+
+    def __init__(self, stripes: int):
+        self._locks = [asyncio.Lock() for _ in range(max(stripes, 0))]
+        self.stats = {'acquired': 0, 'contended': 0, 'waiting': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0}
+        self._wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    @property
+    def stripes(self) -> int:
+        return len(self._locks)
+
+    def _stripe(self, key) -> asyncio.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+    @asynccontextmanager
+    async def hold(self, key):
+        """
+        Асинхронный контекстный менеджер, удерживающий полосу ключа на время блока.
+
+        Аргументы:
+        - key: Ключ (хешируемый).
+        """
+        if not self._locks:
+            yield
+            return
+        lock = self._stripe(key)
+        if lock.locked():
+            self.stats['contended'] += 1
+        self.stats['waiting'] += 1
+        started = time.perf_counter()
+        try:
+            await lock.acquire()
+        finally:
+            self.stats['waiting'] -= 1
+        self._record_wait((time.perf_counter() - started) * 1000)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def _record_wait(self, wait_ms: float):
+        self.stats['acquired'] += 1
+        self.stats['wait_ms_total'] += wait_ms
+        self.stats['wait_ms_max'] = max(self.stats['wait_ms_max'], wait_ms)
+        self._wait_histogram[bisect.bisect_left(WAIT_BUCKETS_MS, wait_ms)] += 1
+
+    def get_metrics(self) -> dict:
+        """
+        Счетчики блокировок: число захватов, захватов с ожиданием (полоса была занята), ожидающих сейчас, суммарное
+        и максимальное время ожидания и гистограмма времени ожидания.
+
+        Возвращает:
+        - dict: Счетчики.
+        """
+        labels = [f'<={bound}ms' for bound in WAIT_BUCKETS_MS] + [f'>{WAIT_BUCKETS_MS[-1]}ms']
+        return {
+            'stripes': self.stripes,
+            'held': sum(lock.locked() for lock in self._locks),
+            **self.stats,
+            'wait_ms_total': round(self.stats['wait_ms_total'], 3),
+            'wait_ms_max': round(self.stats['wait_ms_max'], 3),
+            'wait_histogram': dict(zip(labels, self._wait_histogram)),
+        }
+
+
+account_locks = StripedLock(ACCOUNT_LOCK_STRIPES)
@@ -0,0 +1,179 @@
+import asyncio
+
+from sanic.log import logger
+
+# Уведомления сессии SQLite, ожидающие commit
+_PENDING = 'pending_notifications'
+# Модуль импортируется цепочкой app.utils.jwt → app.utils.token_revocation, поэтому SQLAlchemy и app.db
+# загружаются при первом использовании, а не при импорте
+_session_hooks_installed = False
+
+
+class PgListener:
+    """
+    Выделенное соединение asyncpg для получения уведомлений Postgres (LISTEN/NOTIFY) в рамках одного воркера.
+
+    Обработчики каналов регистрируются до запуска и вызываются синхронно с полезной нагрузкой уведомления.
+    При потере соединения слушатель переподключается с экспоненциальной задержкой и вызывает обработчики
+    переподключения: уведомления, отправленные во время разрыва, потеряны, и зависящее от них состояние нужно
+    сбросить.
+
+    Аргументы:
+    - dsn: Строка подключения asyncpg (или None, чтобы взять из конфигурации).
+    """
+
+    def __init__(self, dsn: str = None):
+        self.dsn = dsn
+        self._handlers = {}
+        self._reconnect_handlers = []
+        self._task = None
+        self._connection = None
+
+    def add_listener(self, channel: str, callback):
+        """
+        Регистрирует обработчик канала.
+
+        Аргументы:
+        - channel: Имя канала Postgres.
+        - callback: Функция, принимающая полезную нагрузку уведомления (str).
+        """
+        self._handlers.setdefault(channel, []).append(callback)
+
+    def remove_listener(self, channel: str, callback):
+        """
+        Удаляет обработчик канала, зарегистрированный `add_listener`.
+
+        Аргументы:
+        - channel: Имя канала Postgres.
+        - callback: Зарегистрированная функция.
+        """
+        self._handlers.get(channel, []).remove(callback)
+
+    def on_reconnect(self, callback):
+        """
+        Регистрирует обработчик, вызываемый после восстановления соединения.
+
+        Аргументы:
+        - callback: Функция без аргументов.
+        """
+        self._reconnect_handlers.append(callback)
+
+    def dispatch(self, channel: str, payload: str):
+        """
+        Вызывает обработчики канала с полезной нагрузкой уведомления.
+
+        Аргументы:
+        - channel: Имя канала.
+        - payload: Полезная нагрузка уведомления.
+        """
+        for callback in self._handlers.get(channel, ()):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception('Notification handler for channel %s failed', channel)
+
+    def _on_notification(self, _connection, _pid, channel, payload):
+        self.dispatch(channel, payload)
+
+    async def _run(self):
+        import asyncpg
+
+        from app.db import get_asyncpg_dsn
+
+        delay = 0.5
+        connected_before = False
+        while True:
+            lost = asyncio.Event()
+            try:
+                self._connection = await asyncpg.connect(self.dsn or get_asyncpg_dsn())
+                self._connection.add_termination_listener(lambda _connection: lost.set())
+                for channel in self._handlers:
+                    await self._connection.add_listener(channel, self._on_notification)
+                if connected_before:
+                    for callback in self._reconnect_handlers:
+                        callback()
+                connected_before = True
+                delay = 0.5
+                await lost.wait()
+                logger.warning('LISTEN connection lost, reconnecting')
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('LISTEN connection failed, retrying in %.1fs', delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    async def start(self):
+        """
+        Запускает фоновую задачу слушателя, если зарегистрирован хотя бы один канал (с SQLite слушатель не нужен:
+        уведомления доставляются в процессе, см. `notify`).
+        """
+        from app.db import is_sqlite_url
+
+        if self._handlers and self._task is None and not is_sqlite_url():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Останавливает фоновую задачу и закрывает соединение.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+
+listener = PgListener()
+
+
+async def notify(session, channel: str, payload: str):
+    """
+    Отправка уведомления в канал в транзакции сессии.
+
+    С Postgres уведомление отправляется через `pg_notify` и доставляется слушателям всех воркеров после commit.
+    С SQLite (база одного процесса) оно доставляется обработчикам `listener` текущего процесса после commit
+    сессии; при откате уведомление отбрасывается, как и в Postgres.
+
+    Аргументы:
+    - session: SQLAlchemy AsyncSession.
+    - channel: Имя канала.
+    - payload: Полезная нагрузка уведомления.
+    """
+    from sqlalchemy import text
+
+    from app.db import is_postgres
+
+    if is_postgres(session):
+        await session.execute(text("SELECT pg_notify(:channel, :payload)"), {'channel': channel, 'payload': payload})
+    else:
+        _install_session_hooks()
+        # Транзакция начинается сразу, как с pg_notify: иначе откат сессии без запросов не отбросил бы уведомление
+        await session.connection()
+        session.info.setdefault(_PENDING, []).append((channel, payload))
+
+
+def _install_session_hooks():
+    global _session_hooks_installed
+    if _session_hooks_installed:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    event.listen(Session, 'after_commit', _deliver_pending)
+    event.listen(Session, 'after_soft_rollback', _discard_pending)
+    _session_hooks_installed = True
+
+
+def _deliver_pending(session):
+    for channel, payload in session.info.pop(_PENDING, ()):
+        listener.dispatch(channel, payload)
+
+
+def _discard_pending(session, _previous_transaction):
+    session.info.pop(_PENDING, None)
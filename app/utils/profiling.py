@@ -0,0 +1,254 @@
+import gc
+import inspect
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+MAX_CPU_PROFILE_DURATION = 60.0
+MIN_CPU_SAMPLE_INTERVAL = 0.001
+
+# Собственные кадры профилировщика и механизма импорта не интересны в отчете
+_TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+)
+
+_baseline = None
+
+
+def get_memory_usage() -> dict:
+    """
+    Текущий и пиковый объем памяти процесса.
+
+    Возвращает:
+    - dict: `rss_bytes` (текущий, только Linux) и `max_rss_bytes` (пиковый), если доступны.
+    """
+    usage = {}
+    try:
+        with open('/proc/self/statm') as file:
+            usage['rss_bytes'] = int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage['max_rss_bytes'] = max_rss if sys.platform == 'darwin' else max_rss * 1024
+    return usage
+
+
+def start_tracing(frames: int = 1) -> bool:
+    """
+    Включение `tracemalloc`. Пока трассировка выключена, накладных расходов нет.
+
+    Аргументы:
+    - frames: Глубина сохраняемого стека для каждого выделения.
+
+    Возвращает:
+    - bool: False, если трассировка уже была включена.
+    """
+    global _baseline
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(max(1, frames))
+    _baseline = None
+    return True
+
+
+def stop_tracing() -> bool:
+    """
+    Выключение `tracemalloc` с освобождением собранных трасс.
+
+    Возвращает:
+    - bool: False, если трассировка не была включена.
+    """
+    global _baseline
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    _baseline = None
+    return True
+
+
+def _format_stat(stat) -> dict:
+    frames = [f'{frame.filename}:{frame.lineno}' for frame in stat.traceback]
+    result = {'site': frames[0] if frames else None, 'size_bytes': stat.size, 'count': stat.count}
+    if len(frames) > 1:
+        result['traceback'] = frames
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        result['size_diff_bytes'] = stat.size_diff
+        result['count_diff'] = stat.count_diff
+    return result
+
+
+def get_allocations(limit: int = 20, diff: bool = False, group_by: str = 'lineno') -> dict:
+    """
+    Крупнейшие места выделения памяти по снимку `tracemalloc`.
+
+    При `diff=True` снимок сравнивается с предыдущим (сделанным этой же функцией), и места сортируются по
+    приросту; текущий снимок становится базой для следующего сравнения. Рост между двумя вызовами с интервалом
+    в несколько часов указывает на источник утечки.
+
+    Аргументы:
+    - limit: Количество мест в отчете.
+    - diff: True, чтобы сравнить с предыдущим снимком.
+    - group_by: Группировка: `lineno`, `filename` или `traceback`.
+
+    Возвращает:
+    - dict: Объем памяти под трассировкой и список мест выделения (или None, если трассировка выключена).
+    """
+    global _baseline
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+    if diff and _baseline is not None:
+        stats = snapshot.compare_to(_baseline, group_by)
+    else:
+        stats = snapshot.statistics(group_by)
+    previous, _baseline = _baseline, snapshot
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'traced_bytes': current,
+        'traced_peak_bytes': peak,
+        'diff': diff and previous is not None,
+        'allocations': [_format_stat(stat) for stat in stats[:limit]],
+    }
+
+
+def count_orm_instances() -> dict:
+    """
+    Подсчет живых объектов ORM по отображенным классам и размеров карт идентичности живых сессий.
+
+    Обходит все объекты, отслеживаемые сборщиком мусора, поэтому на большой куче занимает заметное время;
+    вызывается только по запросу.
+
+    Возвращает:
+    - dict: Количество объектов по классам, количество сессий и суммарный размер их карт идентичности.
+    """
+    from sqlalchemy.orm import Session
+
+    from app.db import Base
+
+    mapped = {mapper.class_: mapper.class_.__name__ for mapper in Base.registry.mappers}
+    counts = Counter({name: 0 for name in mapped.values()})
+    sessions = 0
+    identity_map_size = 0
+    for obj in gc.get_objects():
+        cls = type(obj)
+        name = mapped.get(cls)
+        if name is not None:
+            counts[name] += 1
+        elif isinstance(obj, Session):
+            sessions += 1
+            identity_map_size += len(obj.identity_map)
+    return {'instances': dict(counts), 'sessions': sessions, 'identity_map_size': identity_map_size}
+
+
+def event_loop_depth() -> int:
+    """
+    Глубина стека, на которой цикл событий вызывает задачи. Вызывается из корутины в потоке цикла событий:
+    над цепочкой кадров корутин находится кадр, из которого цикл событий их вызывает. Выборка стека, не
+    глубже этого кадра, означает, что цикл событий простаивает в ожидании событий.
+
+    Возвращает:
+    - int: Количество кадров от дна стека до кадра, вызывающего задачи.
+    """
+    frame = sys._getframe(1)
+    while frame is not None and not frame.f_code.co_flags & inspect.CO_COROUTINE:
+        frame = frame.f_back
+    while frame is not None and frame.f_code.co_flags & inspect.CO_COROUTINE:
+        frame = frame.f_back
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+class CpuSampler:
+    """
+    Выборочный профилировщик процессорного времени потока цикла событий.
+
+    Отдельный поток через каждые `interval` секунд снимает стек потока цикла событий (`sys._current_frames`) и
+    считает, сколько раз функции оказывались на вершине стека (собственное время) и в стеке вообще (общее время),
+    а также свернутые стеки в формате flamegraph. Профилируемый код не инструментируется: поток существует только
+    во время профилирования, и вне его накладных расходов нет. Одновременно выполняется только один профиль.
+    Поток получает GIL не чаще интервала переключения (`sys.getswitchinterval()`, 5 мс), поэтому короткие
+    участки работы недооцениваются; долгие синхронные участки, блокирующие цикл событий, видны хорошо.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, thread_id: int, idle_depth: int, duration: float, interval: float = 0.005,
+                limit: int = 30) -> dict:
+        """
+        Снятие профиля (блокирующий вызов, выполняется в отдельном потоке).
+
+        Аргументы:
+        - thread_id: Идентификатор профилируемого потока.
+        - idle_depth: Глубина стека простаивающего цикла событий (`event_loop_depth`).
+        - duration: Длительность профилирования в секундах (не больше `MAX_CPU_PROFILE_DURATION`).
+        - interval: Интервал между выборками в секундах.
+        - limit: Количество функций и стеков в отчете.
+
+        Возвращает:
+        - dict: Число выборок, доля выборок вне ожидания событий, функции по собственному и общему времени,
+          самые частые стеки (или None, если профиль уже снимается).
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self._sample(thread_id, idle_depth, min(duration, MAX_CPU_PROFILE_DURATION),
+                                max(interval, MIN_CPU_SAMPLE_INTERVAL), limit)
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _sample(thread_id: int, idle_depth: int, duration: float, interval: float, limit: int) -> dict:
+        own = Counter()
+        total = Counter()
+        stacks = Counter()
+        samples = 0
+        idle = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            samples += 1
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            # Цикл событий ждет событий: uvloop — в C-коде под кадром, вызывающим задачи, asyncio — в selectors
+            if len(stack) <= idle_depth or 'selectors.py:' in stack[0]:
+                idle += 1
+            own[stack[0]] += 1
+            for function in set(stack):
+                total[function] += 1
+            stacks[';'.join(reversed(stack))] += 1
+            time.sleep(interval)
+        return {
+            'duration': duration,
+            'samples': samples,
+            'busy_ratio': round(1 - idle / samples, 4) if samples else None,
+            'self': [{'function': function, 'samples': count} for function, count in own.most_common(limit)],
+            'total': [{'function': function, 'samples': count} for function, count in total.most_common(limit)],
+            'stacks': [{'stack': stack, 'samples': count} for stack, count in stacks.most_common(limit)],
+        }
+
+
+cpu_sampler = CpuSampler()
@@ -0,0 +1,139 @@
+import math
+import time
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class TokenBucketTable:
+    """
+    Таблица token bucket'ов, индексированная произвольным ключом (user_id, IP и т.п.).
+
+    Для каждого ключа хранится только текущее число токенов и время последнего обновления, пополнение считается
+    лениво при обращении, поэтому проверка выполняется за O(1). Бакеты, к которым давно не обращались, периодически
+    удаляются, чтобы таблица не росла бесконечно.
+
+    Аргументы:
+    - rate: Скорость пополнения (токенов в секунду).
+    - capacity: Максимальное число токенов в бакете (допустимый всплеск).
+    - idle_ttl: Через сколько секунд простоя бакет можно удалить.
+    """
+
+    def __init__(self, rate: float, capacity: float, idle_ttl: float = 300.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.idle_ttl = idle_ttl
+        self._buckets = {}
+        self._last_eviction = time.monotonic()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def consume(self, key, now: float = None, cost: float = 1.0) -> float:
+        """
+        Пытается списать `cost` токенов из бакета для ключа `key`.
+
+        Аргументы:
+        - key: Ключ бакета.
+        - now: Текущее время по `time.monotonic()` (или None, чтобы взять его автоматически).
+        - cost: Количество списываемых токенов.
+
+        Возвращает:
+        - float: 0, если запрос разрешен, иначе число секунд до появления нужного количества токенов.
+        """
+        if now is None:
+            now = time.monotonic()
+        if now - self._last_eviction >= self.idle_ttl:
+            self.evict_idle(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.capacity, now)
+        else:
+            bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            return 0.0
+        return (cost - bucket.tokens) / self.rate
+
+    def evict_idle(self, now: float = None) -> int:
+        """
+        Удаляет бакеты, к которым не обращались дольше `idle_ttl` секунд.
+
+        Такие бакеты к этому моменту уже полностью пополнены, поэтому их удаление не меняет поведение лимита.
+
+        Аргументы:
+        - now: Текущее время по `time.monotonic()` (или None, чтобы взять его автоматически).
+
+        Возвращает:
+        - int: Количество удаленных бакетов.
+        """
+        if now is None:
+            now = time.monotonic()
+        deadline = now - max(self.idle_ttl, self.capacity / self.rate)
+        idle = [key for key, bucket in self._buckets.items() if bucket.updated < deadline]
+        for key in idle:
+            del self._buckets[key]
+        self._last_eviction = now
+        return len(idle)
+
+
+class ConcurrencyLimiter:
+    """
+    Глобальное ограничение числа одновременно обрабатываемых запросов.
+
+    Часть слотов (`reserved`) доступна только приоритетным запросам, поэтому обычный трафик не может полностью
+    вытеснить приоритетный. Ожидания в очереди нет: если слота нет, запрос сразу отклоняется.
+
+    Аргументы:
+    - limit: Максимальное число одновременных запросов.
+    - reserved: Число слотов, зарезервированных для приоритетных запросов.
+    """
+
+    def __init__(self, limit: int, reserved: int = 0):
+        self.limit = limit
+        self.reserved = min(reserved, limit)
+        self.in_flight = 0
+
+    def try_acquire(self, priority: bool = False) -> bool:
+        """
+        Пытается занять слот.
+
+        Аргументы:
+        - priority: True для приоритетного запроса, которому доступны зарезервированные слоты.
+
+        Возвращает:
+        - bool: True, если слот занят, иначе False.
+        """
+        limit = self.limit if priority else self.limit - self.reserved
+        if self.in_flight >= limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        """
+        Освобождает ранее занятый слот.
+        """
+        if self.in_flight > 0:
+            self.in_flight -= 1
+
+
+def retry_after_header(seconds: float) -> dict:
+    """
+    Формирует заголовок Retry-After (в целых секундах, не меньше 1).
+
+    Аргументы:
+    - seconds: Рекомендуемая задержка в секундах.
+
+    Возвращает:
+    - dict: Заголовки ответа.
+    """
+    return {'Retry-After': str(max(1, math.ceil(seconds)))}
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+from sanic import Request
+
+from app.schemas import decode
+
+
+def parse_date_arg(request: Request, name: str):
+    """
+    Разбирает необязательный параметр запроса с датой в формате ISO 8601.
+
+    Даты без часового пояса считаются датами в UTC.
+
+    Аргументы:
+    - request: Sanic Request объект.
+    - name: Имя параметра.
+
+    Возвращает:
+    - datetime: Дата с часовым поясом (или None, если параметр не передан).
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def decode_body(request: Request, schema):
+    """
+    Декодирует и проверяет JSON-тело запроса по схеме из `app.schemas`.
+
+    Вызывается до получения сессии базы данных, чтобы некорректные запросы отклонялись без обращения к базе.
+
+    Аргументы:
+    - request: Sanic Request объект.
+    - schema: Класс схемы.
+
+    Возвращает:
+    - Объект схемы (при некорректном теле выбрасывается `ValueError` с описанием ошибки).
+    """
+    return decode(schema, request.body)
@@ -0,0 +1,132 @@
+import asyncio
+
+from app.config import SINGLE_FLIGHT_ENABLED
+from app.db import get_db, is_postgres
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вызовов в пределах воркера (single-flight).
+
+    Первый вызов с ключом запускает функцию в отдельной задаче, остальные вызовы с тем же ключом, пришедшие до ее
+    завершения, ждут ту же задачу и получают тот же результат или то же исключение. Отмена одного из ожидающих
+    не затрагивает остальных; задача отменяется, только если ее результат больше никому не нужен, и ключ при этом
+    сразу освобождается: вызов, пришедший во время отмены, запускает функцию заново, а не ждет отменяемую задачу.
+    Результат не кешируется: после завершения задачи следующий вызов выполняет функцию заново.
+
+    Аргументы:
+    - name: Имя группы (для метрик).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self.stats = {'executions': 0, 'suppressed': 0, 'errors': 0, 'cancelled': 0, 'in_flight': 0}
+
+    def _finished(self, key, task: asyncio.Task):
+        if self._calls.get(key, (None,))[0] is task:
+            del self._calls[key]
+        self.stats['in_flight'] = len(self._calls)
+        if task.cancelled():
+            self.stats['cancelled'] += 1
+        elif task.exception() is not None:
+            self.stats['errors'] += 1
+
+    async def do(self, key, func):
+        """
+        Выполнение функции с объединением одинаковых одновременных вызовов.
+
+        Аргументы:
+        - key: Ключ вызова (хешируемый).
+        - func: Функция без аргументов, возвращающая корутину.
+
+        Возвращает:
+        - Результат функции.
+        """
+        call = self._calls.get(key)
+        if call is None or call[0].cancelling():
+            task = asyncio.ensure_future(func())
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self.stats['executions'] += 1
+            self.stats['in_flight'] = len(self._calls)
+        else:
+            self.stats['suppressed'] += 1
+
+        task = call[0]
+        call[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and call[1] == 1:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                    self.stats['in_flight'] = len(self._calls)
+                task.cancel()
+            raise
+        finally:
+            call[1] -= 1
+
+
+_groups = {}
+
+
+def get_group(name: str) -> SingleFlight:
+    """
+    Получение группы single-flight по имени (создается при первом обращении).
+
+    Аргументы:
+    - name: Имя группы.
+
+    Возвращает:
+    - SingleFlight: Группа.
+    """
+    group = _groups.get(name)
+    if group is None:
+        group = _groups[name] = SingleFlight(name)
+    return group
+
+
+def get_metrics() -> dict:
+    """
+    Счетчики всех групп: число выполнений, подавленных дубликатов, ошибок, отмен и выполняющихся вызовов.
+
+    Возвращает:
+    - dict: Словарь {имя группы: счетчики}.
+    """
+    return {name: dict(group.stats) for name, group in _groups.items()}
+
+
+async def run_shared(group: SingleFlight, key, session, func, *args):
+    """
+    Выполнение функции чтения с объединением одинаковых одновременных вызовов.
+
+    Общий вызов выполняется в собственной сессии, а не в сессии первого вызвавшего: иначе отмена его запроса
+    закрыла бы сессию посреди запроса, результат которого ждут остальные. Объекты результата после этого
+    отсоединены от сессии и используются только для чтения.
+
+    Собственная сессия берет из пула отдельное соединение на время общего вызова. Если сессия вызывающего уже
+    держит соединение (открытая транзакция), запрос на время чтения занимает два соединения пула, поэтому размер
+    пула (`pool_size` + `max_overflow`) должен оставлять запас сверх числа одновременных запросов. Иначе вызовы,
+    держащие соединение и ждущие второе, упираются в `DB_POOL_TIMEOUT`. При `SINGLE_FLIGHT_ENABLED=false` и с SQLite (все
+    сессии работают через одно соединение, и собственная сессия завершила бы транзакцию вызывающего) функция
+    выполняется в переданной сессии без объединения.
+
+    Аргументы:
+    - group: Группа single-flight.
+    - key: Ключ вызова.
+    - session: Сессия вызывающего.
+    - func: Асинхронная функция, принимающая сессию и `args`.
+    - args: Аргументы функции.
+
+    Возвращает:
+    - Результат функции.
+    """
+    if not SINGLE_FLIGHT_ENABLED or not is_postgres(session):
+        return await func(session, *args)
+
+    async def call():
+        async with get_db() as own_session:
+            return await func(own_session, *args)
+
+    return await group.do(key, call)
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import random
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sanic.log import logger
+
+from app.config import (SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_EXPLAIN_RATE, SLOW_QUERY_EXPLAIN_TIMEOUT,
+                        SLOW_QUERY_LOG_SIZE)
+from app.db import get_asyncpg_dsn
+
+MAX_SQL_LENGTH = 4000
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w$])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = r'(?:\$\d+|\?)(?:::\w+(?:\[\])?)?'
+_PLACEHOLDER_LIST = re.compile(rf'\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)')
+_REPEATED_ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+
+# Повторное выполнение под EXPLAIN ANALYZE допустимо только для чтения: запрос выполняется по-настоящему.
+# Транзакция только для чтения с откатом не дает изменить данные или отправить NOTIFY, а сессионные
+# advisory-блокировки пережили бы откат, поэтому такие запросы не перезапускаются.
+_EXPLAINABLE = re.compile(r'^\s*select\b', re.IGNORECASE)
+_NOT_EXPLAINABLE = re.compile(r'\bpg_advisory|\bfor\s+(?:update|share|no\s+key|key)\b', re.IGNORECASE)
+
+
+def normalize_sql(statement: str) -> str:
+    """
+    Нормализация SQL для группировки одинаковых запросов: пробелы схлопываются, литералы заменяются на `?`,
+    списки параметров (`IN ($1, $2, ...)`) и строки `VALUES` — на `(...)`.
+
+    Аргументы:
+    - statement: Текст запроса.
+
+    Возвращает:
+    - str: Нормализованный текст (не длиннее `MAX_SQL_LENGTH` символов).
+    """
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _PLACEHOLDER_LIST.sub('(...)', statement)
+    statement = _REPEATED_ROWS.sub('(...)', statement)
+    return statement[:MAX_SQL_LENGTH]
+
+
+def _current_route() -> str:
+    from sanic import Request
+    from sanic.exceptions import SanicException
+
+    try:
+        request = Request.get_current()
+    except SanicException:
+        return None
+    # Шаблон маршрута (`/user/accounts/<account_id:int>/balance`), а не конкретный путь
+    path = '/' + request.route.path if request.route is not None else request.path
+    return f'{request.method} {path}'
+
+
+class SlowQueryLog:
+    """
+    Журнал медленных запросов SQLAlchemy с выборочным захватом планов выполнения.
+
+    Подключается к событиям движка и замеряет каждый запрос. Запросы дольше `threshold_ms` миллисекунд попадают
+    в кольцевой буфер из `size` последних записей вместе с нормализованным текстом и маршрутом, на котором они
+    выполнялись. Доля `explain_rate` из них (только чтение) в фоне повторно выполняется под
+    `EXPLAIN (ANALYZE, BUFFERS)` на отдельном соединении, и план добавляется в запись. Одновременно выполняется
+    не больше одного EXPLAIN: пока он идет, новые запросы не захватываются. Запросы, выполненные напрямую через
+    asyncpg (`get_raw_connection`), журнал не видит.
+
+    Аргументы:
+    - threshold_ms: Порог длительности запроса в миллисекундах.
+    - explain_rate: Доля медленных запросов, для которых захватывается план (от 0 до 1).
+    - size: Размер кольцевого буфера.
+    - explain_timeout: Предельное время выполнения EXPLAIN ANALYZE в секундах.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, explain_rate: float = SLOW_QUERY_EXPLAIN_RATE,
+                 size: int = SLOW_QUERY_LOG_SIZE, explain_timeout: float = SLOW_QUERY_EXPLAIN_TIMEOUT):
+        self.threshold = threshold_ms / 1000
+        self.explain_rate = explain_rate
+        self.explain_timeout = explain_timeout
+        self.entries = deque(maxlen=size)
+        self.stats = {'recorded': 0, 'explained': 0, 'explain_errors': 0}
+        self._connection = None
+        self._explaining = None
+
+    def install(self, engine):
+        """
+        Подключение к событиям движка.
+
+        Аргументы:
+        - engine: Асинхронный движок SQLAlchemy.
+        """
+        from sqlalchemy import event
+
+        event.listen(engine.sync_engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine.sync_engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, _conn, _cursor, _statement, _parameters, context, _executemany):
+        context._slow_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, _conn, _cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context._slow_query_started
+        if duration < self.threshold:
+            return
+        entry = {
+            'at': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round(duration * 1000, 3),
+            'route': _current_route(),
+            'sql': normalize_sql(statement),
+            'plan': None,
+        }
+        self.entries.append(entry)
+        self.stats['recorded'] += 1
+        logger.warning('Slow query (%.1f ms) on %s: %s', entry['duration_ms'], entry['route'], entry['sql'])
+
+        if (not executemany and self._explaining is None and random.random() < self.explain_rate
+                and _EXPLAINABLE.match(statement) and not _NOT_EXPLAINABLE.search(statement)):
+            # Событие вызывается в потоке цикла событий (внутри greenlet SQLAlchemy), поэтому задачу можно создать
+            self._explaining = asyncio.get_running_loop().create_task(
+                self._explain(entry, statement, tuple(parameters or ())))
+            self._explaining.add_done_callback(self._explained)
+
+    def _explained(self, _task):
+        self._explaining = None
+
+    async def _get_connection(self):
+        import asyncpg
+
+        if self._connection is None or self._connection.is_closed():
+            self._connection = await asyncpg.connect(
+                get_asyncpg_dsn(), command_timeout=self.explain_timeout + 1,
+                server_settings={'statement_timeout': str(int(self.explain_timeout * 1000))})
+        return self._connection
+
+    async def _explain(self, entry: dict, statement: str, parameters: tuple):
+        try:
+            connection = await self._get_connection()
+            transaction = connection.transaction(readonly=True)
+            await transaction.start()
+            try:
+                plan = await connection.fetchval(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}', *parameters)
+            finally:
+                await transaction.rollback()
+            entry['plan'] = json.loads(plan) if isinstance(plan, str) else plan
+            self.stats['explained'] += 1
+        except Exception as error:
+            entry['plan_error'] = f'{type(error).__name__}: {error}'
+            self.stats['explain_errors'] += 1
+
+    async def close(self):
+        """
+        Закрытие соединения для EXPLAIN.
+        """
+        if self._explaining is not None:
+            self._explaining.cancel()
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+    def get_entries(self, limit: int = None) -> list:
+        """
+        Записи журнала, начиная с последней.
+
+        Аргументы:
+        - limit: Максимальное количество записей (или None, чтобы вернуть все).
+
+        Возвращает:
+        - list: Записи журнала.
+        """
+        entries = list(reversed(self.entries))
+        return entries if limit is None else entries[:limit]
+
+    def get_metrics(self) -> dict:
+        return {'entries': len(self.entries), **self.stats}
+
+
+slow_query_log = SlowQueryLog()
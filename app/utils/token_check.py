@@ -1,8 +1,10 @@
 from sanic import Request, json
+from sanic.log import logger
 
 from app.db import get_db
 from app.models.user import User
-from app.utils.jwt import decode_token
+from app.services import revocation_service
+from app.utils.jwt import REVOCATION_UNKNOWN, decode_request_token
 from sqlalchemy.future import select
 
 
@@ -18,9 +20,12 @@ async def check_admin_permissions(request: Request):
     - request: Объект запроса Sanic, содержащий заголовок с токеном авторизации.
 
     Возвращает:
-    - json: Ответ с кодом 403, если пользователь не является администратором, иначе None.
+    - json: Ответ с кодом 401, если токен отсутствует, недействителен или отозван, ответ с кодом 403, если
+      пользователь не является администратором, иначе None.
     """
     payload = await extract_and_decode_token(request)
+    if not isinstance(payload, dict):
+        return payload
 
     async with get_db() as session:
         result = await session.execute(select(User).where(User.id == payload['user_id']))
@@ -44,12 +49,38 @@ async def extract_and_decode_token(request: Request):
     Возвращает:
     - json или dict: Полезные данные (payload) декодированного токена или ответ с кодом 401 и сообщением об ошибке.
     """
-    token = request.headers.get('Authorization')
-    if not token:
+    payload = await check_revocation(decode_request_token(request))
+    if payload is None:
         return json({'message': 'Unauthorized'}, status=401)
-
-    payload = decode_token(token)
     if 'error' in payload:
         return json({'message': payload['error']}, status=401)
 
     return payload
+
+
+async def check_revocation(payload):
+    """
+    Проверка отзыва токена по базе данных, если состояние отзыва в памяти воркера устарело.
+
+    Пока состояние не синхронизировано (до первой полной синхронизации и после переподключения слушателя
+    уведомлений), `decode_token` не принимает токен, не отозванный по известному состоянию, а возвращает ошибку
+    `REVOCATION_UNKNOWN`. Такой токен проверяется запросом к базе данных; если база данных недоступна, он
+    отклоняется.
+
+    Аргументы:
+    - payload: Результат `decode_token` (или None).
+
+    Возвращает:
+    - dict: Полезные данные токена или словарь с ключом `error` (или None, если токен отсутствует).
+    """
+    if payload is None or payload.get('error') != REVOCATION_UNKNOWN:
+        return payload
+    try:
+        async with get_db() as session:
+            revoked = await revocation_service.is_token_revoked(session, payload['payload'])
+    except Exception:
+        logger.exception('Token revocation check failed')
+        return {'error': REVOCATION_UNKNOWN}
+    if revoked:
+        return {'error': 'Token has been revoked'}
+    return payload['payload']
@@ -0,0 +1,160 @@
+import time
+
+from app.utils.pg_listener import listener
+
+# Канал Postgres, через который отзывы сразу расходятся по всем воркерам и узлам
+CHANNEL = 'token_revocation'
+# Ограничение полезной нагрузки NOTIFY (8000 байт) с запасом
+MAX_PAYLOAD = 7900
+
+
+class RevocationSet:
+    """
+    Компактное состояние отзыва токенов в памяти воркера, проверяемое за O(1) без обращения к базе данных.
+
+    Для пользователей хранится момент отзыва всех токенов (`not_before`, секунды Unix) в словаре по идентификатору
+    пользователя (только для пользователей с действующим отзывом), для отдельных токенов — множество отозванных
+    `jti`. Состояние обновляется уведомлениями `CHANNEL` сразу после отзыва и периодической инкрементальной
+    синхронизацией с таблицами `user_token_epochs` и `revoked_tokens` (`app.tasks.token_revocation_sync`) на
+    случай потерянных уведомлений.
+
+    До первой полной синхронизации и после переподключения слушателя уведомлений (`stale`) состояние может не
+    содержать последних отзывов: токен, не отозванный по известному состоянию, тогда не считается действующим, а
+    проверяется по базе данных (`app.utils.token_check`).
+    """
+
+    def __init__(self):
+        self._epochs = {}
+        self._jtis = set()
+        self.synced_at = None
+        self.full_reload_at = None
+        self.stale = True
+
+    def is_revoked(self, payload: dict):
+        """
+        Проверка, отозван ли токен.
+
+        Токены без `iat` (выпущенные до появления отзыва) считаются выпущенными в момент 0 и отзываются любым
+        отзывом всех токенов пользователя.
+
+        Аргументы:
+        - payload: Полезные данные декодированного токена.
+
+        Возвращает:
+        - bool: True, если токен отозван, False, если нет, или None, если токен не отозван по известному
+          состоянию, но состояние устарело (`stale`).
+        """
+        not_before = self._epochs.get(payload.get('user_id'))
+        if not_before is not None and payload.get('iat', 0) < not_before:
+            return True
+        jti = payload.get('jti')
+        if jti is not None and jti in self._jtis:
+            return True
+        return None if self.stale else False
+
+    def revoke_user(self, user_id: int, not_before: int):
+        """
+        Отзыв всех токенов пользователя, выпущенных раньше `not_before`.
+
+        Аргументы:
+        - user_id: Идентификатор пользователя.
+        - not_before: Момент отзыва (секунды Unix).
+        """
+        if not_before > self._epochs.get(user_id, 0):
+            self._epochs[user_id] = not_before
+
+    def revoke_jti(self, jti: str):
+        """
+        Отзыв одного токена.
+
+        Аргументы:
+        - jti: Идентификатор токена.
+        """
+        self._jtis.add(jti)
+
+    def apply(self, epochs, jtis, full: bool = False):
+        """
+        Применение изменений из базы данных.
+
+        Аргументы:
+        - epochs: Пары (идентификатор пользователя, `not_before`).
+        - jtis: Идентификаторы отозванных токенов.
+        - full: True, если это полное состояние: оно заменяет текущее (истекшие отзывы при этом забываются).
+        """
+        if full:
+            self._epochs = {}
+            self._jtis = set()
+        for user_id, not_before in epochs:
+            self.revoke_user(user_id, not_before)
+        self._jtis.update(jtis)
+        self.synced_at = time.time()
+        if full:
+            self.full_reload_at = self.synced_at
+            self.stale = False
+
+    def get_metrics(self) -> dict:
+        return {
+            'users': len(self._epochs),
+            'revoked_tokens': len(self._jtis),
+            'stale': self.stale,
+            'synced_at': self.synced_at,
+            'full_reload_at': self.full_reload_at,
+        }
+
+
+revocations = RevocationSet()
+
+
+def encode_user(user_id: int, not_before: int) -> str:
+    return f'user:{user_id}:{not_before}'
+
+
+def encode_users(user_ids, not_before: int) -> list:
+    """
+    Сериализация отзыва токенов нескольких пользователей с одним моментом отзыва.
+
+    Аргументы:
+    - user_ids: Идентификаторы пользователей.
+    - not_before: Момент отзыва (секунды Unix).
+
+    Возвращает:
+    - list: Полезные нагрузки NOTIFY, каждая не длиннее `MAX_PAYLOAD`.
+    """
+    prefix = f'users:{not_before}:'
+    payloads, current, size = [], [], len(prefix)
+    for user_id in user_ids:
+        item = str(user_id)
+        if current and size + len(item) + 1 > MAX_PAYLOAD:
+            payloads.append(prefix + ','.join(current))
+            current, size = [], len(prefix)
+        current.append(item)
+        size += len(item) + 1
+    if current:
+        payloads.append(prefix + ','.join(current))
+    return payloads
+
+
+def encode_jti(jti: str) -> str:
+    return f'jti:{jti}'
+
+
+def _on_notify(payload: str):
+    kind, _, value = payload.partition(':')
+    if kind == 'user':
+        user_id, _, not_before = value.partition(':')
+        revocations.revoke_user(int(user_id), int(not_before))
+    elif kind == 'users':
+        not_before, _, user_ids = value.partition(':')
+        for user_id in user_ids.split(','):
+            revocations.revoke_user(int(user_id), int(not_before))
+    elif kind == 'jti':
+        revocations.revoke_jti(value)
+
+
+def _on_reconnect():
+    # Уведомления, отправленные во время разрыва соединения, потеряны: следующая синхронизация будет полной
+    revocations.stale = True
+
+
+listener.add_listener(CHANNEL, _on_notify)
+listener.on_reconnect(_on_reconnect)
@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import time
+
+from app.config import TRAFFIC_CAPTURE_DIR, TRAFFIC_CAPTURE_ROTATE_BYTES, TRAFFIC_CAPTURE_ROTATE_SECONDS
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - зависит от окружения
+    zstandard = None
+
+ZSTD_LEVEL = 3
+REDACTED = '***'
+# Поля тела запроса, значения которых не попадают в запись (на любой глубине вложенности)
+SECRET_FIELDS = frozenset({'password', 'hashed_password', 'signature', 'token', 'secret', 'authorization'})
+PARTIAL_SUFFIX = '.part'
+
+
+def redact(value):
+    """
+    Замена значений секретных полей (`SECRET_FIELDS`) на `***` в JSON-значении.
+
+    Аргументы:
+    - value: Декодированное JSON-значение.
+
+    Возвращает:
+    - Копия значения с замененными секретами.
+    """
+    if isinstance(value, dict):
+        return {key: REDACTED if key.lower() in SECRET_FIELDS else redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+class CaptureWriter:
+    """
+    Запись захваченных запросов в сжатые NDJSON-файлы с ротацией.
+
+    Каждый воркер пишет в свои файлы `capture-<pid>-<время>.ndjson.zst` (без zstandard — `.ndjson`). Файл
+    закрывается и начинается новый, когда объем записанных данных превышает `rotate_bytes` или файл открыт дольше
+    `rotate_seconds` секунд. Пока файл пишется, у него суффикс `.part`: читатели видят только закрытые файлы.
+
+    Аргументы:
+    - directory: Каталог файлов.
+    - rotate_bytes: Объем несжатых данных, после которого файл ротируется.
+    - rotate_seconds: Время, после которого файл ротируется.
+    """
+
+    def __init__(self, directory: str = TRAFFIC_CAPTURE_DIR, rotate_bytes: int = TRAFFIC_CAPTURE_ROTATE_BYTES,
+                 rotate_seconds: float = TRAFFIC_CAPTURE_ROTATE_SECONDS):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.records = 0
+        self._stream = None
+        self._path = None
+        self._opened_at = 0.0
+        self._written = 0
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        suffix = '.ndjson.zst' if zstandard is not None else '.ndjson'
+        name = f'capture-{os.getpid()}-{time.strftime("%Y%m%dT%H%M%S")}-{time.time_ns() % 1_000_000:06d}{suffix}'
+        self._path = os.path.join(self.directory, name)
+        file = open(self._path + PARTIAL_SUFFIX, 'wb')
+        if zstandard is not None:
+            self._stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(file)
+        else:
+            self._stream = io.BufferedWriter(file)
+        self._opened_at = time.monotonic()
+        self._written = 0
+
+    def write(self, record: dict):
+        """
+        Запись одного запроса.
+
+        Аргументы:
+        - record: Запись запроса.
+        """
+        if self._stream is None:
+            self._open()
+        line = json.dumps(record, separators=(',', ':'), default=str).encode() + b'\n'
+        self._stream.write(line)
+        self._written += len(line)
+        self.records += 1
+        if self._written >= self.rotate_bytes or time.monotonic() - self._opened_at >= self.rotate_seconds:
+            self.close()
+
+    def close(self):
+        """
+        Закрытие текущего файла (следующая запись откроет новый).
+        """
+        if self._stream is None:
+            return
+        self._stream.close()
+        os.replace(self._path + PARTIAL_SUFFIX, self._path)
+        self._stream = None
+
+
+def iter_records(path: str):
+    """
+    Чтение записей из файла захвата (`.ndjson` или `.ndjson.zst`).
+
+    Аргументы:
+    - path: Путь к файлу.
+
+    Возвращает:
+    - Итератор по записям (dict).
+    """
+    with open(path, 'rb') as file:
+        if path.endswith('.zst'):
+            if zstandard is None:
+                raise RuntimeError('zstandard is required to read ' + path)
+            stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True))
+        else:
+            stream = file
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from app.config import WEBHOOK_SPOOL_DIR
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+SUFFIX = '.json'
+FAILED_DIR = 'failed'
+LOCK_FILE = '.lock'
+
+
+class WebhookSpool:
+    """
+    Локальная очередь вебхуков на диске для приема платежей, пока база данных недоступна.
+
+    Каждый вебхук хранится в отдельном файле, имя которого начинается с времени записи, поэтому файлы
+    воспроизводятся в порядке поступления. Файл записывается во временный, сбрасывается на диск и атомарно
+    переименовывается: после ответа платежной системе вебхук не теряется и при падении процесса, а недописанный
+    файл никогда не попадает в очередь. Вебхуки, которые не удалось применить, переносятся в подкаталог `failed`.
+
+    Аргументы:
+    - directory: Каталог очереди.
+    """
+
+    def __init__(self, directory: str = WEBHOOK_SPOOL_DIR):
+        self.directory = directory
+        self.failed_directory = os.path.join(directory, FAILED_DIR)
+
+    async def append(self, payload: dict) -> str:
+        """
+        Запись вебхука в очередь.
+
+        Аргументы:
+        - payload: Данные вебхука.
+
+        Возвращает:
+        - str: Имя файла в очереди.
+        """
+        return await asyncio.to_thread(self._write, json.dumps(payload).encode())
+
+    def _write(self, data: bytes) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f'{time.time_ns():020d}-{uuid.uuid4().hex}{SUFFIX}'
+        path = os.path.join(self.directory, name)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+        self._sync_directory()
+        return name
+
+    def _sync_directory(self):
+        if fcntl is None:
+            return
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def pending(self) -> list:
+        """
+        Имена файлов очереди в порядке поступления.
+
+        Возвращает:
+        - list: Имена файлов.
+        """
+        try:
+            return sorted(name for name in os.listdir(self.directory) if name.endswith(SUFFIX))
+        except FileNotFoundError:
+            return []
+
+    def read(self, name: str) -> dict:
+        with open(os.path.join(self.directory, name), 'rb') as file:
+            return json.loads(file.read())
+
+    def remove(self, name: str):
+        os.remove(os.path.join(self.directory, name))
+
+    def reject(self, name: str):
+        os.makedirs(self.failed_directory, exist_ok=True)
+        os.replace(os.path.join(self.directory, name), os.path.join(self.failed_directory, name))
+
+    @contextmanager
+    def lock(self):
+        """
+        Неблокирующая межпроцессная блокировка очереди: воспроизводить ее в каждый момент может только один воркер.
+        Блокировка снимается операционной системой и при падении процесса.
+
+        Возвращает:
+        - bool: True, если блокировка получена.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, LOCK_FILE), os.O_RDWR | os.O_CREAT)
+        try:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            except OSError:
+                yield False
+                return
+            yield True
+        finally:
+            os.close(fd)
+
+
+spool = WebhookSpool()
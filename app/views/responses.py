@@ -24,6 +24,28 @@ def all_users_response(users):
     } for user in users])
 
 
+def search_users_response(users, next_cursor):
+    """
+    Формирует JSON-ответ со страницей результатов поиска пользователей.
+
+    Аргументы:
+    - users: Список объектов User на странице.
+    - next_cursor: Курсор следующей страницы (или None, если это последняя страница).
+
+    Возвращает:
+    - json: JSON-ответ с пользователями (без счетов) и курсором следующей страницы.
+    """
+    return response.json({
+        'users': [{
+            'id': user.id,
+            'email': user.email,
+            'full_name': user.full_name,
+            'is_admin': user.is_admin,
+        } for user in users],
+        'next_cursor': next_cursor,
+    })
+
+
 def user_auth_response(user_id, token):
     """
     Формирует JSON-ответ для успешного входа пользователя.
@@ -83,6 +105,25 @@ def get_accounts_response(accounts):
         for account in accounts])
 
 
+def get_balance_response(account_id, balance, at):
+    """
+    Формирует JSON-ответ с балансом счета на момент времени.
+
+    Аргументы:
+    - account_id: Идентификатор счета.
+    - balance: Баланс счета.
+    - at: Момент времени, на который вычислен баланс (или None для текущего баланса).
+
+    Возвращает:
+    - json: JSON-ответ с идентификатором счета, балансом и моментом времени.
+    """
+    return response.json({
+        'id': account_id,
+        'balance': balance,
+        'at': at.isoformat() if at else None
+    })
+
+
 def get_payments_response(payments):
     """
     Формирует JSON-ответ для списка платежей пользователя.
@@ -100,3 +141,79 @@ def get_payments_response(payments):
         'amount': payment.amount,
         'account_id': payment.account_id}
         for payment in payments])
+
+
+def get_payment_stats_response(stats):
+    """
+    Формирует JSON-ответ со статистикой платежей.
+
+    Аргументы:
+    - stats: Словарь со статистикой: общие сумма и количество платежей, суммы по счетам и объем по дням.
+
+    Возвращает:
+    - json: JSON-ответ со статистикой платежей.
+    """
+    return response.json({
+        'total_amount': stats['total_amount'],
+        'payment_count': stats['payment_count'],
+        'accounts': stats['accounts'],
+        'daily': stats['daily']
+    })
+
+
+def get_metrics_response(metrics):
+    """
+    Формирует JSON-ответ с метриками воркера.
+
+    Аргументы:
+    - metrics: Словарь с метриками по подсистемам.
+
+    Возвращает:
+    - json: JSON-ответ с метриками.
+    """
+    return response.json(metrics)
+
+
+def get_slow_queries_response(entries):
+    """
+    Формирует JSON-ответ с журналом медленных запросов.
+
+    Аргументы:
+    - entries: Записи журнала (время, длительность, маршрут, нормализованный SQL, план выполнения).
+
+    Возвращает:
+    - json: JSON-ответ с записями журнала.
+    """
+    return response.json({'queries': entries})
+
+
+def get_profiling_response(profile):
+    """
+    Формирует JSON-ответ с результатами профилирования воркера.
+
+    Аргументы:
+    - profile: Словарь с результатами (память процесса, места выделения, объекты ORM или профиль CPU).
+
+    Возвращает:
+    - json: JSON-ответ с результатами профилирования.
+    """
+    return response.json(profile)
+
+
+def bulk_users_response(results):
+    """
+    Формирует JSON-ответ с результатами массовой операции над пользователями.
+
+    Аргументы:
+    - results: Пары (идентификатор пользователя, статус) в порядке обработки.
+
+    Возвращает:
+    - json: JSON-ответ с результатом по каждому пользователю и количеством пользователей по статусам.
+    """
+    counts = {}
+    for _, status in results:
+        counts[status] = counts.get(status, 0) + 1
+    return response.json({
+        'results': [{'id': user_id, 'status': status} for user_id, status in results],
+        'counts': counts,
+    })
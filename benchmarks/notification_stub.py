@@ -0,0 +1,136 @@
+"""
+Локальный получатель уведомлений о платежах для проверки `app.tasks.notification_dispatcher`.
+
+Принимает `POST` с пакетами `{"events": [...]}`, проверяет подпись `X-Notification-Signature` ключом получателя
+(выводится из `NOTIFICATION_SECRET` и URL `http://<Host><путь>`, поэтому `notification_url` задается с портом) и
+раз в секунду печатает число соединений, запросов, событий и ошибок подписи. Часть запросов можно отклонять ответом
+503 (`--fail-rate`) и замедлять (`--delay`), чтобы проверить повторы.
+Соединения держатся открытыми (keep-alive), поэтому по числу соединений видно переиспользование пула.
+
+    python -m benchmarks.notification_stub --port 8099 --fail-rate 0.1 --delay 0.05
+
+Для проверки отправителя без базы данных можно отправить пакеты через `HttpPools` прямо в заглушку:
+
+    python -m benchmarks.notification_stub --self-test --events 100000 --batch-size 100 --concurrency 16
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import random
+import time
+
+from app.services import notification_service
+from app.utils.http_pool import HttpPools
+
+stats = {'connections': 0, 'requests': 0, 'events': 0, 'rejected': 0, 'bad_signature': 0}
+
+
+async def handle_connection(reader, writer, fail_rate: float, delay: float):
+    stats['connections'] += 1
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            lines = head.decode('latin-1').split('\r\n')
+            path = lines[0].split(' ')[1]
+            headers = {}
+            for line in lines[1:]:
+                if line:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            stats['requests'] += 1
+            if delay:
+                await asyncio.sleep(delay)
+
+            if not hmac.compare_digest(headers.get(notification_service.SIGNATURE_HEADER.lower(), ''),
+                                       notification_service.sign(body, f'http://{headers.get("host")}{path}')):
+                stats['bad_signature'] += 1
+                status, reason = 401, 'Unauthorized'
+            elif random.random() < fail_rate:
+                stats['rejected'] += 1
+                status, reason = 503, 'Service Unavailable'
+            else:
+                stats['events'] += len(json.loads(body)['events'])
+                status, reason = 200, 'OK'
+            writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\n\r\n'.encode())
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def report(started: float):
+    while True:
+        await asyncio.sleep(1)
+        print(f'{time.perf_counter() - started:7.1f}s  ' + '  '.join(f'{k}={v}' for k, v in stats.items()))
+
+
+async def serve(args):
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(reader, writer, args.fail_rate, args.delay), args.host, args.port)
+    print(f'Listening on http://{args.host}:{args.port}/')
+    reporter = asyncio.create_task(report(time.perf_counter()))
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            reporter.cancel()
+
+
+async def self_test(args):
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(reader, writer, args.fail_rate, args.delay), args.host, args.port)
+    pools = HttpPools(args.connections)
+    destination = f'http://{args.host}:{args.port}/hooks/payments'
+    pool, target = pools.get(destination)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    delivered = 0
+
+    async def send(first: int, count: int):
+        nonlocal delivered
+        events = [{'type': notification_service.EVENT_PAYMENT, 'transaction_id': f'tx-{first + i}', 'amount': 1.0}
+                  for i in range(count)]
+        body = notification_service.encode_batch(events)
+        headers = {'Content-Type': 'application/json',
+                   notification_service.SIGNATURE_HEADER: notification_service.sign(body, destination)}
+        # Повторы без задержки: проверяется только то, что отклоненные пакеты доходят со второй попытки
+        while True:
+            async with semaphore:
+                status, _headers, _body = await pool.request('POST', target, headers, body)
+            if status == 200:
+                delivered += count
+                return
+
+    started = time.perf_counter()
+    async with server:
+        await asyncio.gather(*(send(first, min(args.batch_size, args.events - first))
+                               for first in range(0, args.events, args.batch_size)))
+        elapsed = time.perf_counter() - started
+        pools.close()
+        # Обработчики заглушки должны увидеть закрытие соединений до остановки цикла событий
+        await asyncio.sleep(0.1)
+    print(f'delivered {delivered} events in {elapsed:.2f}s ({delivered / elapsed:.0f} events/s)')
+    print('receiver:', stats)
+    print('pool:', pools.get_metrics())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Доля запросов, отклоняемых ответом 503')
+    parser.add_argument('--delay', type=float, default=0.0, help='Задержка ответа в секундах')
+    parser.add_argument('--self-test', action='store_true', help='Отправить пакеты в заглушку через HttpPools')
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--connections', type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(self_test(args) if args.self_test else serve(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Бенчмарк: обычная таблица платежей против партиционированной по `created_at`.
+
+Создает в отдельной схеме `bench` две таблицы одинаковой структуры (обычную и партиционированную по месяцам),
+заполняет их синтетическими данными (по умолчанию 50M строк) и измеряет задержку типичных запросов:
+выборки платежей счета за последний месяц, поиска по `transaction_id` и одиночной вставки.
+
+    python -m benchmarks.payments_partitioning --rows 50000000 --accounts 100000 --months 24
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import statistics
+import time
+
+import asyncpg
+
+from app.config import DATABASE_URL
+
+COLUMNS = """
+    id BIGINT NOT NULL,
+    transaction_id VARCHAR NOT NULL,
+    amount FLOAT NOT NULL,
+    account_id INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL
+"""
+
+
+def asyncpg_dsn(url: str) -> str:
+    return url.replace('postgresql+asyncpg://', 'postgresql://', 1)
+
+
+async def setup(conn, rows: int, accounts: int, months: int, batch: int):
+    await conn.execute("DROP SCHEMA IF EXISTS bench CASCADE")
+    await conn.execute("CREATE SCHEMA bench")
+    await conn.execute(f"CREATE TABLE bench.payments_plain ({COLUMNS}, PRIMARY KEY (id))")
+    await conn.execute(
+        f"CREATE TABLE bench.payments_part ({COLUMNS}, PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)")
+    for offset in range(-months, 2):
+        await conn.execute(
+            f"""
+            CREATE TABLE bench.payments_part_{offset + months} PARTITION OF bench.payments_part
+            FOR VALUES FROM (date_trunc('month', now()) + interval '{offset} month')
+                         TO (date_trunc('month', now()) + interval '{offset + 1} month')
+            """
+        )
+
+    for table in ('payments_plain', 'payments_part'):
+        started = time.perf_counter()
+        for low in range(1, rows + 1, batch):
+            high = min(low + batch - 1, rows)
+            await conn.execute(
+                f"""
+                INSERT INTO bench.{table} (id, transaction_id, amount, account_id, created_at)
+                SELECT g, md5(g::text), (g % 1000) + 0.5, (hashint8(g) & 2147483647) % $1 + 1,
+                       now() - random() * interval '{months} month'
+                FROM generate_series($2::bigint, $3::bigint) AS g
+                """,
+                accounts, low, high,
+            )
+        await conn.execute(f"CREATE INDEX ON bench.{table} (account_id, created_at)")
+        await conn.execute(f"CREATE INDEX ON bench.{table} (transaction_id)")
+        await conn.execute(f"ANALYZE bench.{table}")
+        print(f'{table}: loaded {rows} rows in {time.perf_counter() - started:.1f}s')
+
+
+async def measure(conn, query: str, args_factory, iterations: int) -> list:
+    statement = await conn.prepare(query)
+    timings = []
+    for _ in range(iterations):
+        args = args_factory()
+        started = time.perf_counter()
+        await statement.fetch(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name: str, timings: list):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f'  {name:<28} p50={statistics.median(timings):8.3f}ms  p99={p99:8.3f}ms')
+
+
+async def run(args):
+    conn = await asyncpg.connect(asyncpg_dsn(DATABASE_URL))
+    try:
+        if not args.skip_load:
+            await setup(conn, args.rows, args.accounts, args.months, args.batch)
+
+        next_id = args.rows + 1
+        for table in ('payments_plain', 'payments_part'):
+            print(table)
+            timings = await measure(
+                conn,
+                f"SELECT * FROM bench.{table} WHERE account_id = $1 AND created_at >= now() - interval '1 month'",
+                lambda: (random.randint(1, args.accounts),), args.iterations)
+            report('account, last month', timings)
+
+            timings = await measure(
+                conn, f"SELECT * FROM bench.{table} WHERE transaction_id = $1",
+                lambda: (hashlib.md5(str(random.randint(1, args.rows)).encode()).hexdigest(),), args.iterations)
+            report('by transaction_id', timings)
+
+            def insert_args():
+                nonlocal next_id
+                next_id += 1
+                return next_id, f'bench-{next_id}', 1.0, random.randint(1, args.accounts)
+
+            timings = await measure(
+                conn,
+                f"INSERT INTO bench.{table} (id, transaction_id, amount, account_id, created_at) "
+                f"VALUES ($1, $2, $3, $4, now())",
+                insert_args, args.iterations)
+            report('single insert', timings)
+
+        if not args.keep:
+            await conn.execute("DROP SCHEMA bench CASCADE")
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plain vs partitioned payments table benchmark')
+    parser.add_argument('--rows', type=int, default=50_000_000)
+    parser.add_argument('--accounts', type=int, default=100_000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--batch', type=int, default=1_000_000)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--skip-load', action='store_true', help='Reuse tables from a previous run')
+    parser.add_argument('--keep', action='store_true', help='Do not drop the bench schema afterwards')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
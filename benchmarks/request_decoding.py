@@ -0,0 +1,68 @@
+"""
+Бенчмарк декодирования и проверки тел запросов.
+
+Сравнивает пропускную способность трех путей для тел вебхука и обновления пользователя:
+- `request.json` + обращение к полям словаря (как было в обработчиках, без проверки типов);
+- схемы `app.schemas` с msgspec (объект строится прямо из байтов);
+- схемы `app.schemas` с резервной реализацией на стандартной библиотеке.
+
+    python -m benchmarks.request_decoding --number 200000
+"""
+import argparse
+import json
+import timeit
+
+from app import schemas
+
+BODIES = {
+    'webhook': (schemas.WebhookPayload, json.dumps({
+        'transaction_id': '5eae174f-7cd0-472c-bd36-35660f00132b', 'user_id': 1, 'account_id': 1, 'amount': 100,
+        'signature': '7b47e41efe564a062029da3367bde8844bea0fb049f894687cee5d57f2858bc8'}).encode()),
+    'user_update': (schemas.UserUpdatePayload, json.dumps({
+        'email': 'user@example.com', 'full_name': 'Test User', 'password': 'secret'}).encode()),
+}
+
+
+def dict_access(body: bytes, fields: tuple):
+    data = json.loads(body)
+    return tuple(data[field] for field in fields)
+
+
+def fallback_schema(schema):
+    """
+    Dataclass-версия схемы для резервной реализации (если схемы построены на msgspec).
+    """
+    if schemas.msgspec is None:
+        return schema
+    fields = [(field.name, field.type) if field.required else (field.name, field.type, field.default)
+              for field in schemas.msgspec.structs.fields(schema)]
+    return schemas._define_dataclass(schema.__name__, fields)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Request body decoding benchmark')
+    parser.add_argument('--number', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, (schema, body) in BODIES.items():
+        fields = tuple(json.loads(body))
+        fallback = fallback_schema(schema)
+        paths = {
+            'request.json + dict': lambda: dict_access(body, fields),
+            'fallback schema': lambda: schemas._decode_fallback(fallback, body),
+        }
+        if schemas.msgspec is not None:
+            paths['msgspec schema'] = lambda: schemas.decode(schema, body)
+
+        print(f'{name} ({len(body)} bytes):')
+        baseline = None
+        for label, func in paths.items():
+            best = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+            rate = args.number / best
+            baseline = baseline or rate
+            print(f'  {label:22s} {rate / 1000:8.0f}k/s  {best / args.number * 1e9:6.0f}ns/op  x{rate / baseline:.2f}')
+
+
+if __name__ == '__main__':
+    main()
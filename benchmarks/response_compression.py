@@ -0,0 +1,73 @@
+"""
+Бенчмарк сжатия ответов: байты на проводе и процессорное время на ответ.
+
+Тела строятся теми же функциями, что и в обработчиках (`all_users_response`, `get_payments_response`), на
+синтетических данных разного объема и сжимаются каждым поддерживаемым алгоритмом целиком и потоково (частями,
+как в потоковых ответах).
+
+    python -m benchmarks.response_compression --rows 100 1000 10000
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from app.middlewares.compression_middleware import SUPPORTED_ENCODINGS, StreamEncoder, compress
+from app.views.responses import all_users_response, get_payments_response
+
+
+def users_body(rows: int) -> bytes:
+    rng = random.Random(rows)
+    users = [SimpleNamespace(
+        id=user_id, email=f'user{user_id}@example.com', full_name=f'Test User {user_id}', is_admin=False,
+        accounts=[SimpleNamespace(id=user_id * 10 + index, balance=round(rng.uniform(0, 10_000), 2))
+                  for index in range(rng.randint(1, 3))])
+        for user_id in range(1, rows + 1)]
+    return all_users_response(users).body
+
+
+def payments_body(rows: int) -> bytes:
+    rng = random.Random(rows)
+    payments = [SimpleNamespace(id=payment_id, amount=round(rng.uniform(1, 1_000), 2), account_id=rng.randint(1, 50))
+                for payment_id in range(1, rows + 1)]
+    return get_payments_response(payments).body
+
+
+def cpu_per_call(func, min_time: float = 0.2) -> tuple:
+    calls = 0
+    started = time.process_time()
+    while True:
+        result = func()
+        calls += 1
+        elapsed = time.process_time() - started
+        if elapsed >= min_time:
+            return result, elapsed / calls
+
+
+def stream(body: bytes, encoding: str, chunk_size: int) -> bytes:
+    encoder = StreamEncoder(encoding)
+    parts = [encoder.chunk(body[start:start + chunk_size]) for start in range(0, len(body), chunk_size)]
+    parts.append(encoder.finish())
+    return b''.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Response compression benchmark')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--chunk-size', type=int, default=16384, help='Размер части для потокового сжатия')
+    args = parser.parse_args()
+
+    for shape, build in (('all_users_response', users_body), ('get_payments_response', payments_body)):
+        for rows in args.rows:
+            body = build(rows)
+            print(f'{shape} rows={rows}: {len(body)} bytes uncompressed')
+            for encoding in SUPPORTED_ENCODINGS:
+                whole, whole_cpu = cpu_per_call(lambda: compress(body, encoding))
+                streamed, stream_cpu = cpu_per_call(lambda: stream(body, encoding, args.chunk_size))
+                print(f'  {encoding:5s} whole {len(whole):9d} bytes (x{len(body) / len(whole):5.1f}) '
+                      f'{whole_cpu * 1000:7.2f}ms CPU | stream {len(streamed):9d} bytes '
+                      f'{stream_cpu * 1000:7.2f}ms CPU')
+
+
+if __name__ == '__main__':
+    main()
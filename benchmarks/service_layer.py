@@ -0,0 +1,95 @@
+"""
+Бенчмарк слоя сервисов на SQLite в памяти, без сети и без Postgres.
+
+Создает схему по `Base.metadata`, загружает тестовые данные (`fixture_service`) и измеряет задержку типичных
+вызовов `user_service`, `payment_service` и `admin_service` в одном процессе. Стоимость запроса к SQLite в памяти
+мала, поэтому результат в основном отражает работу Python: построение и компиляцию запросов SQLAlchemy,
+материализацию объектов ORM и код сервисов. Для профилирования горячих мест — `--profile`.
+
+    python -m benchmarks.service_layer --users 10000 --payments-per-account 10 --number 2000
+"""
+import os
+
+# Бэкенд выбирается до импорта конфигурации приложения
+os.environ['DATABASE_URL'] = 'sqlite+aiosqlite://'
+os.environ.setdefault('DB_ECHO', 'false')
+
+import argparse
+import asyncio
+import cProfile
+import pstats
+import statistics
+import time
+from datetime import datetime, timezone
+
+from app.db import create_schema, get_db, dispose_engine
+from app.services import admin_service, fixture_service, payment_service, user_service
+
+
+async def webhook_flow(session, user_id: int, account_id: int, number: int):
+    # Последовательность вызовов обработки вебхука через ORM (без журнала и корзин статистики)
+    await payment_service.get_user_by_id(session, user_id)
+    await payment_service.get_payment_by_transaction_id(session, f'bench-{number}')
+    account = await payment_service.get_account_by_id_and_user_id(session, account_id, user_id)
+    await payment_service.create_payment(session, f'bench-{number}', 1.0, account_id, datetime.now(timezone.utc))
+    await payment_service.update_account_balance(session, account, 1.0)
+
+
+def scenarios(users: int, accounts_per_user: int) -> dict:
+    # Синтетические пользователи идут после пользователей по умолчанию; первый счет пользователя
+    first_user = len(fixture_service.DEFAULT_USERS) + 1
+    user_id = lambda n: first_user + n % users
+    account_id = lambda n: (user_id(n) - 1) * accounts_per_user + 1
+    return {
+        'get_user_by_id': lambda session, n: user_service.get_user_by_id(session, user_id(n)),
+        'get_accounts_by_user_id': lambda session, n: user_service.get_accounts_by_user_id(session, user_id(n)),
+        'get_payments_by_user_id': lambda session, n: user_service.get_payments_by_user_id(session, user_id(n)),
+        'search_users (prefix)': lambda session, n: admin_service.search_users(session, f'fixture-{user_id(n)}', 20),
+        'webhook flow': lambda session, n: webhook_flow(session, user_id(n), account_id(n), n),
+    }
+
+
+async def run(args):
+    started = time.perf_counter()
+    await create_schema()
+    async with get_db() as session:
+        counts = await fixture_service.load_fixtures(session, args.users, args.accounts_per_user,
+                                                     args.payments_per_account, ledger=False)
+    print(f'loaded {counts} in {time.perf_counter() - started:.2f}s')
+
+    profiler = cProfile.Profile() if args.profile else None
+    for name, call in scenarios(args.users, args.accounts_per_user).items():
+        timings = []
+        async with get_db() as session:
+            for n in range(args.number):
+                if profiler:
+                    profiler.enable()
+                call_started = time.perf_counter()
+                await call(session, n)
+                timings.append(time.perf_counter() - call_started)
+                if profiler:
+                    profiler.disable()
+                # Объекты предыдущих вызовов не накапливаются в identity map сессии
+                session.expunge_all()
+        timings.sort()
+        print(f'  {name:26s} {len(timings) / sum(timings):8.0f} ops/s  '
+              f'p50 {statistics.median(timings) * 1e6:7.0f}us  p99 {timings[int(len(timings) * 0.99)] * 1e6:7.0f}us')
+    await dispose_engine()
+
+    if profiler:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--accounts-per-user', type=int, default=2)
+    parser.add_argument('--payments-per-account', type=int, default=10)
+    parser.add_argument('--number', type=int, default=2000, help='Количество вызовов каждого сценария')
+    parser.add_argument('--profile', action='store_true', help='Профилировать вызовы (cProfile)')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Бенчмарк холодного старта: время импорта пакета `app` по данным `python -X importtime`.
+
+Каждый запуск выполняется в отдельном процессе. Скрипт выводит лучшее и медианное общее время импорта и самые
+тяжелые модули, а также проверяет, что тяжелые зависимости (драйвер БД, passlib, PyJWT, pyarrow, numpy) не
+загружаются при импорте. С бюджетом сравнивается лучший запуск: шум планировщика и дискового кеша только
+увеличивает время, поэтому минимум устойчивее медианы. Общее время зависит от скорости машины, поэтому отдельно
+проверяется собственное время приложения: лучший импорт `app` минус лучший импорт обязательных зависимостей
+(`BASELINE_MODULES`), измеренных в тех же запусках. При превышении бюджета или загрузке запрещенных модулей
+скрипт завершается с кодом 1, поэтому его можно использовать как проверку в CI (собственное время проверяет
+`tests/test_startup.py`):
+
+    python -m benchmarks.startup_importtime --runs 5 --budget-ms 450 --overhead-budget-ms 150
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+LAZY_MODULES = ('asyncpg', 'passlib', 'jwt', 'pyarrow', 'numpy')
+# Зависимости, без которых `import app` невозможен: время их импорта показывает скорость машины
+BASELINE_MODULES = 'sanic, sqlalchemy.orm, sqlalchemy.ext.asyncio, sqlalchemy.dialects.postgresql'
+
+
+def measure(module: str) -> tuple:
+    """
+    Импортирует модуль в отдельном процессе с `-X importtime`.
+
+    Аргументы:
+    - module: Имя импортируемого модуля (или несколько имен через запятую).
+
+    Возвращает:
+    - tuple: (общее время импорта в мс, словарь {модуль: собственное время в мс}).
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    total = 0.0
+    modules = {}
+    started = False
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(self_us) / 1000
+        # Модули верхнего уровня выводятся с одним пробелом, вложенные — с дополнительным отступом. Импорты
+        # команды идут после модуля site, который загружается при старте интерпретатора
+        if name == ' site':
+            started = True
+        elif started and not name.startswith('  '):
+            total += int(cumulative_us) / 1000
+    return total, modules
+
+
+def check(module: str = 'app', runs: int = 5, budget_ms: float = None, overhead_budget_ms: float = None) -> tuple:
+    """
+    Измеряет импорт модуля несколько раз и проверяет бюджеты и ленивые зависимости.
+
+    Аргументы:
+    - module: Имя импортируемого модуля.
+    - runs: Количество запусков.
+    - budget_ms: Бюджет общего времени импорта в мс (или None, если не проверяется).
+    - overhead_budget_ms: Бюджет времени импорта сверх `BASELINE_MODULES` в мс (или None, если не проверяется).
+
+    Возвращает:
+    - tuple: (список времен запусков в мс, словарь собственных времен модулей последнего запуска,
+      список ошибок).
+    """
+    totals = []
+    baselines = []
+    modules = {}
+    for _ in range(runs):
+        # Зависимости измеряются вперемешку с модулем, чтобы оба минимума пришлись на одинаковую загрузку машины
+        if overhead_budget_ms is not None:
+            baselines.append(measure(BASELINE_MODULES)[0])
+        total, modules = measure(module)
+        totals.append(total)
+
+    errors = []
+    loaded = sorted({name.split('.')[0] for name in modules} & set(LAZY_MODULES))
+    if loaded:
+        errors.append(f'modules that must be imported lazily were loaded: {", ".join(loaded)}')
+    if budget_ms is not None and min(totals) > budget_ms:
+        errors.append(f'import time {min(totals):.1f}ms exceeds budget {budget_ms:.0f}ms')
+    if overhead_budget_ms is not None and min(totals) - min(baselines) > overhead_budget_ms:
+        errors.append(f'import time over dependencies {min(totals) - min(baselines):.1f}ms '
+                      f'({min(totals):.1f}ms - {min(baselines):.1f}ms) exceeds budget {overhead_budget_ms:.0f}ms')
+    return totals, modules, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start import time benchmark')
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('STARTUP_IMPORT_BUDGET_MS', '450')))
+    parser.add_argument('--overhead-budget-ms', type=float,
+                        default=float(os.getenv('STARTUP_IMPORT_OVERHEAD_BUDGET_MS', '150')))
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    totals, modules, errors = check(args.module, args.runs, args.budget_ms, args.overhead_budget_ms)
+    print(f'import {args.module}: best {min(totals):.1f}ms, median {statistics.median(totals):.1f}ms '
+          f'over {args.runs} runs (budget {args.budget_ms:.0f}ms)')
+    for name, self_ms in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'  {self_ms:8.1f}ms  {name}')
+    for error in errors:
+        print(f'FAIL: {error}')
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
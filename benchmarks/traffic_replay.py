@@ -0,0 +1,255 @@
+"""
+Воспроизведение захваченного трафика (`TRAFFIC_CAPTURE_ENABLED=true`) и сравнение задержек двух сборок.
+
+Запросы из файлов захвата отправляются на локальный экземпляр в исходном порядке и с исходными интервалами
+между поступлениями (`--speed 2` — вдвое быстрее). Токены выпускаются заново через `create_token` для того же
+пользователя, вебхуки подписываются заново через `generate_signature`, поэтому у целевого экземпляра должны быть
+те же `SECRET_KEY` и `SECRET_JWT_KEY`, что и у этого процесса. Замененные при захвате пароли подставляются из
+`--password`. С `--fresh-transactions` идентификаторы транзакций заменяются на новые с сохранением повторов
+(один исходный идентификатор — один новый), чтобы вебхуки не упирались в уже обработанные транзакции.
+
+    python -m benchmarks.traffic_replay replay capture/*.ndjson.zst --speed 1 --output before.json
+    python -m benchmarks.traffic_replay replay capture/*.ndjson.zst --speed 1 --output after.json
+    python -m benchmarks.traffic_replay compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from app.config import SECRET_KEY
+from app.utils.jwt import create_token
+from app.utils.signature import generate_signature
+from app.utils.traffic_capture import iter_records, REDACTED
+
+WEBHOOK_PATH = '/webhook/payment'
+
+
+class HttpClient:
+    """
+    Минимальный HTTP/1.1-клиент с пулом keep-alive соединений: накладные расходы клиента не должны искажать
+    измеряемые задержки.
+
+    Аргументы:
+    - host: Хост.
+    - port: Порт.
+    - limit: Максимальное количество одновременных соединений.
+    """
+
+    def __init__(self, host: str, port: int, limit: int):
+        self.host = host
+        self.port = port
+        self._idle = []
+        self._slots = asyncio.Semaphore(limit)
+
+    async def request(self, method: str, target: str, headers: dict, body: bytes) -> int:
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else await asyncio.open_connection(self.host, self.port)
+            try:
+                status, keep_alive = await self._exchange(*connection, method, target, headers, body)
+            except BaseException:
+                connection[1].close()
+                raise
+            if keep_alive:
+                self._idle.append(connection)
+            else:
+                connection[1].close()
+            return status
+
+    async def _exchange(self, reader, writer, method, target, headers, body):
+        lines = [f'{method} {target} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await writer.drain()
+
+        head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(head[0].split(' ', 2)[1])
+        response_headers = {}
+        for line in head[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await reader.readexactly(int(response_headers.get('content-length', 0)))
+        return status, response_headers.get('connection', '').lower() != 'close'
+
+    def close(self):
+        for _reader, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+def load_records(paths: list, limit: int = None) -> list:
+    records = [record for path in paths for record in iter_records(path)]
+    records.sort(key=lambda record: record['ts'])
+    return records[:limit] if limit else records
+
+
+class RequestBuilder:
+    """
+    Подготовка захваченного запроса к отправке: свежий токен, подстановка паролей, новая подпись вебхука.
+    """
+
+    def __init__(self, password: str, fresh_transactions: bool):
+        self.password = password
+        self.salt = uuid.uuid4().hex[:12] if fresh_transactions else None
+        self._tokens = {}
+
+    def _unredact(self, value):
+        if isinstance(value, dict):
+            return {key: self.password if item == REDACTED else self._unredact(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._unredact(item) for item in value]
+        return value
+
+    def build(self, record: dict) -> tuple:
+        target = record['path'] + ('?' + record['query'] if record.get('query') else '')
+        headers = {}
+        if record.get('user_id') is not None:
+            key = (record['user_id'], bool(record.get('is_admin')))
+            if key not in self._tokens:
+                self._tokens[key] = create_token(*key)
+            headers['Authorization'] = f'Bearer {self._tokens[key]}'
+
+        body = record.get('body')
+        if body is None:
+            return target, headers, b''
+        if record['path'] == WEBHOOK_PATH and isinstance(body, dict):
+            body = dict(body)
+            if self.salt is not None:
+                body['transaction_id'] = f"{self.salt}-{body['transaction_id']}"
+            body['signature'] = generate_signature(body, SECRET_KEY)
+        else:
+            body = self._unredact(body)
+        headers['Content-Type'] = 'application/json'
+        return target, headers, json.dumps(body).encode()
+
+
+async def replay(args) -> dict:
+    records = load_records(args.files, args.limit)
+    if not records:
+        raise SystemExit('No records to replay')
+    url = urlsplit(args.target)
+    client = HttpClient(url.hostname, url.port or 80, args.connections)
+    builder = RequestBuilder(args.password, args.fresh_transactions)
+    results = []
+
+    async def send(record: dict, scheduled: float):
+        target, headers, body = builder.build(record)
+        lag = time.perf_counter() - scheduled
+        started = time.perf_counter()
+        try:
+            status = await client.request(record['method'], target, headers, body)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            status = 0
+        results.append((f"{record['method']} {record.get('route') or record['path']}", status,
+                        (time.perf_counter() - started) * 1000, lag * 1000))
+
+    first = records[0]['ts']
+    started = time.perf_counter()
+    tasks = []
+    for record in records:
+        scheduled = started + (record['ts'] - first) / args.speed
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(send(record, scheduled)))
+    await asyncio.gather(*tasks)
+    client.close()
+
+    routes = {}
+    for route, status, latency, _lag in results:
+        entry = routes.setdefault(route, {'latencies_ms': [], 'statuses': {}})
+        entry['latencies_ms'].append(round(latency, 3))
+        entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+    return {
+        'target': args.target,
+        'speed': args.speed,
+        'requests': len(results),
+        'wall_time': time.perf_counter() - started,
+        'lag_ms': summarize([lag for *_, lag in results]),
+        'routes': routes,
+    }
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(latencies: list) -> dict:
+    return {
+        'count': len(latencies),
+        'mean': statistics.fmean(latencies),
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': max(latencies),
+    }
+
+
+def print_run(run: dict):
+    print(f"{run['requests']} requests in {run['wall_time']:.1f}s against {run['target']} (x{run['speed']}), "
+          f"scheduling lag p95 {run['lag_ms']['p95']:.2f}ms")
+    for route, entry in sorted(run['routes'].items()):
+        summary = summarize(entry['latencies_ms'])
+        print(f"  {route:55} n={summary['count']:6d} p50={summary['p50']:8.2f} p95={summary['p95']:8.2f} "
+              f"p99={summary['p99']:8.2f}ms statuses={entry['statuses']}")
+
+
+def compare(before: dict, after: dict):
+    print(f"{'route':55} {'metric':6} {'before':>10} {'after':>10} {'change':>8}")
+    for route in sorted(set(before['routes']) | set(after['routes'])):
+        if route not in before['routes'] or route not in after['routes']:
+            print(f"{route:55} only in {'after' if route in after['routes'] else 'before'}")
+            continue
+        old = summarize(before['routes'][route]['latencies_ms'])
+        new = summarize(after['routes'][route]['latencies_ms'])
+        for metric in ('p50', 'p95', 'p99'):
+            change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            print(f"{route if metric == 'p50' else '':55} {metric:6} {old[metric]:9.2f}ms {new[metric]:9.2f}ms "
+                  f"{change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured traffic and compare latencies between builds')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = commands.add_parser('replay', help='Replay capture files against a running instance')
+    replay_parser.add_argument('files', nargs='+')
+    replay_parser.add_argument('--target', default='http://127.0.0.1:8000')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='Time compression factor (2 = twice as fast)')
+    replay_parser.add_argument('--connections', type=int, default=64)
+    replay_parser.add_argument('--limit', type=int, default=None, help='Replay only the first N requests')
+    replay_parser.add_argument('--password', default='password', help='Substitute for redacted passwords')
+    replay_parser.add_argument('--fresh-transactions', action='store_true')
+    replay_parser.add_argument('--output', help='Save results for a later comparison')
+
+    compare_parser = commands.add_parser('compare', help='Compare two saved replay results')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'replay':
+        run = asyncio.run(replay(args))
+        print_run(run)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(run, file)
+    else:
+        with open(args.before) as before, open(args.after) as after:
+            compare(json.load(before), json.load(after))
+
+
+if __name__ == '__main__':
+    main()
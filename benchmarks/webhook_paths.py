@@ -0,0 +1,95 @@
+"""
+Бенчмарк обработки вебхука платежа: через ORM (`payment_service`) против драйвера asyncpg (`raw_payment_service`).
+
+Создает тестового пользователя и счета, затем прогоняет одинаковый поток платежей через обе реализации
+(тело запроса уже проверено, HTTP не участвует) и выводит задержку, пропускную способность и процессорное время
+на запрос. После прогона созданные данные удаляются.
+
+    python -m benchmarks.webhook_paths --requests 5000 --concurrency 16 --accounts 100
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+
+from app.controllers.payment_controller import _process_payment_orm, _process_payment_raw
+from app.db import get_raw_connection, dispose_engine
+from app.schemas import WebhookPayload
+
+
+async def setup(accounts: int) -> tuple:
+    async with get_raw_connection() as conn:
+        user_id = await conn.fetchval(
+            "INSERT INTO users (email, full_name, hashed_password, is_admin) VALUES ($1, 'Bench', '-', FALSE) "
+            "RETURNING id", f'bench-{uuid.uuid4().hex}@example.com')
+        first_account = await conn.fetchval("SELECT coalesce(max(id), 0) + 1 FROM accounts")
+    return user_id, list(range(first_account, first_account + accounts))
+
+
+async def cleanup(user_id: int, account_ids: list):
+    async with get_raw_connection() as conn:
+        async with conn.transaction():
+            for table in ('payments', 'ledger_entries', 'balance_snapshots', 'payment_rollups'):
+                await conn.execute(f"DELETE FROM {table} WHERE account_id = ANY($1)", account_ids)
+            await conn.execute("DELETE FROM accounts WHERE id = ANY($1)", account_ids)
+            await conn.execute("DELETE FROM users WHERE id = $1", user_id)
+
+
+async def run(process, payloads: list, concurrency: int) -> dict:
+    latencies = []
+    statuses = {}
+    queue = iter(payloads)
+
+    async def worker():
+        for data in queue:
+            started = time.perf_counter()
+            result = await process(data)
+            latencies.append(time.perf_counter() - started)
+            statuses[result.status] = statuses.get(result.status, 0) + 1
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+    latencies.sort()
+    return {
+        'statuses': statuses,
+        'throughput': len(payloads) / wall,
+        'cpu_ms': cpu / len(payloads) * 1000,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Webhook processing benchmark: ORM vs asyncpg')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=200)
+    args = parser.parse_args()
+
+    user_id, account_ids = await setup(args.accounts)
+    rng = random.Random(42)
+
+    def payloads(count: int) -> list:
+        return [WebhookPayload(transaction_id=uuid.uuid4().hex, user_id=user_id, account_id=rng.choice(account_ids),
+                               amount=round(rng.uniform(1, 1000), 2), signature='')
+                for _ in range(count)]
+
+    try:
+        for name, process in (('orm', _process_payment_orm), ('raw', _process_payment_raw)):
+            await run(process, payloads(args.warmup), args.concurrency)
+            result = await run(process, payloads(args.requests), args.concurrency)
+            print(f'{name}: {result["throughput"]:8.0f} req/s  CPU {result["cpu_ms"]:6.3f}ms/req  '
+                  f'p50 {result["p50_ms"]:6.2f}ms  p95 {result["p95_ms"]:6.2f}ms  statuses {result["statuses"]}')
+    finally:
+        await cleanup(user_id, account_ids)
+        await dispose_engine()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
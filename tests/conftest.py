@@ -0,0 +1,17 @@
+import asyncio
+import inspect
+import os
+
+# База выбирается до импорта конфигурации приложения: по умолчанию SQLite в памяти; тесты, которым нужен Postgres,
+# выполняются, если DATABASE_URL указывает на отдельную тестовую базу Postgres (ее таблицы пересоздаются)
+os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite://')
+os.environ.setdefault('DB_ECHO', 'false')
+
+
+def pytest_pyfunc_call(pyfuncitem):
+    # Асинхронные тесты выполняются каждый в собственном цикле событий
+    if inspect.iscoroutinefunction(pyfuncitem.obj):
+        arguments = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+        asyncio.run(pyfuncitem.obj(**arguments))
+        return True
+    return None
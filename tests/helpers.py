@@ -0,0 +1,31 @@
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.db import Base, create_schema, dispose_engine, get_db, get_engine, is_sqlite_url
+from app.services import fixture_service
+
+requires_postgres = pytest.mark.skipif(is_sqlite_url(), reason='requires Postgres (DATABASE_URL of a test database)')
+
+
+@asynccontextmanager
+async def database(**fixtures):
+    """
+    Чистая база с тестовыми данными на время теста.
+
+    С SQLite в памяти каждый тест получает новую базу (она живет до `dispose_engine`), с Postgres таблицы моделей
+    пересоздаются.
+
+    Аргументы:
+    - fixtures: Параметры `fixture_service.load_fixtures`.
+    """
+    if not is_sqlite_url():
+        async with get_engine().begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+    await create_schema()
+    try:
+        async with get_db() as session:
+            await fixture_service.load_fixtures(session, **fixtures)
+        yield
+    finally:
+        await dispose_engine()
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from app.controllers.admin_controller import _bulk_target_error
+from app.db import get_db
+from app.models.account import Account
+from app.models.payments import Payment
+from app.models.user import User
+from app.services import admin_service, revocation_service
+from app.utils import cache_invalidation
+from tests.helpers import database
+
+# Синтетические пользователи идут после пользователей по умолчанию (идентификаторы 1 и 2)
+FIRST_USER = 3
+
+
+async def _count(model, *conditions) -> int:
+    async with get_db() as session:
+        return await session.scalar(select(func.count()).select_from(model).where(*conditions))
+
+
+async def test_bulk_delete_users(monkeypatch):
+    monkeypatch.setattr(admin_service, 'ADMIN_BULK_CHUNK_SIZE', 2)
+    async with database(users=3, payments_per_account=2):
+        ids = [FIRST_USER, FIRST_USER + 1, 999]
+        async with get_db() as session:
+            results = await admin_service.bulk_delete_users(session, ids)
+        assert results == [(FIRST_USER, 'has_accounts'), (FIRST_USER + 1, 'has_accounts'), (999, 'not_found')]
+
+        async with get_db() as session:
+            results = await admin_service.bulk_delete_users(session, ids, cascade=True)
+        assert results == [(FIRST_USER, 'deleted'), (FIRST_USER + 1, 'deleted'), (999, 'not_found')]
+        assert await _count(User, User.id.in_(ids)) == 0
+        assert await _count(Account, Account.owner_id.in_(ids)) == 0
+        # Платежи остальных пользователей не затронуты
+        assert await _count(Payment) == 3 * 2
+
+
+async def test_bulk_delete_reports_failed_chunk(monkeypatch):
+    monkeypatch.setattr(admin_service, 'ADMIN_BULK_CHUNK_SIZE', 1)
+    revoke_users_tokens = revocation_service.revoke_users_tokens
+
+    async def failing(session, user_ids):
+        if FIRST_USER in user_ids:
+            raise OperationalError('DELETE', {}, Exception('statement timeout'))
+        await revoke_users_tokens(session, user_ids)
+
+    monkeypatch.setattr(revocation_service, 'revoke_users_tokens', failing)
+    async with database(users=2, payments_per_account=1):
+        async with get_db() as session:
+            results = await admin_service.bulk_delete_users(session, [FIRST_USER, FIRST_USER + 1], cascade=True)
+        assert results == [(FIRST_USER, 'error'), (FIRST_USER + 1, 'deleted')]
+        # Часть с ошибкой откачена целиком: пользователь, его счет и платежи на месте
+        assert await _count(User, User.id == FIRST_USER) == 1
+        assert await _count(Payment, Payment.account_id.in_(
+            select(Account.id).where(Account.owner_id == FIRST_USER))) == 1
+
+
+def test_long_invalidation_is_split():
+    tags = [cache_invalidation.user_key(user_id) for user_id in range(1000)]
+    payloads = cache_invalidation.encode_batches(*tags, *tags)
+    assert len(payloads) > 1
+    assert all(len(payload.encode()) <= cache_invalidation.MAX_PAYLOAD for payload in payloads)
+    assert cache_invalidation.FLUSH_ALL not in payloads
+    assert sorted(tag for payload in payloads for tag in payload.split(',')) == sorted(tags)
+
+
+def test_bulk_target_rejects_out_of_range_ids():
+    assert _bulk_target_error(SimpleNamespace(ids=[1, 2 ** 31], email_domain=None)) == 'ids must be 32-bit integers'
+    assert _bulk_target_error(SimpleNamespace(ids=[-2 ** 31 - 1], email_domain=None)) == 'ids must be 32-bit integers'
+    assert _bulk_target_error(SimpleNamespace(ids=[2 ** 31 - 1], email_domain=None)) is None
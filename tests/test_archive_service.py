@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from app.db import get_db
+from app.models.payments import Payment
+from app.services import archive_service
+from tests.helpers import database, requires_postgres
+
+# Больше 32767 строк в одной пачке: столько параметров в одном запросе asyncpg не принимает
+ROWS_PER_ACCOUNT = 20_000
+
+
+async def _archive_beyond_bind_limit(archive_dir: str):
+    async with database(payments_per_account=ROWS_PER_ACCOUNT), get_db() as session:
+        cutoff = datetime.now(timezone.utc) + timedelta(minutes=1)
+        assert await archive_service.archive_payments(session, cutoff, archive_dir=archive_dir) == 2 * ROWS_PER_ACCOUNT
+        assert await session.scalar(select(func.count()).select_from(Payment)) == 0
+        assert [entry['rows'] for entry in archive_service.load_index(archive_dir)] == [2 * ROWS_PER_ACCOUNT]
+        assert not any(entry.get('pending') for entry in archive_service.load_index(archive_dir))
+
+
+async def test_archive_chunk_beyond_bind_limit(tmp_path):
+    await _archive_beyond_bind_limit(str(tmp_path))
+
+
+@requires_postgres
+async def test_archive_chunk_beyond_bind_limit_postgres(tmp_path):
+    # В Postgres удаляемые идентификаторы передаются массивом (`= ANY`), а не отдельным параметром на строку
+    await _archive_beyond_bind_limit(str(tmp_path))
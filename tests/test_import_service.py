@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from app.services import import_service
+
+
+async def _lines(*lines):
+    for line in lines:
+        yield line
+
+
+async def _rows(lines, content_type):
+    return [row async for row in import_service.iter_rows(_lines(*lines), content_type)]
+
+
+async def test_csv_quoted_field_spans_lines():
+    rows = await _rows(['email,full_name,password',
+                        'a@example.com,"Ivan',
+                        '',
+                        'Petrov, ""Jr""",secret',
+                        'b@example.com,Anna,secret'], 'text/csv')
+    assert rows == [
+        (2, {'email': 'a@example.com', 'full_name': 'Ivan\n\nPetrov, "Jr"', 'password': 'secret'}, None),
+        (5, {'email': 'b@example.com', 'full_name': 'Anna', 'password': 'secret'}, None),
+    ]
+
+
+async def test_csv_errors():
+    rows = await _rows(['email,full_name,password', 'a@example.com,Ivan', 'b@example.com,"Anna,secret'],
+                       'text/csv')
+    assert rows == [(2, None, 'Wrong number of columns'), (3, None, 'Unterminated quoted field')]
+
+
+class FailingConnection:
+    async def execute(self, *_args):
+        pass
+
+    def transaction(self):
+        raise ConnectionError('connection lost')
+
+
+async def test_hashing_is_cancelled_when_load_fails(monkeypatch):
+    monkeypatch.setattr(import_service, 'IMPORT_BATCH_SIZE', 1)
+    started, cancelled = [], []
+
+    async def prepare(batch):
+        started.append(batch)
+        if len(started) == 1:
+            return [(1, 'a@example.com', 'A', 'hash')]
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(batch)
+            raise
+
+    monkeypatch.setattr(import_service, '_prepare_batch', prepare)
+
+    async def report(_error):
+        pass
+
+    rows = _lines(*[(line, {'email': f'{line}@example.com', 'full_name': 'X', 'password': 'p'}, None)
+                    for line in (1, 2)])
+    with pytest.raises(ConnectionError):
+        await import_service.import_users(FailingConnection(), rows, report)
+    assert len(cancelled) == 1
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, update
+
+from app.db import get_db, get_engine
+from app.models.account import Account
+from app.models.ledger import BalanceSnapshot, LedgerEntry
+from app.services import ledger_service
+from tests.helpers import database, requires_postgres
+
+
+async def test_balance_counts_entries_outside_snapshot():
+    async with database(), get_db() as session:
+        # Снимок покрывает записи до 4, кроме записи 3: ее транзакция не завершилась к созданию снимка
+        await session.execute(insert(LedgerEntry), [
+            {'account_id': 1, 'amount': amount, 'transaction_id': f'tx-{xact_id}-{amount}', 'xact_id': xact_id}
+            for amount, xact_id in ((1.0, 5), (2.0, 5), (4.0, 12), (8.0, 6))])
+        session.add(BalanceSnapshot(account_id=1, last_entry_id=4, xmin=10, balance=100.0,
+                                    as_of=datetime.now(timezone.utc)))
+        await session.commit()
+
+        assert await ledger_service.get_balance(session, 1) == 104.0
+        assert await ledger_service.get_current_balances(session, [1]) == {1: 104.0}
+
+
+@requires_postgres
+async def test_compaction_keeps_entries_of_slow_commits():
+    async with database():
+        async with get_db() as fast, get_engine().connect() as slow:
+            # Быстрая транзакция получает идентификатор транзакции раньше медленной, а идентификатор записи — позже;
+            # медленная фиксируется уже после компакции, которая включила запись быстрой в снимок
+            await fast.execute(update(Account).where(Account.id == 2).values(balance=Account.balance))
+            await slow.execute(insert(LedgerEntry).values(account_id=1, amount=5.0, transaction_id='tx-slow'))
+            ledger_service.add_entry(fast, 1, 7.0, 'tx-fast')
+            await fast.commit()
+            assert await ledger_service.compact_snapshots(fast, 1, update_cache=False) == 1
+            await slow.commit()
+
+        async with get_db() as session:
+            assert await ledger_service.get_balance(session, 1) == 12.0
+            assert await ledger_service.get_current_balances(session, [1]) == {1: 12.0}
+            assert await ledger_service.compact_snapshots(session, 1, update_cache=False) == 1
+            assert await ledger_service.get_balance(session, 1) == 12.0
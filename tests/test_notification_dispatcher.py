@@ -0,0 +1,162 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from app.db import get_db
+from app.models.notification import NotificationOutbox
+from app.services import notification_service
+from app.tasks import notification_dispatcher
+from app.utils.http_pool import HttpPools
+from benchmarks import notification_stub
+from tests.helpers import database
+
+
+@pytest.fixture(autouse=True)
+def dispatcher(monkeypatch):
+    # Примитивы asyncio и соединения пула привязываются к циклу событий, а каждый тест выполняется в своем цикле
+    monkeypatch.setattr(notification_service, 'NOTIFICATION_SECRET', 'test-secret')
+    monkeypatch.setattr(notification_dispatcher, 'pools', HttpPools(2))
+    monkeypatch.setattr(notification_dispatcher, '_wake', asyncio.Event())
+    monkeypatch.setattr(notification_dispatcher, '_concurrency', asyncio.Semaphore(4))
+    monkeypatch.setattr(notification_dispatcher, '_stats', dict.fromkeys(notification_dispatcher._stats, 0))
+    monkeypatch.setattr(notification_stub, 'stats', dict.fromkeys(notification_stub.stats, 0))
+
+
+@asynccontextmanager
+async def stub(fail_rate: float = 0.0):
+    """
+    Локальный получатель уведомлений (`benchmarks.notification_stub`) на свободном порту.
+
+    Аргументы:
+    - fail_rate: Доля запросов, отклоняемых ответом 503.
+
+    Возвращает:
+    - str: URL получателя.
+    """
+    server = await asyncio.start_server(
+        lambda reader, writer: notification_stub.handle_connection(reader, writer, fail_rate, 0), '127.0.0.1', 0)
+    async with server:
+        try:
+            yield f'http://127.0.0.1:{server.sockets[0].getsockname()[1]}/hooks/payments'
+        finally:
+            notification_dispatcher.pools.close()
+
+
+async def _enqueue(destination: str, count: int):
+    async with get_db() as session:
+        for i in range(count):
+            await notification_service.enqueue_payment(session, destination, 1, 1, f'tx-{i}', 1.0,
+                                                       datetime.now(timezone.utc))
+        await session.commit()
+
+
+async def _outbox() -> list:
+    async with get_db() as session:
+        result = await session.execute(select(NotificationOutbox).order_by(NotificationOutbox.id))
+        return result.scalars().all()
+
+
+def test_signing_key_per_destination(monkeypatch):
+    first = notification_service.signing_key('https://a.example.com/hooks')
+    assert first != notification_service.signing_key('https://b.example.com/hooks')
+    assert notification_service.sign(b'{}', 'https://a.example.com/hooks') != \
+        notification_service.sign(b'{}', 'https://b.example.com/hooks')
+
+    monkeypatch.setattr(notification_service, 'NOTIFICATION_SECRET', None)
+    with pytest.raises(RuntimeError):
+        notification_service.signing_key('https://a.example.com/hooks')
+
+
+async def test_claim_due_leases_rows():
+    async with database(payments_per_account=1):
+        await _enqueue('http://127.0.0.1:1/a', 2)
+        await _enqueue('http://127.0.0.1:1/b', 1)
+        async with get_db() as session:
+            first = await notification_service.claim_due(session, 2, 60)
+            second = await notification_service.claim_due(session, 2, 60)
+            # Захваченные уведомления арендованы и не выдаются повторно до истечения аренды
+            third = await notification_service.claim_due(session, 2, 60)
+        assert [(row[0], row[1], row[3]) for row in first] == [(1, 'http://127.0.0.1:1/a', 1),
+                                                               (2, 'http://127.0.0.1:1/a', 1)]
+        assert [(row[0], row[1], row[3]) for row in second] == [(3, 'http://127.0.0.1:1/b', 1)]
+        assert third == []
+
+
+async def test_deliver_to_stub():
+    async with database(payments_per_account=1), stub() as destination:
+        await _enqueue(destination, 3)
+        assert await notification_dispatcher.dispatch_due() == 3
+
+        assert await _outbox() == []
+        assert notification_stub.stats['events'] == 3
+        assert notification_stub.stats['requests'] == 1
+        assert notification_stub.stats['bad_signature'] == 0
+
+
+async def test_failed_delivery_is_rescheduled(monkeypatch):
+    monkeypatch.setattr(notification_service, 'NOTIFICATION_MAX_ATTEMPTS', 2)
+    async with database(payments_per_account=1), stub(fail_rate=1.0) as destination:
+        await _enqueue(destination, 2)
+        assert await notification_dispatcher.dispatch_due() == 2
+        [first, second] = await _outbox()
+        assert (first.attempts, first.last_error, first.failed_at) == (1, 'HTTP 503', None)
+        assert first.next_attempt_at > datetime.now(timezone.utc).replace(tzinfo=None)
+        # Повтор отложен: до истечения задержки уведомления не захватываются
+        assert await notification_dispatcher.dispatch_due() == 0
+
+        async with get_db() as session:
+            await notification_service.reschedule(session, [first.id, second.id], 'HTTP 503', 0)
+        assert await notification_dispatcher.dispatch_due() == 2
+        # Вторая неудачная попытка исчерпывает NOTIFICATION_MAX_ATTEMPTS
+        assert all(row.attempts == 2 and row.failed_at is not None for row in await _outbox())
+        assert await notification_dispatcher.dispatch_due() == 0
+        assert notification_dispatcher.get_metrics()['failed'] == 2
+
+
+async def test_rejected_delivery_is_permanent(monkeypatch):
+    # Получатель не принимает подпись и отвечает 401: повторять отправку бессмысленно
+    monkeypatch.setattr(notification_stub, 'notification_service', SimpleNamespace(
+        SIGNATURE_HEADER=notification_service.SIGNATURE_HEADER, sign=lambda _body, _destination: 'forged'))
+    async with database(payments_per_account=1), stub() as destination:
+        await _enqueue(destination, 1)
+        assert await notification_dispatcher.dispatch_due() == 1
+        [row] = await _outbox()
+        assert (row.attempts, row.last_error) == (1, 'HTTP 401')
+        assert row.failed_at is not None
+        assert notification_stub.stats['bad_signature'] == 1
+
+
+def test_retry_delay(monkeypatch):
+    monkeypatch.setattr(notification_dispatcher, 'NOTIFICATION_RETRY_BASE', 1.0)
+    monkeypatch.setattr(notification_dispatcher, 'NOTIFICATION_RETRY_MAX', 60.0)
+    for attempts in range(1, 12):
+        backoff = min(60.0, 2.0 ** (attempts - 1))
+        assert backoff / 2 <= notification_dispatcher._retry_delay(attempts) <= backoff
+    assert notification_dispatcher._retry_delay(1, '30') == 30
+    assert notification_dispatcher._retry_delay(1, '3600') == 60
+    assert notification_dispatcher._retry_delay(1, 'Wed, 21 Oct 2026 07:28:00 GMT') <= 1
+
+
+async def test_run_notification_dispatcher(monkeypatch):
+    monkeypatch.setattr(notification_dispatcher, 'NOTIFICATION_BATCH_WINDOW', 0)
+    async with database(payments_per_account=1), stub() as destination:
+        task = asyncio.create_task(notification_dispatcher.run_notification_dispatcher())
+        try:
+            # Диспетчер будится уведомлением после commit, не дожидаясь NOTIFICATION_POLL_INTERVAL
+            await _enqueue(destination, 5)
+            async with asyncio.timeout(5):
+                while await _outbox():
+                    await asyncio.sleep(0.05)
+        finally:
+            task.cancel()
+        assert notification_stub.stats['events'] == 5
+
+
+async def test_dispatcher_requires_secret(monkeypatch):
+    monkeypatch.setattr(notification_service, 'NOTIFICATION_SECRET', '')
+    with pytest.raises(RuntimeError):
+        await notification_dispatcher.run_notification_dispatcher()
@@ -0,0 +1,42 @@
+import csv
+from datetime import datetime, timedelta, timezone
+
+from app.db import get_db
+from app.services import archive_service, payment_service, reconciliation_service
+from tests.helpers import database
+
+LONG_PREFIX = 'x' * 64
+
+
+def _read(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+async def test_reconcile_long_ids_duplicates_and_archive(tmp_path):
+    archive_dir, out_dir = str(tmp_path / 'archive'), str(tmp_path / 'out')
+    async with database(users=1, payments_per_account=3), get_db() as session:
+        now = datetime.now(timezone.utc)
+        for transaction_id in (LONG_PREFIX + 'a', LONG_PREFIX + 'b'):
+            await payment_service.create_payment(session, transaction_id, 5.0, 1, now)
+        # Самые старые платежи каждого счета (fixture-1, fixture-4, fixture-7) переносятся в архив
+        assert await archive_service.archive_payments(session, now - timedelta(seconds=150),
+                                                      archive_dir=archive_dir) == 3
+
+        provider_path = tmp_path / 'settlement.csv'
+        rows = [(f'fixture-{number}', 11.0 if number == 2 else 10.0, (number - 1) // 3 + 1) for number in range(1, 9)]
+        rows += [('fixture-3', 10.0, 1), (LONG_PREFIX + 'a', 5.0, 1), ('new-1', 7.0, 2)]
+        with open(provider_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['transaction_id', 'amount', 'account_id', 'user_id'])
+            writer.writerows((transaction_id, amount, account_id, account_id)
+                             for transaction_id, amount, account_id in rows)
+
+        summary = await reconciliation_service.reconcile(session, str(provider_path), out_dir, buckets=4,
+                                                         archive_dir=archive_dir)
+
+    assert summary['our_rows'] == 11
+    assert [row['transaction_id'] for row in _read(f'{out_dir}/missing.csv')] == ['new-1']
+    assert sorted(row['transaction_id'] for row in _read(f'{out_dir}/extra.csv')) == ['fixture-9', LONG_PREFIX + 'b']
+    assert [row['transaction_id'] for row in _read(f'{out_dir}/mismatched.csv')] == ['fixture-2']
+    assert _read(f'{out_dir}/duplicates.csv') == [{'side': 'provider', 'transaction_id': 'fixture-3', 'count': '2'}]
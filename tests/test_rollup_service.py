@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from app.db import get_db
+from app.models.payments import Payment
+from app.services import archive_service, rollup_service
+from tests.helpers import database
+
+DAY = datetime(2024, 3, 10, tzinfo=timezone.utc)
+
+
+async def test_backfill_and_stats_until_clip_last_day():
+    async with database(users=1, accounts_per_user=1, payments_per_account=4), get_db() as session:
+        # Два платежа за день до периода, два — в последний день: в 09:30 и в 15:30
+        for payment_id, created_at in zip((1, 2, 3, 4), (DAY - timedelta(hours=12), DAY - timedelta(hours=11),
+                                                          DAY + timedelta(hours=9, minutes=30),
+                                                          DAY + timedelta(hours=15, minutes=30))):
+            await session.execute(update(Payment).where(Payment.id == payment_id).values(created_at=created_at))
+        await session.commit()
+
+        # Четыре часовые и две суточные корзины; повторный запуск перезаписывает те же корзины
+        assert await rollup_service.backfill(session, DAY - timedelta(days=1), DAY + timedelta(days=1)) == 6
+        assert await rollup_service.backfill(session, DAY - timedelta(days=1), DAY + timedelta(days=1)) == 6
+
+        stats = await rollup_service.get_stats(session)
+        assert (stats['payment_count'], stats['total_amount']) == (4, 40.0)
+
+        stats = await rollup_service.get_stats(session, until=DAY + timedelta(hours=12))
+        assert stats['payment_count'] == 3
+        assert stats['daily'] == [{'date': '2024-03-09', 'total_amount': 20.0, 'payment_count': 2},
+                                  {'date': '2024-03-10', 'total_amount': 10.0, 'payment_count': 1}]
+
+        stats = await rollup_service.get_stats(session, since=DAY, until=DAY + timedelta(hours=12))
+        assert stats['payment_count'] == 1
+
+
+async def test_backfill_keeps_days_with_archived_payments(tmp_path):
+    archive_dir = str(tmp_path)
+    async with database(users=1, accounts_per_user=1, payments_per_account=4), get_db() as session:
+        for payment_id, created_at in zip((1, 2, 3, 4), (DAY - timedelta(hours=12), DAY - timedelta(hours=11),
+                                                          DAY + timedelta(hours=9, minutes=30),
+                                                          DAY + timedelta(hours=15, minutes=30))):
+            await session.execute(update(Payment).where(Payment.id == payment_id).values(created_at=created_at))
+        await session.commit()
+        assert await rollup_service.backfill(session, DAY - timedelta(days=1), DAY + timedelta(days=1),
+                                             archive_dir=archive_dir) == 6
+
+        # Архивация до полудня: в таблице остается только платеж в 15:30, и пересчет суток с архивными платежами
+        # занизил бы статистику
+        assert await archive_service.archive_payments(session, DAY + timedelta(hours=12),
+                                                      archive_dir=archive_dir) == 3
+        assert await rollup_service.backfill(session, DAY - timedelta(days=1), DAY + timedelta(days=1),
+                                             archive_dir=archive_dir) == 0
+
+        stats = await rollup_service.get_stats(session)
+        assert (stats['payment_count'], stats['total_amount']) == (4, 40.0)
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from app.db import get_db
+from app.models.account import Account
+from app.services import admin_service, auth_service, payment_service, user_service
+from app.services.fixture_service import DEFAULT_PASSWORD
+from app.utils.pg_listener import listener, notify
+from tests.helpers import database
+
+# Синтетические пользователи идут после пользователей по умолчанию (идентификаторы 1 и 2)
+FIRST_USER = 3
+
+
+async def test_user_reads():
+    async with database(users=2, accounts_per_user=2, payments_per_account=3), get_db() as session:
+        user = await user_service.get_user_by_id(session, FIRST_USER)
+        assert user.email == f'fixture-{FIRST_USER}@example.com'
+
+        accounts = await user_service.get_accounts_by_user_id(session, FIRST_USER)
+        assert len(accounts) == 2
+        assert all(account.balance == 30.0 for account in accounts)
+
+        payments = await user_service.get_payments_by_user_id(session, FIRST_USER)
+        assert len(payments) == 6
+
+        recent = await user_service.get_payments_by_user_id(
+            session, FIRST_USER, since=datetime.now(timezone.utc) - timedelta(seconds=90))
+        assert len(recent) == 2
+
+
+async def test_register_and_login():
+    async with database(), get_db() as session:
+        user, error = await auth_service.register_user(session, 'new@example.com', 'New User', 'secret')
+        assert error is None and user.id is not None
+
+        _user, error = await auth_service.register_user(session, 'new@example.com', 'Other', 'secret')
+        assert error == 'User with this email already exists'
+
+        user, ok = await auth_service.login_user(session, 'testuser@example.com', DEFAULT_PASSWORD)
+        assert ok and user.id == 1
+        _user, ok = await auth_service.login_user(session, 'testuser@example.com', 'wrong')
+        assert not ok
+
+
+async def test_admin_update_delete_and_search():
+    async with database(users=3, accounts_per_user=0), get_db() as session:
+        assert await admin_service.update_user(session, FIRST_USER, full_name='Renamed')
+        assert not await admin_service.update_user(session, 999, full_name='Nobody')
+        assert (await user_service.get_user_by_id(session, FIRST_USER)).full_name == 'Renamed'
+
+        users, _cursor = await admin_service.search_users(session, f'fixture-{FIRST_USER}', 20)
+        assert [user.id for user in users] == [FIRST_USER]
+
+        assert await admin_service.delete_user(session, FIRST_USER)
+        assert not await admin_service.delete_user(session, FIRST_USER)
+
+
+async def test_webhook_services():
+    async with database(users=1, payments_per_account=1), get_db() as session:
+        account = await payment_service.get_account_by_id_and_user_id(session, 1, 1)
+        await payment_service.create_payment(session, 'tx-1', 5.0, account.id, datetime.now(timezone.utc))
+        await payment_service.update_account_balance(session, account, 5.0)
+
+        assert await payment_service.get_payment_by_transaction_id(session, 'tx-1') is not None
+        assert (await session.execute(select(Account.balance).where(Account.id == 1))).scalar() == 15.0
+
+
+async def test_read_does_not_end_callers_transaction():
+    # Все сессии SQLite работают через одно соединение: чтение не должно выполняться в отдельной сессии,
+    # закрытие которой откатило бы незафиксированные изменения вызывающего
+    async with database(users=1), get_db() as session:
+        session.add(Account(id=999, balance=0.0, owner_id=1))
+        await session.flush()
+        assert await user_service.get_user_by_id(session, 1) is not None
+        await session.commit()
+
+        assert await session.scalar(select(func.count()).select_from(Account).where(Account.id == 999)) == 1
+
+
+async def test_notifications_are_delivered_after_commit():
+    received = []
+    listener.add_listener('test_channel', received.append)
+    async with database(), get_db() as session:
+        await notify(session, 'test_channel', 'rolled back')
+        await session.rollback()
+        await notify(session, 'test_channel', 'committed')
+        assert received == []
+        await session.commit()
+    assert received == ['committed']
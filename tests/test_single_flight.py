@@ -0,0 +1,50 @@
+import asyncio
+
+from app.utils.single_flight import SingleFlight
+
+
+async def _started(group, key, func):
+    waiter = asyncio.ensure_future(group.do(key, func))
+    await asyncio.sleep(0)
+    return waiter
+
+
+async def test_cancelled_waiter_does_not_cancel_shared_call():
+    group = SingleFlight('test')
+    release = asyncio.Event()
+
+    async def read():
+        await release.wait()
+        return 42
+
+    first = await _started(group, 'key', read)
+    second = await _started(group, 'key', read)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == 42
+    assert first.cancelled()
+    assert group.stats['executions'] == 1 and group.stats['suppressed'] == 1
+
+
+async def test_last_waiter_cancel_frees_key():
+    group = SingleFlight('test')
+
+    async def read():
+        try:
+            await asyncio.sleep(3600)
+        finally:
+            # Отменяемая задача еще не завершилась, когда приходит следующий вызов
+            await asyncio.sleep(0.01)
+
+    async def fresh_read():
+        return 'fresh'
+
+    waiter = await _started(group, 'key', read)
+    waiter.cancel()
+    await asyncio.sleep(0)
+
+    assert group.stats['in_flight'] == 0
+    assert await group.do('key', fresh_read) == 'fresh'
+    assert group.stats['executions'] == 2
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+from benchmarks import startup_importtime
+
+OVERHEAD_BUDGET_MS = float(os.getenv('STARTUP_IMPORT_OVERHEAD_BUDGET_MS', '150'))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Пакеты app и app.utils подменяются пустыми модулями, чтобы импортировать app.utils.jwt без app/__init__.py
+JWT_CHAIN = f'''
+import sys, types
+for name in ('app', 'app.utils'):
+    package = types.ModuleType(name)
+    package.__path__ = [{ROOT!r} + '/' + name.replace('.', '/')]
+    sys.modules[name] = package
+import app.utils.jwt
+print(','.join(sorted({{name.split('.')[0] for name in sys.modules}} & {{'sqlalchemy', 'jwt'}})))
+'''
+
+
+def test_import_app_within_budget():
+    # Проверяется время приложения сверх обязательных зависимостей (Sanic, SQLAlchemy), измеренных в тех же
+    # запусках: оно не зависит от скорости машины, поэтому регрессия обнаруживается на любой машине
+    totals, _modules, errors = startup_importtime.check('app', runs=5, overhead_budget_ms=OVERHEAD_BUDGET_MS)
+    assert errors == [], f'import times {[round(total) for total in totals]}ms'
+
+
+def test_heavy_dependencies_are_lazy():
+    _total, modules = startup_importtime.measure('app')
+    assert not {name.split('.')[0] for name in modules} & set(startup_importtime.LAZY_MODULES)
+
+
+def test_jwt_chain_is_lazy():
+    # app.utils.jwt → token_revocation → pg_listener не загружают SQLAlchemy и PyJWT при импорте
+    result = subprocess.run([sys.executable, '-c', JWT_CHAIN], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
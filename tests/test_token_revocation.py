@@ -0,0 +1,50 @@
+from app.db import get_db
+from app.services import revocation_service
+from app.utils.jwt import REVOCATION_UNKNOWN, create_token, decode_token
+from app.utils.token_check import check_revocation
+from app.utils.token_revocation import RevocationSet, revocations
+from tests.helpers import database
+
+
+def test_revocation_set():
+    state = RevocationSet()
+    state.apply([(10 ** 12, 100)], ['revoked-jti'], full=True)
+
+    assert state.is_revoked({'user_id': 10 ** 12, 'iat': 99})
+    assert not state.is_revoked({'user_id': 10 ** 12, 'iat': 100})
+    assert state.is_revoked({'user_id': 1, 'iat': 100, 'jti': 'revoked-jti'})
+    assert state.get_metrics()['users'] == 1
+
+    # После разрыва соединения со слушателем известные отзывы действуют, а остальные токены не подтверждаются
+    state.stale = True
+    assert state.is_revoked({'user_id': 10 ** 12, 'iat': 99})
+    assert state.is_revoked({'user_id': 1, 'iat': 100}) is None
+
+
+async def test_stale_state_checks_database(monkeypatch):
+    monkeypatch.setattr(revocations, 'stale', True)
+    monkeypatch.setattr(revocations, '_jtis', set())
+    async with database():
+        token = f'Bearer {create_token(1, False)}'
+        payload = decode_token(token)
+        assert payload['error'] == REVOCATION_UNKNOWN
+        assert (await check_revocation(payload))['user_id'] == 1
+
+        async with get_db() as session:
+            await revocation_service.revoke_token(session, payload['payload'])
+            await session.commit()
+        # Уведомление об отзыве доставлено в процессе (SQLite); без него отзыв находится по базе данных
+        revocations._jtis.clear()
+        assert await check_revocation(decode_token(token)) == {'error': 'Token has been revoked'}
+
+
+async def test_stale_state_fails_closed_without_database(monkeypatch):
+    monkeypatch.setattr(revocations, 'stale', True)
+    payload = decode_token(f'Bearer {create_token(1, False)}')
+    # База данных недоступна: проверка не удается, и токен отклоняется
+    monkeypatch.setattr(revocation_service, 'is_token_revoked', _unavailable)
+    assert await check_revocation(payload) == {'error': REVOCATION_UNKNOWN}
+
+
+async def _unavailable(session, payload):
+    raise ConnectionError('database is down')
@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.config import CACHE_INVALIDATION_COALESCE
+from app.controllers import payment_controller
+from app.db import get_db
+from app.models.account import Account
+from app.models.payments import Payment
+from app.models.rollup import PaymentRollup
+from app.schemas import WebhookPayload
+from app.services import payment_service, stream_service
+from app.utils import cache_invalidation
+from app.utils.pg_listener import listener
+from tests.helpers import database, requires_postgres
+
+# Поток вебхуков со всеми исходами: платеж, повтор транзакции, неизвестный пользователь, новый счет и счет
+# другого пользователя (у пользователя 2 счет 2)
+SCENARIO = [
+    ('tx-1', 5.0, 1, 1), ('tx-1', 5.0, 1, 1), ('tx-2', 5.0, 999, 1), ('tx-3', 7.5, 1, 500), ('tx-4', 2.5, 1, 1),
+    ('tx-5', 1.0, 1, 2),
+]
+
+
+def _payload(transaction_id, amount=5.0, user_id=1, account_id=1):
+    return WebhookPayload(transaction_id=transaction_id, account_id=account_id, user_id=user_id, amount=amount,
+                          signature='')
+
+
+async def _state(transaction_id, account_id=1):
+    async with get_db() as session:
+        balance = await session.scalar(select(Account.balance).where(Account.id == account_id))
+        payments = await session.scalar(select(func.count()).select_from(Payment)
+                                        .where(Payment.transaction_id == transaction_id))
+    return balance, payments
+
+
+def _cache():
+    # Накопленные ключи предыдущих тестов (их отложенное применение осталось в закрытом цикле событий) сбрасываются
+    cache_invalidation.flush_all()
+    return cache_invalidation.InvalidatingCache()
+
+
+class _Events:
+    def __init__(self):
+        self.events = []
+        listener.add_listener(stream_service.CHANNEL, self.events.append)
+
+    def close(self):
+        listener.remove_listener(stream_service.CHANNEL, self.events.append)
+
+
+async def test_publish_delivered_with_payment_commit():
+    cache = _cache()
+    events = _Events()
+    try:
+        async with database(payments_per_account=1):
+            cache.set('account', 'cached', tags=(cache_invalidation.account_key(1),))
+            response = await payment_controller.process_webhook(_payload('tx-1'))
+            assert response.status == 200
+
+            await asyncio.sleep(CACHE_INVALIDATION_COALESCE * 2)
+            assert cache.get('account') is None
+            assert [json.loads(event)['balance'] for event in events.events] == [15.0]
+            assert await _state('tx-1') == (15.0, 1)
+    finally:
+        events.close()
+
+
+async def test_failed_payment_publishes_nothing(monkeypatch):
+    cache = _cache()
+    events = _Events()
+    publish_payment_event = stream_service.publish_payment_event
+
+    async def fail_after_publish(session, *args):
+        await publish_payment_event(session, *args)
+        raise IntegrityError('INSERT', {}, Exception('conflict'))
+
+    monkeypatch.setattr(stream_service, 'publish_payment_event', fail_after_publish)
+    try:
+        async with database(payments_per_account=1):
+            cache.set('account', 'cached', tags=(cache_invalidation.account_key(1),))
+            response = await payment_controller.process_webhook(_payload('tx-1'))
+            assert response.status == 500
+
+            await asyncio.sleep(CACHE_INVALIDATION_COALESCE * 2)
+            assert cache.get('account') == 'cached'
+            assert events.events == []
+            # Платеж и баланс откатываются вместе с сообщениями
+            assert await _state('tx-1') == (10.0, 0)
+    finally:
+        events.close()
+
+
+async def _run_scenario(monkeypatch, raw: bool) -> tuple:
+    monkeypatch.setattr(payment_controller, 'WEBHOOK_RAW_PATH', raw)
+    responses = []
+    async with database(payments_per_account=1):
+        for transaction_id, amount, user_id, account_id in SCENARIO:
+            result = await payment_controller.process_webhook(_payload(transaction_id, amount, user_id, account_id))
+            responses.append((result.status, json.loads(result.body)['message']))
+        async with get_db() as session:
+            balances = dict((await session.execute(select(Account.id, Account.balance).order_by(Account.id))).all())
+            payments = sorted((await session.execute(select(Payment.transaction_id, Payment.account_id))).all())
+            rollups = sorted((await session.execute(select(PaymentRollup.account_id, PaymentRollup.bucket_size,
+                                                           PaymentRollup.total_amount,
+                                                           PaymentRollup.payment_count))).all())
+    return responses, balances, payments, rollups
+
+
+async def test_orm_webhook_outcomes(monkeypatch):
+    responses, balances, payments, rollups = await _run_scenario(monkeypatch, raw=False)
+    assert responses == [
+        (200, 'Payment processed successfully'), (400, 'Transaction already processed'), (404, 'User not found'),
+        (200, 'Payment processed successfully'), (200, 'Payment processed successfully'),
+        (500, 'Failed to process payment'),
+    ]
+    assert balances == {1: 17.5, 2: 10.0, 500: 7.5}
+    assert [payment for payment in payments if payment[0].startswith('tx-')] == [
+        ('tx-1', 1), ('tx-3', 500), ('tx-4', 1)]
+    assert (500, 'day', 7.5, 1) in rollups and (1, 'day', 7.5, 2) in rollups
+
+
+@requires_postgres
+async def test_webhook_paths_parity(monkeypatch):
+    # Ответы и итоговое состояние базы данных совпадают для обработки через ORM и через asyncpg
+    assert await _run_scenario(monkeypatch, raw=False) == await _run_scenario(monkeypatch, raw=True)
+
+
+async def test_balance_increment_is_atomic():
+    async with database(payments_per_account=1), get_db() as session:
+        account = await payment_service.get_account_by_id_and_user_id(session, 1, 1)
+        await session.commit()
+        # Платеж другого запроса после чтения счета
+        async with get_db() as other:
+            await other.execute(update(Account).where(Account.id == 1).values(balance=Account.balance + 7.0))
+            await other.commit()
+
+        await payment_service.update_account_balance(session, account, 5.0)
+        assert account.balance == 22.0
+        assert (await _state('tx-none'))[0] == 22.0
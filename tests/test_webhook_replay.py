@@ -0,0 +1,56 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from app.controllers import payment_controller
+from app.db import get_db
+from app.models.account import Account
+from app.models.payments import Payment
+from app.schemas import WebhookPayload
+from app.services import stream_service
+from app.tasks.webhook_replay import replay_spool
+from app.utils.webhook_spool import spool
+from tests.helpers import database
+
+
+def _webhook(transaction_id, user_id=1, amount=5.0):
+    return {'transaction_id': transaction_id, 'account_id': 1, 'user_id': user_id, 'amount': amount,
+            'signature': ''}
+
+
+async def _balance_and_payments():
+    async with get_db() as session:
+        balance = await session.scalar(select(Account.balance).where(Account.id == 1))
+        payments = await session.scalar(select(func.count()).select_from(Payment)
+                                        .where(Payment.transaction_id.like('tx-%')))
+    return balance, payments
+
+
+async def test_replay_after_interrupted_payment(monkeypatch, tmp_path):
+    monkeypatch.setattr(spool, 'directory', str(tmp_path))
+    monkeypatch.setattr(spool, 'failed_directory', str(tmp_path / 'failed'))
+    publish_payment_event = stream_service.publish_payment_event
+
+    async def interrupted(session, *args):
+        await publish_payment_event(session, *args)
+        raise asyncio.CancelledError()
+
+    async with database(payments_per_account=1):
+        await payment_controller.process_webhook(WebhookPayload(**_webhook('tx-1')))
+        # Обработка прервана (бюджет времени исчерпан) до commit: ничего не записано, вебхук ушел в очередь
+        monkeypatch.setattr(stream_service, 'publish_payment_event', interrupted)
+        try:
+            await payment_controller.process_webhook(WebhookPayload(**_webhook('tx-2')))
+        except asyncio.CancelledError:
+            pass
+        monkeypatch.setattr(stream_service, 'publish_payment_event', publish_payment_event)
+        assert await _balance_and_payments() == (15.0, 1)
+
+        for payload in (_webhook('tx-1'), _webhook('tx-2'), _webhook('tx-3', user_id=999)):
+            await spool.append(payload)
+        assert await replay_spool() == 1
+
+        # tx-1 уже обработан и удален из очереди без повторного зачисления, tx-3 перенесен в failed
+        assert await _balance_and_payments() == (20.0, 2)
+        assert spool.pending() == []
+        assert len(list((tmp_path / 'failed').iterdir())) == 1